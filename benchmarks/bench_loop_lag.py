@@ -0,0 +1,63 @@
+"""
+Event-loop lag while several jobs trim large pages, with trimming inline vs. offloaded.
+
+    python benchmarks/bench_loop_lag.py [--jobs 8] [--pages 5] [--chars 400000]
+
+Each job trims its pages one after another, the way process_serp_result does. A LoopLagMonitor
+ticks every 10ms next to them and reports how late it woke up. No network is used.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from ai.latency import LoopLagMonitor
+from ai.offload import CpuOffload
+from ai.text import trim_prompt
+from bench_trim_prompt import make_page
+
+async def run_jobs(offload: CpuOffload, pages, jobs: int, budget: int):
+    monitor = LoopLagMonitor(interval=0.01, window=100000)
+    monitor.start()
+
+    async def job(index: int):
+        for page in pages:
+            await offload.run(len(page), trim_prompt, page, budget)
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(job(i) for i in range(jobs)))
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    return elapsed, monitor.stats()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--chars", type=int, default=400000)
+    parser.add_argument("--budget", type=int, default=25000)
+    args = parser.parse_args()
+
+    pages = [make_page(args.chars, seed=i) for i in range(args.pages)]
+    setups = {
+        "inline": CpuOffload(inline_max_chars=sys.maxsize),
+        "threads": CpuOffload(process_min_chars=0),
+        "processes": CpuOffload(process_min_chars=1),
+    }
+    print(f"{args.jobs} jobs x {args.pages} pages of {args.chars} chars, budget {args.budget} tokens")
+    print(f"{'mode':>18} {'wall s':>7} {'lag p50 ms':>11} {'lag p99 ms':>11} {'lag max ms':>11}")
+    for name, offload in setups.items():
+        try:
+            # Warm the pools so worker start-up is not counted as lag
+            asyncio.run(run_jobs(offload, pages[:1], 1, args.budget))
+            elapsed, lag = asyncio.run(run_jobs(offload, pages, args.jobs, args.budget))
+        finally:
+            offload.shutdown()
+        print(f"{name:>18} {elapsed:>7.2f} {lag['p50_ms']:>11.1f} {lag['p99_ms']:>11.1f} {lag['max_ms']:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Bookkeeping cost per research node: copying learnings/URL lists down the tree (the old
+recursive deep_research) vs. one append-only ResearchStore with nodes holding IDs.
+
+    python benchmarks/bench_research_store.py [--breadth 2] [--max-depth 10] [--learnings 5] [--urls 5]
+
+Breadth stays constant with depth so the tree grows quickly. Every search node adds
+`--learnings` learnings and `--urls` URL items (some URLs repeat). Building each query prompt
+from the branch's learnings costs the same either way and is left out. No model or network is used.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from page_store import get_url
+from research_scheduler import ResearchScheduler
+from research_store import ResearchStore
+
+def node_outputs(count: int, learnings: int, urls: int) -> list:
+    """What each search node adds, made up front so only the bookkeeping is timed."""
+    return [node_output(n, learnings, urls) for n in range(1, count + 1)]
+
+def node_output(n: int, learnings: int, urls: int):
+    new_learnings = [f"Learning {n}.{i}: a fact about the topic with a figure of {n * i}%" for i in range(learnings)]
+    # Some URLs come back from several queries
+    new_urls = [
+        {"url": f"https://example.com/{n % 4 if i == 0 else n}/{i}", "title": f"Page {n}.{i}",
+         "metadata": {"sourceURL": f"https://example.com/{n}/{i}", "description": "x" * 200}}
+        for i in range(urls)
+    ]
+    return new_learnings, new_urls
+
+def copying(breadth: int, depth: int, outputs: list) -> None:
+    """The old scheme: each query copies the branch lists, every level re-dedups everything below."""
+    outputs = iter(outputs)
+
+    def research(depth, learnings, visited_urls):
+        results = []
+        for _ in range(breadth):
+            new_learnings, new_urls = next(outputs)
+            all_learnings = learnings + new_learnings
+            all_urls = visited_urls + new_urls
+            if depth > 1:
+                results.append(research(depth - 1, all_learnings, all_urls))
+            else:
+                results.append({"learnings": all_learnings, "visited_urls": all_urls})
+        final_learnings = list(dict.fromkeys(l for r in results for l in r["learnings"]))
+        seen_urls = set()
+        final_urls = []
+        for result in results:
+            for url_item in result["visited_urls"]:
+                url_string = get_url(url_item)
+                if url_string and url_string not in seen_urls:
+                    seen_urls.add(url_string)
+                    final_urls.append(url_item)
+        return {"learnings": final_learnings, "visited_urls": final_urls}
+
+    research(depth, [], [])
+
+def store_based(breadth: int, depth: int, outputs: list) -> None:
+    """The new scheme: nodes append to one store and keep IDs; results are gathered once."""
+    outputs = iter(outputs)
+    scheduler = ResearchScheduler()
+    store = ResearchStore()
+    root = scheduler.add_node("expand", "topic", depth, breadth)
+    frontier = [root]
+    while frontier:
+        expand = frontier.pop()
+        for _ in range(breadth):
+            node = scheduler.add_node("search", "query", expand.depth, breadth, parent=expand.id)
+            new_learnings, new_urls = next(outputs)
+            node.learning_ids = store.add_learnings(new_learnings, node.id)
+            node.url_ids = store.add_urls(new_urls, node.id)
+            if expand.depth > 1:
+                frontier.append(scheduler.add_node("expand", "follow-up", expand.depth - 1, breadth, parent=node.id))
+    nodes = list(scheduler.walk(root.id))
+    store.get_learnings(i for node in nodes for i in node.learning_ids)
+    store.get_urls(i for node in nodes for i in node.url_ids)
+
+def measure(fn, *args) -> float:
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--breadth", type=int, default=2)
+    parser.add_argument("--max-depth", type=int, default=10)
+    parser.add_argument("--learnings", type=int, default=5)
+    parser.add_argument("--urls", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"breadth {args.breadth}, {args.learnings} learnings and {args.urls} URLs per search node")
+    print(f"{'depth':>5} {'nodes':>7} {'copying ms':>11} {'us/node':>8} {'store ms':>9} {'us/node':>8}")
+    for depth in range(1, args.max_depth + 1):
+        nodes = sum(args.breadth ** level for level in range(1, depth + 1))
+        outputs = node_outputs(nodes, args.learnings, args.urls)
+        old = measure(copying, args.breadth, depth, outputs)
+        new = measure(store_based, args.breadth, depth, outputs)
+        print(f"{depth:>5} {nodes:>7} {old * 1000:>11.1f} {old / nodes * 1e6:>8.1f} {new * 1000:>9.1f} {new / nodes * 1e6:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Micro-benchmark: the single-pass trim_prompt against the previous recursive splitter version.
+
+    python benchmarks/bench_trim_prompt.py [--repeat 3] [--budget 25000]
+
+Pages are synthetic scraped-markdown documents of 100k-1M characters. No network is used.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+# The providers module insists on keys at import time; nothing here talks to an API
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault("FIRECRAWL_API_KEY", "benchmark")
+
+from ai.providers import tokenizer, trim_prompt
+
+WORDS = (
+    "the market grew percent revenue analysts reported quarter growth model data energy policy "
+    "battery supply chain regulation study results researchers found increase decline average "
+    "global production capacity investment demand forecast according report index prices"
+).split()
+
+def make_page(chars: int, seed: int = 0) -> str:
+    """Markdown resembling a scraped article: headings, paragraphs, lists, links and figures."""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < chars:
+        kind = rng.random()
+        if kind < 0.08:
+            block = "## " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))).title()
+        elif kind < 0.2:
+            block = "\n".join(
+                f"- {' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))} ({rng.randint(1, 99)}%)"
+                for _ in range(rng.randint(3, 7))
+            )
+        else:
+            sentences = []
+            for _ in range(rng.randint(3, 8)):
+                words = [rng.choice(WORDS) for _ in range(rng.randint(8, 25))]
+                if rng.random() < 0.3:
+                    words.append(f"[source](https://example.com/{rng.randint(1000, 9999)})")
+                if rng.random() < 0.3:
+                    words.append(f"${rng.randint(1, 900)}.{rng.randint(0, 9)}bn")
+                sentences.append(" ".join(words).capitalize() + ".")
+            block = " ".join(sentences)
+        parts.append(block)
+        size += len(block) + 2
+    return "\n\n".join(parts)[:chars]
+
+def legacy_trim_prompt(prompt: str, context_size: int, min_chunk_size: int = 140) -> str:
+    """The previous implementation: guess a character cut, split with langchain and recurse."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    if not prompt:
+        return ""
+    token_count = len(tokenizer.encode(prompt))
+    if token_count <= context_size:
+        return prompt
+    overflow_tokens = token_count - context_size
+    chunk_size = len(prompt) - (overflow_tokens * 3)
+    if chunk_size < min_chunk_size:
+        return prompt[:min_chunk_size]
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+    chunks = splitter.split_text(prompt)
+    if not chunks:
+        return ""
+    trimmed = chunks[0]
+    if len(trimmed) == len(prompt):
+        return legacy_trim_prompt(prompt[:chunk_size], context_size, min_chunk_size)
+    return legacy_trim_prompt(trimmed, context_size, min_chunk_size)
+
+def measure(fn, text: str, budget: int, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text, budget)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--budget", type=int, default=25000, help="token budget (25000 is the per-page limit)")
+    parser.add_argument("--sizes", default="100000,250000,500000,1000000", help="page sizes in characters")
+    args = parser.parse_args()
+
+    try:
+        import langchain.text_splitter  # noqa: F401
+        have_legacy = True
+    except ImportError:
+        have_legacy = False
+        print("langchain is not installed; only the new trimmer is timed")
+
+    print(f"{'chars':>9} {'tokens':>8} {'legacy ms':>10} {'new ms':>8} {'speedup':>8} {'kept tokens':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        page = make_page(size, seed=size)
+        tokens = len(tokenizer.encode(page))
+        new = measure(trim_prompt, page, args.budget, args.repeat)
+        kept = len(tokenizer.encode(trim_prompt(page, args.budget)))
+        if have_legacy:
+            legacy = measure(legacy_trim_prompt, page, args.budget, args.repeat)
+            print(f"{size:>9} {tokens:>8} {legacy * 1000:>10.1f} {new * 1000:>8.1f} {legacy / new:>7.1f}x {kept:>12}")
+        else:
+            print(f"{size:>9} {tokens:>8} {'-':>10} {new * 1000:>8.1f} {'-':>8} {kept:>12}")
+
+if __name__ == "__main__":
+    main()
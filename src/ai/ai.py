@@ -1,7 +1,11 @@
+import asyncio
 import json
 import re
 from typing import Any, Callable, Optional, Dict, Awaitable
 
+from ai.providers import llm_response_key, llm_cache_get, llm_cache_set
+from ai.structured import STRUCTURED_OUTPUT, STRUCTURED_REPAIR_ATTEMPTS, repair_prompt
+
 def _clean_json_string(text: str) -> str:
     # Remove leading/trailing code fences.
     text = re.sub(r'^```(?:json)?\s*', '', text)
@@ -16,6 +20,39 @@ def _clean_json_string(text: str) -> str:
     return text
 
 
+def _response_text(response: Any) -> str:
+    try:
+        return response.choices[0].message.content
+    except (AttributeError, IndexError) as e:
+        try:
+            return response["choices"][0]["message"]["content"]
+        except (AttributeError, IndexError, KeyError, TypeError) as err:
+            raise ValueError(f"Failed to extract text from model response: {err}\nResponse: {response}")
+
+def _parse_text(text_output: str, schema: Optional[Any]) -> Any:
+    """Parse a model answer as JSON (cleaning up fences and stray newlines if needed) and apply the schema."""
+    try:
+        parsed_object = json.loads(text_output)
+    except json.JSONDecodeError:
+        # Clean up common JSON formatting issues before parsing
+        cleaned = _clean_json_string(text_output)
+        try:
+            parsed_object = json.loads(cleaned)
+        except json.JSONDecodeError as e:
+            raise ValueError(
+                f"Failed to parse model response as JSON: {e}\nResponse text: {cleaned}"
+            )
+
+    # If a schema is provided, parse or transform (pydantic's ValidationError is a ValueError)
+    if schema:
+        if hasattr(schema, "model_validate"):
+            parsed_object = schema.model_validate(parsed_object)
+        elif hasattr(schema, "parse_obj"):
+            parsed_object = schema.parse_obj(parsed_object)
+        else:
+            parsed_object = schema(parsed_object)
+    return parsed_object
+
 async def generate_object(
     *,
     model: Callable[..., Awaitable[Any]],
@@ -26,35 +63,46 @@ async def generate_object(
 ) -> Dict[str, Any]:
     """
     Generates a structured object from a given prompt using the provided language model (async).
-    Mirroring the TS approach, we expect valid JSON.
+    get_model callables are asked for native structured output (JSON schema / tool use) built
+    from the pydantic schema. If the answer still does not parse, the model gets up to
+    STRUCTURED_REPAIR_ATTEMPTS short re-asks to fix it before a ValueError is raised.
+    Answers that parse are kept in the LLM response cache, keyed on model, params, schema and prompt.
     """
     final_prompt = f"{system}\n{prompt}" if system else prompt
-    response = await model(final_prompt, **kwargs)
+    call_kwargs = dict(kwargs)
+    if schema is not None and STRUCTURED_OUTPUT and getattr(model, "accepts_schema", False) is True:
+        call_kwargs["schema"] = schema
 
-    try:
-        text_output = response.choices[0].message.content
-    except (AttributeError, IndexError) as e:
-        try:
-            text_output = response["choices"][0]["message"]["content"]
-        except (AttributeError, IndexError) as err:
-            raise ValueError(f"Failed to extract text from model response: {err}\nResponse: {response}")
+    async def ask(user_prompt: str) -> Any:
+        if system and getattr(model, "accepts_system", False) is True:
+            # Keep the stable system prompt as its own leading message so providers can cache it
+            return await model(user_prompt, system=system, **call_kwargs)
+        return await model(f"{system}\n{user_prompt}" if system else user_prompt, **call_kwargs)
 
-    # Clean up common JSON formatting issues before parsing
-    text_output = _clean_json_string(text_output)
+    cache_key = llm_response_key(model, final_prompt, schema, kwargs)
+    cached = await asyncio.to_thread(llm_cache_get, cache_key) if cache_key else None
+    response = cached if cached is not None else await ask(prompt)
+    text_output = _response_text(response)
 
-    # No bullet or digit fallback; we rely on the model returning valid JSON.
-    try:
-        parsed_object = json.loads(text_output)
-    except json.JSONDecodeError as e:
-        raise ValueError(
-            f"Failed to parse model response as JSON: {e}\nResponse text: {text_output}"
-        )
+    attempt = 0
+    while True:
+        try:
+            parsed_object = _parse_text(text_output, schema)
+            break
+        except ValueError as e:
+            if attempt >= STRUCTURED_REPAIR_ATTEMPTS:
+                raise
+            attempt += 1
+            print(f"Model response did not parse ({e.__class__.__name__}), asking for a repair (attempt {attempt})")
+            response = await ask(repair_prompt(text_output, e, schema))
+            text_output = _response_text(response)
+            cached = None
 
-    # If a schema is provided, parse or transform
-    if schema:
-        if hasattr(schema, "parse_obj"):
-            parsed_object = schema.parse_obj(parsed_object)
-        else:
-            parsed_object = schema(parsed_object)
+    if cache_key and cached is None:
+        # Store only what the next caller needs to rebuild the answer
+        await asyncio.to_thread(llm_cache_set, cache_key, {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text_output}}],
+            "cached": True
+        })
 
     return {"object": parsed_object, "raw": response}
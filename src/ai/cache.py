@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import zstandard
+
+class DiskCache:
+    """
+    Persistent key/value cache backed by a SQLite file.
+    Values are JSON-encoded and zstd-compressed. Entries expire after `ttl` seconds and the
+    least recently used ones are evicted once the stored (compressed) size exceeds `max_bytes`.
+    SQLite's WAL mode lets several worker processes on one host share the same file.
+    """
+    def __init__(self, path: str, ttl: float = 86400, max_bytes: int = 512 * 1024 * 1024,
+                 compression_level: int = 3):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._compressor = zstandard.ZstdCompressor(level=compression_level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._conn: Optional[sqlite3.Connection] = None
+        # Running total of stored bytes, so writes do not re-sum the table; other processes
+        # sharing the file are caught up with whenever eviction looks due
+        self._bytes = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries(accessed_at)")
+            self._bytes = self._stored_bytes(conn)
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, size, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._bytes -= size
+                self.expired += 1
+                self.misses += 1
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            data = self._decompressor.decompress(value)
+        return json.loads(data)
+
+    def set(self, key: str, value: Any) -> None:
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        now = time.time()
+        with self._lock:
+            blob = self._compressor.compress(data)
+            conn = self._connect()
+            replaced = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now)
+            )
+            self._bytes += len(blob) - (replaced[0] if replaced else 0)
+            self.writes += 1
+            if self._bytes > self.max_bytes:
+                self._evict(conn, now)
+
+    @staticmethod
+    def _stored_bytes(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Over budget by the running total: drop expired entries, then the least recently used."""
+        if self.ttl:
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl,))
+        # Re-sum only now, which also picks up writes and deletes from other processes
+        total = self._stored_bytes(conn)
+        while total > self.max_bytes:
+            # Drop the least recently used entries in small batches until we are under budget
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY accessed_at LIMIT 32").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.evictions += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        self._bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM entries")
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expired": self.expired,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace so trivially different spellings share a cache entry."""
+    return " ".join(query.strip().strip('"').lower().split())
+
+def search_cache_key(payload: Dict[str, Any], namespace: str = "") -> str:
+    """
+    Cache key for a Firecrawl search payload. The request timeout does not affect the result;
+    `namespace` separates results from different Firecrawl instances.
+    """
+    key_fields = {
+        "query": normalize_query(payload.get("query", "")),
+        "limit": payload.get("limit"),
+        "lang": payload.get("lang"),
+        "country": payload.get("country"),
+        "tbs": payload.get("tbs"),
+        # None (SERP only) and {} (default scrape) are different requests
+        "scrapeOptions": payload.get("scrapeOptions"),
+    }
+    if namespace:
+        key_fields["namespace"] = namespace
+    encoded = json.dumps(key_fields, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def scrape_cache_key(url: str, namespace: str = "") -> str:
+    """Cache key for a single-page Firecrawl scrape."""
+    prefix = f"scrape:{namespace}:" if namespace else "scrape:"
+    return hashlib.sha256(f"{prefix}{url.strip()}".encode("utf-8")).hexdigest()
+
+def normalize_prompt(prompt: str) -> str:
+    """Ignore line-ending and trailing-whitespace differences that do not change what the model sees."""
+    lines = prompt.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+def llm_cache_key(provider: str, model: str, prompt: str, params: Dict[str, Any], schema: Any = None) -> str:
+    """Cache key for a structured model call: model, sampling params, output schema and prompt."""
+    if hasattr(schema, "model_json_schema"):
+        schema = schema.model_json_schema()
+    elif schema is not None:
+        schema = getattr(schema, "__name__", str(schema))
+    encoded = json.dumps(
+        {"provider": provider, "model": model, "params": params, "schema": schema, "prompt": normalize_prompt(prompt)},
+        sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
@@ -0,0 +1,167 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import zstandard
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", os.path.join(".cache", "cassette.jsonl.zst"))
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", 0))
+
+# ISO timestamps (e.g. "Today is ..." in the system prompt) change on every run
+TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?|(?<=Today is )\d{4}-\d{2}-\d{2}")
+# Request fields that do not change the answer; adaptive timeouts differ between runs
+IGNORED_FIELDS = {"timeout"}
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a request was never recorded."""
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return TIMESTAMP_RE.sub("<timestamp>", value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in IGNORED_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+def cassette_key(kind: str, request: Dict[str, Any]) -> str:
+    encoded = json.dumps({"kind": kind, "request": _normalize(request)}, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class Cassette:
+    """
+    Records external I/O (Firecrawl requests, model calls) to a zstd-compressed JSONL file and
+    serves it back, so a research run can be repeated deterministically without network access.
+
+    mode is "record", "replay" or "" (off). Entries are matched on a hash of the request with
+    timestamps and timeouts normalised; a request seen several times is replayed in recorded
+    order. With latency_scale > 0 replies are delayed by that fraction of the recorded time.
+    Choices a run makes from its own state, which can depend on the order concurrent steps
+    finished in, are pinned with decide() so replay sends the same requests.
+    """
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = CASSETTE_MODE,
+                 latency_scale: float = CASSETTE_LATENCY_SCALE):
+        if mode not in ("", "record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.entries: List[Dict[str, Any]] = []
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._replay: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._position: Dict[str, int] = defaultdict(int)
+        self._dirty = False
+        if mode == "replay":
+            self.load()
+
+    @property
+    def active(self) -> bool:
+        return self.mode != ""
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def load(self) -> None:
+        with open(self.path, "rb") as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f).read()
+        for line in data.decode("utf-8").splitlines():
+            if line.strip():
+                entry = json.loads(line)
+                self._replay[entry["key"]].append(entry)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            lines = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in self.entries)
+            self._dirty = False
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "wb") as f:
+            f.write(zstandard.ZstdCompressor(level=10).compress(lines.encode("utf-8")))
+
+    def record(self, kind: str, request: Dict[str, Any], response: Any, elapsed: float) -> None:
+        entry = {
+            "kind": kind,
+            "key": cassette_key(kind, request),
+            "request": request,
+            "response": response,
+            "elapsed": elapsed,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            self._dirty = True
+
+    def lookup(self, kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        key = cassette_key(kind, request)
+        with self._lock:
+            recorded = self._replay.get(key)
+            if not recorded:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded {kind} response for request {key[:12]}")
+            position = self._position[key]
+            # Once the recorded repeats are used up keep serving the last one
+            self._position[key] = position + 1
+            self.hits += 1
+            return recorded[min(position, len(recorded) - 1)]
+
+    def decide(self, name: str, request: Dict[str, Any], value: Any) -> Any:
+        """
+        Record the run's choice `value` for `request`; in replay return the recorded choice
+        instead (or `value` if none was recorded, e.g. an older cassette).
+        """
+        kind = f"decision:{name}"
+        if self.recording:
+            self.record(kind, request, value, 0.0)
+        elif self.replaying:
+            try:
+                return self.lookup(kind, request)["response"]
+            except CassetteMiss:
+                self.misses -= 1
+        return value
+
+    async def replay(self, kind: str, request: Dict[str, Any]) -> Any:
+        entry = self.lookup(kind, request)
+        if self.latency_scale > 0 and entry.get("elapsed"):
+            await asyncio.sleep(entry["elapsed"] * self.latency_scale)
+        return entry["response"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode or "off",
+            "path": self.path,
+            "recorded": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+_cassette: Optional[Cassette] = None
+
+def get_cassette() -> Cassette:
+    """The process-wide cassette configured by CASSETTE_MODE / CASSETTE_PATH."""
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette()
+        if _cassette.recording:
+            atexit.register(_cassette.save)
+    return _cassette
+
+def set_cassette(cassette: Optional[Cassette]) -> None:
+    """Swap the process-wide cassette, e.g. in tests."""
+    global _cassette
+    _cassette = cassette
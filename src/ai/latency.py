@@ -0,0 +1,71 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+class LatencyTracker:
+    """Rolling window of recent call latencies (milliseconds) with percentile lookups."""
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            self._samples.append(latency_ms)
+            self.count += 1
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(pct / 100 * (len(samples) - 1)))))
+        return samples[index]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+        }
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag: a background task sleeps for `interval` and records how late it
+    wakes up. Anything that blocks the loop (CPU-bound work in a coroutine) shows up as lag.
+    """
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self.lag = LatencyTracker(window=window)
+        self.max_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            self.lag.record(lag_ms)
+            self.max_ms = max(self.max_ms, lag_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.lag.stats(), "max_ms": self.max_ms, "interval_ms": self.interval * 1000}
@@ -0,0 +1,100 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from ai.latency import LatencyTracker
+from ai.text import CONTEXT_SIZE, trim_prompt
+
+T = TypeVar("T")
+
+# Inputs up to this many characters are cheap enough to handle on the event loop
+OFFLOAD_INLINE_MAX_CHARS: int = int(os.getenv("OFFLOAD_INLINE_MAX_CHARS", 20000))
+# Inputs from this size go to worker processes (0 keeps everything in threads)
+OFFLOAD_PROCESS_MIN_CHARS: int = int(os.getenv("OFFLOAD_PROCESS_MIN_CHARS", 1000000))
+OFFLOAD_THREADS: int = int(os.getenv("OFFLOAD_THREADS", 4))
+OFFLOAD_PROCESSES: int = int(os.getenv("OFFLOAD_PROCESSES", 2))
+
+class CpuOffload:
+    """
+    Runs CPU-heavy text work (tokenizing, trimming) off the event loop. Small inputs run inline,
+    larger ones in a thread pool (tiktoken releases the GIL while encoding) and the largest in a
+    process pool. Pools are created on first use. Process workers are spawned, so each one imports
+    the entry script's module-level code; keep that to imports.
+    """
+    def __init__(self, inline_max_chars: int = OFFLOAD_INLINE_MAX_CHARS,
+                 process_min_chars: int = OFFLOAD_PROCESS_MIN_CHARS,
+                 threads: int = OFFLOAD_THREADS, processes: int = OFFLOAD_PROCESSES):
+        self.inline_max_chars = inline_max_chars
+        self.process_min_chars = process_min_chars
+        self.threads = threads
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self.latency = {mode: LatencyTracker() for mode in ("inline", "thread", "process")}
+
+    def mode(self, size: int) -> str:
+        if size <= self.inline_max_chars or self.threads <= 0:
+            return "inline"
+        if self.process_min_chars > 0 and size >= self.process_min_chars and self.processes > 0:
+            return "process"
+        return "thread"
+
+    def _executor(self, mode: str) -> Executor:
+        with self._lock:
+            if mode == "process":
+                if self._process_pool is None:
+                    # Forking would copy the loop and its threads. Spawned workers re-import the parent's
+                    # __main__ (as __mp_main__) before ai.text, so entry points must keep startup behind
+                    # an `if __name__ == "__main__"` guard
+                    self._process_pool = ProcessPoolExecutor(
+                        max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                    )
+                return self._process_pool
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="offload")
+            return self._thread_pool
+
+    async def run(self, size: int, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run fn(*args, **kwargs) for an input of `size` characters where it least disturbs the loop."""
+        return await self._run(self.mode(size), fn, *args, **kwargs)
+
+    async def run_local(self, size: int, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Like run, but never in a worker process; for work on objects that are costly to pickle."""
+        mode = self.mode(size)
+        return await self._run("thread" if mode == "process" else mode, fn, *args, **kwargs)
+
+    async def _run(self, mode: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        started = time.perf_counter()
+        if mode == "inline":
+            result = fn(*args, **kwargs)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor(mode), functools.partial(fn, *args, **kwargs))
+        self.latency[mode].record((time.perf_counter() - started) * 1000)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for pool in (self._thread_pool, self._process_pool):
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = self._process_pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inline_max_chars": self.inline_max_chars,
+            "process_min_chars": self.process_min_chars,
+            **{mode: tracker.stats() for mode, tracker in self.latency.items()},
+        }
+
+cpu_offload = CpuOffload()
+
+async def trim_prompt_async(prompt: str, context_size: int = CONTEXT_SIZE, snap: bool = True) -> str:
+    """trim_prompt without blocking the event loop on large inputs."""
+    return await cpu_offload.run(len(prompt or ""), trim_prompt, prompt, context_size, snap)
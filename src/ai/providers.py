@@ -1,20 +1,34 @@
+import hashlib
+import json
 import os
 import sys
+import time
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
+import openai
 from openai import AsyncOpenAI
 from openai.types import ChatModel
 from openai.types.chat.chat_completion import ChatCompletion
-import tiktoken
 import requests
+import httpx
+import threading
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import anthropic
 from anthropic.types import Model
 import asyncio
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import Any, Dict, Optional, Callable, Awaitable, List, Literal
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Optional, Callable, Awaitable, List, Literal, TypeVar
+
+from ai.cache import DiskCache, search_cache_key, scrape_cache_key, llm_cache_key
+from ai.singleflight import SingleFlight
+from ai.rate_limit import AdaptiveConcurrency, ConcurrencyLimits, TokenBucket, backoff_delay
+from ai.latency import LatencyTracker
+from ai.cassette import get_cassette
+from ai.usage import record_usage
+from ai.structured import anthropic_tool, openai_response_format, schema_name
+from ai.text import tokenizer, trim_prompt  # noqa: F401 - re-exported for existing callers
 
 # Environment Variables
 OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
@@ -24,39 +38,111 @@ CONTEXT_SIZE: int = int(os.getenv("CONTEXT_SIZE", 128000))
 FIRECRAWL_API_KEY: str = os.getenv("FIRECRAWL_API_KEY", "")
 FIRECRAWL_BASE_URL: str = os.getenv("FIRECRAWL_BASE_URL", "https://api.firecrawl.dev/v1")
 ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
+FIRECRAWL_MAX_CONNECTIONS: int = int(os.getenv("FIRECRAWL_MAX_CONNECTIONS", 20))
+FIRECRAWL_MAX_KEEPALIVE: int = int(os.getenv("FIRECRAWL_MAX_KEEPALIVE", 10))
+FIRECRAWL_KEEPALIVE_EXPIRY: float = float(os.getenv("FIRECRAWL_KEEPALIVE_EXPIRY", 60))
+SEARCH_CACHE_ENABLED: bool = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEARCH_CACHE_PATH: str = os.getenv("SEARCH_CACHE_PATH", os.path.join(".cache", "search_cache.sqlite3"))
+SEARCH_CACHE_TTL: float = float(os.getenv("SEARCH_CACHE_TTL", 86400))
+SEARCH_CACHE_MAX_BYTES: int = int(os.getenv("SEARCH_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+FIRECRAWL_RPS: float = float(os.getenv("FIRECRAWL_RPS", 0))
+FIRECRAWL_BURST: Optional[int] = int(os.getenv("FIRECRAWL_BURST")) if os.getenv("FIRECRAWL_BURST") else None
+FIRECRAWL_RATE_LIMIT_FILE: str = os.getenv("FIRECRAWL_RATE_LIMIT_FILE", "")
+LLM_SINGLEFLIGHT: bool = os.getenv("LLM_SINGLEFLIGHT", "false").lower() in ("1", "true", "yes")
+LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+LLM_CACHE_TTL: float = float(os.getenv("LLM_CACHE_TTL", 86400))
+LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+LLM_ADAPTIVE_CONCURRENCY: bool = os.getenv("LLM_ADAPTIVE_CONCURRENCY", "true").lower() in ("1", "true", "yes")
+LLM_CONCURRENCY_INITIAL: int = int(os.getenv("LLM_CONCURRENCY_INITIAL", 4))
+LLM_CONCURRENCY_MAX: int = int(os.getenv("LLM_CONCURRENCY_MAX", 64))
+LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", 4))
+
+# Exit if necessary API keys are missing (replaying a cassette needs none)
+if not get_cassette().replaying:
+    if not OPENAI_API_KEY and not ANTHROPIC_API_KEY:
+        print("Warning: Must include OPENAI_API_KEY, ANTHROPIC_API_KEY, or both. Please ensure one or more is defined in your .env file.")
+        sys.exit(1)
+    if not FIRECRAWL_API_KEY:
+        print("Warning: FIRECRAWL_API_KEY is not set. Please ensure it is defined in your .env file.")
+        sys.exit(1)
 
-# Exit if necessary API keys are missing
-if not OPENAI_API_KEY and not ANTHROPIC_API_KEY:
-    print("Warning: Must include OPENAI_API_KEY, ANTHROPIC_API_KEY, or both. Please ensure one or more is defined in your .env file.")
-    sys.exit(1)
-if not FIRECRAWL_API_KEY:
-    print("Warning: FIRECRAWL_API_KEY is not set. Please ensure it is defined in your .env file.")
-    sys.exit(1)
+# System message used when a caller does not pass its own system prompt
+DEFAULT_SYSTEM_MESSAGE = "You are an expert research assistant."
 
 # Provider type
 ProviderType = Literal["openai", "anthropic"]
 
+# Context window (prompt plus output tokens) by model name prefix; the longest matching prefix wins
+MODEL_CONTEXT_SIZES: Dict[str, int] = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "chatgpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "o1": 200000,
+    "o1-mini": 128000,
+    "o1-preview": 128000,
+    "o3": 200000,
+    "o4-mini": 200000,
+    "claude": 200000,
+}
+
+def model_context_size(model: str) -> int:
+    """Context window of a model, never more than CONTEXT_SIZE (which also covers unknown models)."""
+    matches = [prefix for prefix in MODEL_CONTEXT_SIZES if model.startswith(prefix)]
+    if not matches:
+        return CONTEXT_SIZE
+    return min(MODEL_CONTEXT_SIZES[max(matches, key=len)], CONTEXT_SIZE)
+
+T = TypeVar("T")
+
+# Process-wide concurrency limit per provider model, adapted to the account's rate limits
+llm_concurrency = ConcurrencyLimits(initial=LLM_CONCURRENCY_INITIAL, max_limit=LLM_CONCURRENCY_MAX)
+# The limit of the call in progress, so the response hook can hand it the rate-limit headers
+_current_limit: ContextVar[Optional[AdaptiveConcurrency]] = ContextVar("current_llm_limit", default=None)
+
+async def _observe_rate_limit_headers(response: httpx.Response) -> None:
+    limit = _current_limit.get()
+    if limit is not None:
+        limit.observe_headers(response.headers)
+
+# With adaptive concurrency on, 429s reach the limiter instead of being retried inside the SDK
+_client_retries = 0 if LLM_ADAPTIVE_CONCURRENCY else openai.DEFAULT_MAX_RETRIES
+
 # Configure clients based on available API keys
 openai_client = None
 anthropic_client = None
 
 try:
     if OPENAI_API_KEY:
-        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_API_ENDPOINT)
+        openai_client = AsyncOpenAI(
+            api_key=OPENAI_API_KEY, base_url=OPENAI_API_ENDPOINT, max_retries=_client_retries,
+            http_client=openai.DefaultAsyncHttpxClient(event_hooks={"response": [_observe_rate_limit_headers]})
+        )
 except Exception as e:
     print(f"Error initializing OpenAI client: {str(e)}")
 
 try:
     if ANTHROPIC_API_KEY:
-        anthropic_client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
+        anthropic_client = anthropic.AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY, max_retries=_client_retries,
+            http_client=anthropic.DefaultAsyncHttpxClient(event_hooks={"response": [_observe_rate_limit_headers]})
+        )
 except Exception as e:
     print(f"Error initializing Anthropic client: {str(e)}")
 
 class ModelInfo:
-    def __init__(self, model=None, model_params=None):
+    def __init__(self, model=None, model_params=None, use_cache=True, context_size=None):
         self.model = model or OPENAI_MODEL
+        # False bypasses the LLM response cache for every call made with this model
+        self.use_cache = use_cache
         if self.model == 'o3-mini':
             self.model = 'o3-mini-2025-01-31'
+        # Tokens a single call may use (prompt plus output); prompts are planned to fit in it
+        self.context_size = context_size or model_context_size(self.model)
         
         self.model_params = model_params or {}
         if "temperature" not in self.model_params:
@@ -127,46 +213,32 @@ class ModelInfo:
         error_details = "\n - " + "\n - ".join(errors)
         raise Exception(f"Model '{self.model}' not found in any configured provider. Please check the model name and ensure the corresponding API key is set. Details: {error_details}")
 
-MIN_CHUNK_SIZE: int = 140
-tokenizer = tiktoken.get_encoding("o200k_base")
 
 # Add the custom retry class below the imports
-class ConstantBackoffRetry(Retry):
+class JitteredBackoffRetry(Retry):
     """
-    Custom Retry class that always returns a constant 1s backoff time for retries.
+    Custom Retry class with jittered exponential backoff, so concurrent searches that fail
+    together do not all retry in lockstep. Retry-After headers are still honoured by urllib3.
     """
     def get_backoff_time(self) -> float:
-        # If there is any retry history, return a constant 5 second delay.
-        return 10.0 if self.history else 3.0
-
-def trim_prompt(prompt: str, context_size: int = CONTEXT_SIZE) -> str:
-    """Trim the prompt recursively to ensure the token count fits within context_size."""
-    if not prompt:
-        return ""
-    token_count = len(tokenizer.encode(prompt))
-    if token_count <= context_size:
-        return prompt
-    overflow_tokens = token_count - context_size
-    chunk_size = len(prompt) - (overflow_tokens * 3)
-    if chunk_size < MIN_CHUNK_SIZE:
-        return prompt[:MIN_CHUNK_SIZE]
-
-    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
-    chunks = splitter.split_text(prompt)
-    if not chunks:
-        return ""
-    trimmed = chunks[0]
-    # If the chunk is still the same size as the whole prompt, do a direct cut
-    if len(trimmed) == len(prompt):
-        return trim_prompt(prompt[:chunk_size], context_size)
-    return trim_prompt(trimmed, context_size)
+        return backoff_delay(max(0, len(self.history) - 1))
+
+# Kept for backwards compatibility
+ConstantBackoffRetry = JitteredBackoffRetry
+
+# Process-wide Firecrawl rate limiter; optionally shared across workers through a lock file
+firecrawl_rate_limiter = TokenBucket(
+    rate=FIRECRAWL_RPS,
+    burst=FIRECRAWL_BURST,
+    state_path=FIRECRAWL_RATE_LIMIT_FILE or None
+)
 
 def _get_retry_session(total: int = 3, backoff_factor: float = 1, status_forcelist: Optional[list] = None) -> requests.Session:
     if status_forcelist is None:
         status_forcelist = [429, 500, 502, 503, 504]
     session = requests.Session()
-    # Use the custom ConstantBackoffRetry which enforces a 1s sleep before retrying
-    retries = ConstantBackoffRetry(
+    # Use the custom JitteredBackoffRetry so parallel callers spread their retries out
+    retries = JitteredBackoffRetry(
         total=total,
         backoff_factor=backoff_factor,  # Note: This value is not used as get_backoff_time is overridden.
         status_forcelist=status_forcelist,
@@ -177,47 +249,146 @@ def _get_retry_session(total: int = 3, backoff_factor: float = 1, status_forceli
     session.mount("https://", adapter)
     return session
 
-def firecrawl_search(query: str, timeout: int = 15000, limit: int = 5,
-                     scrape_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """
-    Search via Firecrawl using default scrape options (markdown) by making a direct requests call.
-    Implements retry logic for handling rate limits and transient errors.
-    """
-    if not FIRECRAWL_API_KEY:
-        raise Exception("FIRECRAWL_API_KEY not configured. Please set in .env file.")
+_retry_session: Optional[requests.Session] = None
+_retry_session_lock = threading.Lock()
 
-    if scrape_options is None:
-        scrape_options = {}
+def _get_shared_retry_session() -> requests.Session:
+    """Return the process-wide retry session so sync callers reuse pooled connections."""
+    global _retry_session
+    if _retry_session is None:
+        with _retry_session_lock:
+            if _retry_session is None:
+                _retry_session = _get_retry_session()
+    return _retry_session
 
+def _clean_search_query(query: str) -> str:
     clean_query = query.strip().strip('"')
     if not clean_query:
         raise Exception("Empty query after cleaning")
+    return clean_query
 
-    print(f"Making Firecrawl request to: {FIRECRAWL_BASE_URL}/search")
-    print(f"Query: {clean_query}")
-
-    url = f"{FIRECRAWL_BASE_URL}/search"
+def _build_search_payload(query: str, timeout: int, limit: int,
+                          scrape_options: Optional[Dict[str, Any]], scrape: bool = True) -> Dict[str, Any]:
     payload = {
-        "query": clean_query,
+        "query": query,
         "limit": limit,
         "timeout": timeout,
         "tbs": "",
         "lang": "en",
         "country": "us",
         "location": "",
-        "scrapeOptions": scrape_options
-    }
-    headers = {
-        "Authorization": f"Bearer {FIRECRAWL_API_KEY}",
-        "Content-Type": "application/json"
+        "scrapeOptions": scrape_options if scrape_options is not None else {}
     }
+    if not scrape:
+        # SERP only: urls, titles and snippets without scraping each hit
+        del payload["scrapeOptions"]
+    return payload
+
+def _firecrawl_headers(api_key: Optional[str] = None) -> Dict[str, str]:
+    api_key = FIRECRAWL_API_KEY if api_key is None else api_key
+    headers = {"Content-Type": "application/json"}
+    # Self-hosted instances are often run without authentication
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+# Shared on-disk SERP cache; see ai.cache.DiskCache
+search_cache: Optional[DiskCache] = DiskCache(
+    SEARCH_CACHE_PATH, ttl=SEARCH_CACHE_TTL, max_bytes=SEARCH_CACHE_MAX_BYTES
+) if SEARCH_CACHE_ENABLED else None
+
+def _search_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    # A cassette has to see every request, so it bypasses the cache
+    if search_cache is None or get_cassette().active:
+        return None
+    try:
+        return search_cache.get(key)
+    except Exception as e:
+        print(f"Search cache read error: {str(e)}")
+        return None
+
+def _search_cache_set(key: str, result: Dict[str, Any]) -> None:
+    # Only cache useful answers; empty result sets are usually transient failures
+    if search_cache is None or not result.get("data") or get_cassette().active:
+        return
+    try:
+        search_cache.set(key, result)
+    except Exception as e:
+        print(f"Search cache write error: {str(e)}")
+
+# Shared on-disk cache of parsed structured model answers, filled by ai.ai.generate_object
+llm_cache: Optional[DiskCache] = DiskCache(
+    LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES
+) if LLM_CACHE_ENABLED else None
+
+def llm_response_key(model: Callable[..., Any], prompt: str, schema: Any, kwargs: Dict[str, Any]) -> Optional[str]:
+    """
+    Cache key for a call through a get_model() callable, or None when the call must not be
+    cached (cache disabled, bypassed for this model, a cassette is active, or not a get_model callable).
+    """
+    model_info = getattr(model, "model_info", None)
+    if llm_cache is None or model_info is None or not model_info.use_cache or get_cassette().active:
+        return None
+    params = {**getattr(model, "params", {}), **kwargs}
+    return llm_cache_key(model_info.provider, model_info.model, prompt, params, schema)
 
-    session = _get_retry_session()
+def llm_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    if llm_cache is None:
+        return None
     try:
-        response = session.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        result = response.json()
+        return llm_cache.get(key)
+    except Exception as e:
+        print(f"LLM cache read error: {str(e)}")
+        return None
+
+def llm_cache_set(key: str, response: Dict[str, Any]) -> None:
+    if llm_cache is None:
+        return
+    try:
+        llm_cache.set(key, response)
+    except Exception as e:
+        print(f"LLM cache write error: {str(e)}")
+
+def firecrawl_search(query: str, timeout: int = 15000, limit: int = 5,
+                     scrape_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Search via Firecrawl using default scrape options (markdown) by making a direct requests call.
+    Implements retry logic for handling rate limits and transient errors.
+    """
+    if not FIRECRAWL_API_KEY:
+        raise Exception("FIRECRAWL_API_KEY not configured. Please set in .env file.")
+
+    clean_query = _clean_search_query(query)
+
+    print(f"Making Firecrawl request to: {FIRECRAWL_BASE_URL}/search")
+    print(f"Query: {clean_query}")
+
+    url = f"{FIRECRAWL_BASE_URL}/search"
+    payload = _build_search_payload(clean_query, timeout, limit, scrape_options)
+
+    cache_key = search_cache_key(payload)
+    cached = _search_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    cassette = get_cassette()
+    cassette_request = {"base_url": FIRECRAWL_BASE_URL, "path": "/search", "payload": payload}
+    session = _get_shared_retry_session()
+    try:
+        if cassette.replaying:
+            result = cassette.lookup("firecrawl", cassette_request)["response"]["body"]
+        else:
+            firecrawl_rate_limiter.acquire_sync()
+            started = time.monotonic()
+            response = session.post(url, json=payload, headers=_firecrawl_headers())
+            firecrawl_rate_limiter.observe(response.status_code, response.headers)
+            response.raise_for_status()
+            result = response.json()
+            if cassette.recording:
+                cassette.record("firecrawl", cassette_request,
+                                {"status": response.status_code, "body": result}, time.monotonic() - started)
         if result.get("success"):
+            _search_cache_set(cache_key, result)
             return result
         else:
             print(f"Unexpected response format: {result}")
@@ -227,15 +398,259 @@ def firecrawl_search(query: str, timeout: int = 15000, limit: int = 5,
         print(f"Error type: {type(e)}")
         return {"data": []}
 
-def get_model(model_info: Optional[ModelInfo] = None) -> Callable[..., Awaitable[Dict[str, Any]]]:
+# Latency of real (uncached) Firecrawl search attempts, used to size search timeouts
+firecrawl_latency = LatencyTracker()
+
+class AsyncFirecrawlClient:
     """
-    Returns an async callable that calls the appropriate model API based on the provider.
-    - For OpenAI models, uses the chat.completions.create endpoint with appropriate parameters
-    - For Anthropic models, uses the messages.create endpoint with appropriate parameters
-    
-    Each provider's specific parameters are handled appropriately.
+    Asyncio-native Firecrawl client. A single httpx.AsyncClient (and therefore a single
+    keep-alive connection pool) is shared by every search issued from the running event loop.
     """
-    model_info = model_info or ModelInfo()
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 max_connections: int = FIRECRAWL_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = FIRECRAWL_MAX_KEEPALIVE,
+                 keepalive_expiry: float = FIRECRAWL_KEEPALIVE_EXPIRY,
+                 total_retries: int = 3, status_forcelist: Optional[List[int]] = None,
+                 rate_limiter: Optional[TokenBucket] = None, latency: Optional[LatencyTracker] = None):
+        self.base_url = base_url or FIRECRAWL_BASE_URL
+        # None means "use FIRECRAWL_API_KEY"; pass "" for an unauthenticated self-hosted instance
+        self.api_key = api_key
+        self.rate_limiter = rate_limiter or firecrawl_rate_limiter
+        # Search latency of this instance; the hosted API's feeds the default search timeouts
+        self.latency = latency if latency is not None else firecrawl_latency
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.total_retries = total_retries
+        self.status_forcelist = status_forcelist or [429, 500, 502, 503, 504]
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def check_api_key(self) -> None:
+        if self.api_key is None and not FIRECRAWL_API_KEY and not get_cassette().replaying:
+            raise Exception("FIRECRAWL_API_KEY not configured. Please set in .env file.")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # httpx connections are bound to the loop that opened them, so rebuild the pool
+        # if we are called from a different loop (e.g. successive asyncio.run calls).
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=_firecrawl_headers(self.api_key),
+                limits=self.limits,
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+            self._loop = loop
+        return self._client
+
+    async def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                   latency: Optional[LatencyTracker] = None) -> httpx.Response:
+        """
+        POST to Firecrawl through the shared rate limiter, retrying transient errors with
+        jittered backoff that respects Retry-After. Goes through the cassette when one is active.
+        With `latency`, each HTTP attempt is timed on its own, without rate-limit waits or backoff.
+        """
+        cassette = get_cassette()
+        cassette_request = {"base_url": self.base_url, "path": path, "payload": payload}
+        if cassette.replaying:
+            recorded = await cassette.replay("firecrawl", cassette_request)
+            return httpx.Response(recorded["status"], json=recorded["body"],
+                                  request=httpx.Request("POST", f"{self.base_url}{path}"))
+
+        started = time.monotonic()
+        response = await self._post(path, payload, timeout, latency)
+        if cassette.recording:
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            cassette.record("firecrawl", cassette_request,
+                            {"status": response.status_code, "body": body}, time.monotonic() - started)
+        return response
+
+    async def _post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None,
+                    latency: Optional[LatencyTracker] = None) -> httpx.Response:
+        client = self._get_client()
+        request_timeout = httpx.Timeout(timeout, connect=10.0) if timeout else httpx.USE_CLIENT_DEFAULT
+        attempt = 0
+        while True:
+            retry_after = None
+            await self.rate_limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = await client.post(path, json=payload, timeout=request_timeout)
+                if latency is not None:
+                    latency.record((time.monotonic() - started) * 1000)
+                retry_after = await self.rate_limiter.observe_async(response.status_code, response.headers)
+                if response.status_code not in self.status_forcelist or attempt >= self.total_retries:
+                    return response
+            except httpx.TransportError as e:
+                if latency is not None:
+                    # A timed-out attempt took at least the whole timeout, however early it was noticed
+                    elapsed = time.monotonic() - started
+                    if isinstance(e, httpx.TimeoutException) and timeout:
+                        elapsed = max(elapsed, timeout)
+                    latency.record(elapsed * 1000)
+                if attempt >= self.total_retries:
+                    raise
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    async def search(self, query: str, timeout: int = 15000, limit: int = 5,
+                     scrape_options: Optional[Dict[str, Any]] = None, scrape: bool = True) -> Dict[str, Any]:
+        self.check_api_key()
+
+        clean_query = _clean_search_query(query)
+
+        print(f"Making Firecrawl request to: {self.base_url}/search")
+        print(f"Query: {clean_query}")
+
+        payload = _build_search_payload(clean_query, timeout, limit, scrape_options, scrape)
+        try:
+            # Give the HTTP read a margin over Firecrawl's own server-side timeout.
+            response = await self.post("/search", payload, timeout=timeout / 1000 + 30, latency=self.latency)
+            response.raise_for_status()
+            result = response.json()
+            if result.get("success"):
+                return result
+            else:
+                print(f"Unexpected response format: {result}")
+                return {"data": []}
+        except Exception as e:
+            print(f"Firecrawl error details: {str(e)}")
+            print(f"Error type: {type(e)}")
+            return {"data": []}
+
+    async def scrape(self, url: str, timeout: int = 15000,
+                     formats: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Scrape a single URL. Returns the Firecrawl document ({"markdown", "metadata"}) or {} on failure."""
+        self.check_api_key()
+
+        payload = {"url": url, "formats": formats or ["markdown"], "timeout": timeout}
+        try:
+            response = await self.post("/scrape", payload, timeout=timeout / 1000 + 30)
+            response.raise_for_status()
+            result = response.json()
+            if result.get("success"):
+                return result.get("data") or {}
+            print(f"Unexpected scrape response for {url}: {result}")
+            return {}
+        except Exception as e:
+            print(f"Firecrawl scrape error for {url}: {str(e)}")
+            return {}
+
+    async def aclose(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+# One pooled client per process
+firecrawl_client = AsyncFirecrawlClient()
+
+# Concurrent identical searches / model calls share one in-flight request
+search_flights = SingleFlight()
+llm_flights = SingleFlight()
+
+async def async_firecrawl_search(query: str, timeout: int = 15000, limit: int = 5,
+                                 scrape_options: Optional[Dict[str, Any]] = None,
+                                 scrape: bool = True,
+                                 client: Optional[AsyncFirecrawlClient] = None) -> Dict[str, Any]:
+    """
+    Awaitable counterpart of firecrawl_search that reuses the process-wide connection pool
+    instead of opening a new session (and TLS handshake) per call. Successful results are
+    served from and written to the shared search cache, and identical searches that are
+    already in flight are joined rather than re-sent. With scrape=False only the SERP
+    (urls, titles, descriptions) is requested. Pass `client` to target another Firecrawl
+    instance (e.g. a self-hosted one); its results are cached separately.
+    """
+    client = client or firecrawl_client
+    client.check_api_key()
+
+    payload = _build_search_payload(_clean_search_query(query), timeout, limit, scrape_options, scrape)
+    cache_key = search_cache_key(payload, namespace=_client_namespace(client))
+
+    async def fetch() -> Dict[str, Any]:
+        cached = await asyncio.to_thread(_search_cache_get, cache_key)
+        if cached is not None:
+            return cached
+
+        result = await client.search(
+            query, timeout=timeout, limit=limit, scrape_options=scrape_options, scrape=scrape
+        )
+        if result.get("success"):
+            await asyncio.to_thread(_search_cache_set, cache_key, result)
+        return result
+
+    return await search_flights.do(cache_key, fetch)
+
+async def async_firecrawl_scrape(url: str, timeout: int = 15000,
+                                 client: Optional[AsyncFirecrawlClient] = None) -> Dict[str, Any]:
+    """Scrape one URL to markdown through the shared client, cache and in-flight coalescing."""
+    client = client or firecrawl_client
+    cache_key = scrape_cache_key(url, namespace=_client_namespace(client))
+
+    async def fetch() -> Dict[str, Any]:
+        cached = await asyncio.to_thread(_search_cache_get, cache_key)
+        if cached is not None:
+            return cached
+
+        document = await client.scrape(url, timeout=timeout)
+        if document.get("markdown"):
+            await asyncio.to_thread(_search_cache_set, cache_key, {"data": document})
+            return {"data": document}
+        return {"data": {}}
+
+    result = await search_flights.do(cache_key, fetch)
+    return result["data"]
+
+def _client_namespace(client: AsyncFirecrawlClient) -> str:
+    # The default instance keeps un-namespaced keys so existing cache entries stay valid
+    return "" if client is firecrawl_client else client.base_url
+
+async def close_firecrawl_client() -> None:
+    await firecrawl_client.aclose()
+
+def _llm_call_key(model_info: ModelInfo, prompt: str, params: Dict[str, Any]) -> str:
+    encoded = json.dumps(
+        {"provider": model_info.provider, "model": model_info.model, "prompt": prompt, "params": params},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+# OpenAI models that rejected a JSON schema response_format
+_no_structured_output: set = set()
+
+def _anthropic_content(response: Any) -> str:
+    """Text of an Anthropic message; a forced tool call's input is returned as JSON."""
+    text = None
+    for block in response.content:
+        if getattr(block, "type", None) == "tool_use":
+            return json.dumps(block.input, ensure_ascii=False)
+        if text is None and getattr(block, "text", None) is not None:
+            text = block.text
+    return text or ""
+
+def _completion_to_dict(response: Any) -> Dict[str, Any]:
+    """JSON-safe copy of a chat completion for the cassette."""
+    if isinstance(response, dict):
+        data = response
+    else:
+        data = response.model_dump(mode="json", warnings=False)
+    data = {k: v for k, v in data.items() if not k.startswith("_")}
+    return json.loads(json.dumps(data, default=str))
+
+def _completion_from_dict(data: Dict[str, Any]) -> Any:
+    try:
+        return ChatCompletion.model_validate(data)
+    except Exception:
+        return data
+
+def _default_params(model_info: ModelInfo) -> Dict[str, Any]:
+    """Request parameters for a model: its model_params plus provider-specific defaults."""
     extra_params: Dict[str, Any] = model_info.model_params.copy()
     
     # Set provider-specific parameters
@@ -256,22 +671,138 @@ def get_model(model_info: Optional[ModelInfo] = None) -> Callable[..., Awaitable
                     extra_params["thinking"]["type"] = "enabled"
                 if "budget_tokens" not in extra_params["thinking"]:
                     extra_params["thinking"]["budget_tokens"] = 8192
+    return extra_params
 
-    async def call_model(prompt: str, **kwargs: Any) -> Dict[str, Any]:
-        params = {**extra_params, **kwargs}
-        
+def _anthropic_usage(usage: Any) -> Dict[str, Any]:
+    """Anthropic usage in the OpenAI shape; Anthropic's input_tokens excludes cached tokens, OpenAI's prompt_tokens includes them."""
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    prompt_tokens = usage.input_tokens + cache_read + cache_write
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": usage.output_tokens,
+        "total_tokens": prompt_tokens + usage.output_tokens,
+        "prompt_tokens_details": {"cached_tokens": cache_read},
+        "cache_creation_input_tokens": cache_write
+    }
+
+# 429 rate limited, 503 unavailable, 529 overloaded (Anthropic)
+_OVERLOAD_STATUSES = (429, 503, 529)
+
+def _api_error(error: Optional[BaseException]) -> Optional[BaseException]:
+    """The SDK error behind a model call failure, which get_model wraps in a plain Exception."""
+    while error is not None and not isinstance(error, (openai.APIError, anthropic.APIError)):
+        error = error.__cause__
+    return error
+
+def _retry_delay(limit: AdaptiveConcurrency, error: BaseException, attempt: int) -> Optional[float]:
+    """
+    Feed a failed call into its concurrency limit and return how long to wait before retrying
+    it, or None when it should not be retried (a client error, or out of attempts).
+    """
+    error = _api_error(error)
+    status = getattr(error, "status_code", None)
+    retry_after = None
+    if status in _OVERLOAD_STATUSES:
+        response = getattr(error, "response", None)
+        retry_after = limit.on_overload(getattr(response, "headers", None))
+    elif error is None or (status is not None and status < 500):
+        return None
+    if attempt >= LLM_MAX_RETRIES:
+        return None
+    return backoff_delay(attempt, retry_after, base=1.0)
+
+def _llm_limit(model_info: ModelInfo) -> AdaptiveConcurrency:
+    return llm_concurrency.get(f"{model_info.provider}:{model_info.model}")
+
+async def _limited_call(model_info: ModelInfo, call: Callable[[], Awaitable[T]]) -> T:
+    """Run one model request within its adaptive concurrency limit, retrying overloads and transient errors."""
+    if not LLM_ADAPTIVE_CONCURRENCY:
+        return await call()
+    limit = _llm_limit(model_info)
+    attempt = 0
+    while True:
+        async with limit.slot():
+            token = _current_limit.set(limit)
+            try:
+                result = await call()
+            except Exception as e:
+                delay = _retry_delay(limit, e, attempt)
+                if delay is None:
+                    raise
+            else:
+                limit.on_success()
+                return result
+            finally:
+                _current_limit.reset(token)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def _limited_stream(model_info: ModelInfo, open_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+    """Like _limited_call for a stream; the slot is held until the stream ends, and only a stream that failed before its first chunk is retried."""
+    if not LLM_ADAPTIVE_CONCURRENCY:
+        async for chunk in open_stream():
+            yield chunk
+        return
+    limit = _llm_limit(model_info)
+    attempt = 0
+    while True:
+        async with limit.slot():
+            started = False
+            try:
+                async for chunk in open_stream():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                delay = None if started else _retry_delay(limit, e, attempt)
+                if delay is None:
+                    raise
+            else:
+                limit.on_success()
+                return
+        await asyncio.sleep(delay)
+        attempt += 1
+
+def get_model(model_info: Optional[ModelInfo] = None) -> Callable[..., Awaitable[Dict[str, Any]]]:
+    """
+    Returns an async callable that calls the appropriate model API based on the provider.
+    - For OpenAI models, uses the chat.completions.create endpoint with appropriate parameters
+    - For Anthropic models, uses the messages.create endpoint with appropriate parameters
+    
+    Each provider's specific parameters are handled appropriately.
+    """
+    model_info = model_info or ModelInfo()
+    extra_params = _default_params(model_info)
+
+    async def _call_model(prompt: str, params: Dict[str, Any], system: str, schema: Any = None) -> Dict[str, Any]:
         try:
             if model_info.provider == "openai":
                 # Handle OpenAI-specific parameters
                 if not openai_client:
                     raise Exception("OpenAI client not properly configured")
-                    
+
+                # The system message leads so OpenAI's automatic prefix caching can reuse it
+                messages = [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt},
+                ]
+                if schema is not None and model_info.model not in _no_structured_output:
+                    try:
+                        return await openai_client.chat.completions.create(
+                            model=model_info.model,
+                            messages=messages,
+                            response_format=openai_response_format(schema),
+                            **params
+                        )
+                    except openai.BadRequestError as e:
+                        if "response_format" not in str(e) and "json_schema" not in str(e):
+                            raise
+                        # Older models reject JSON schema output; remember and fall back to plain text
+                        print(f"Model {model_info.model} does not support structured output, falling back to text")
+                        _no_structured_output.add(model_info.model)
                 response = await openai_client.chat.completions.create(
                     model=model_info.model,
-                    messages=[
-                        {"role": "system", "content": "You are an expert research assistant."},
-                        {"role": "user", "content": prompt},
-                    ],
+                    messages=messages,
                     **params
                 )
                 return response
@@ -288,14 +819,22 @@ def get_model(model_info: Optional[ModelInfo] = None) -> Callable[..., Awaitable
                     if param in anthropic_params:
                         del anthropic_params[param]
                 
-                if 'reportMarkdown' in prompt:
+                # Forced tool use is not allowed together with extended thinking
+                use_tool = schema is not None and not anthropic_params.get("thinking")
+                if use_tool:
+                    tool = anthropic_tool(schema)
+                    anthropic_params["tools"] = [tool]
+                    anthropic_params["tool_choice"] = {"type": "tool", "name": tool["name"]}
+                elif 'reportMarkdown' in prompt:
                     prompt += "\n\nRemember that all newlines should be escaped with \\n in the JSON response."
                 anthropic_response = await anthropic_client.messages.create(
                     model=model_info.model,
-                    system="You are an expert research assistant.",
+                    # Mark the shared system prompt as a cacheable prefix
+                    system=[{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}],
                     messages=[{"role": "user", "content": prompt}],
                     **anthropic_params
                 )
+                content = _anthropic_content(anthropic_response)
                 
                 # Convert Anthropic response to match OpenAI structure for consistent interface
                 response = {
@@ -305,15 +844,11 @@ def get_model(model_info: Optional[ModelInfo] = None) -> Callable[..., Awaitable
                         "index": 0,
                         "message": {
                             "role": "assistant",
-                            "content": anthropic_response.content[0].text,
+                            "content": content,
                         },
                         "finish_reason": anthropic_response.stop_reason
                     }],
-                    "usage": {
-                        "prompt_tokens": anthropic_response.usage.input_tokens,
-                        "completion_tokens": anthropic_response.usage.output_tokens,
-                        "total_tokens": anthropic_response.usage.input_tokens + anthropic_response.usage.output_tokens
-                    },
+                    "usage": _anthropic_usage(anthropic_response.usage),
                     "_original_response": anthropic_response
                 }
                 try:
@@ -332,4 +867,112 @@ def get_model(model_info: Optional[ModelInfo] = None) -> Callable[..., Awaitable
             # Re-raise the exception with more context
             raise Exception(error_message) from e
 
+    async def _recorded_call(prompt: str, params: Dict[str, Any], system: str, schema: Any = None) -> Dict[str, Any]:
+        cassette = get_cassette()
+        started = time.monotonic()
+        if not cassette.active:
+            response = await _limited_call(model_info, lambda: _call_model(prompt, params, system, schema))
+        else:
+            request = {"provider": model_info.provider, "model": model_info.model, "system": system,
+                       "prompt": prompt, "params": params, "schema": schema_name(schema) if schema else None}
+            if cassette.replaying:
+                response = _completion_from_dict(await cassette.replay("llm", request))
+            else:
+                response = await _limited_call(model_info, lambda: _call_model(prompt, params, system, schema))
+                cassette.record("llm", request, _completion_to_dict(response), time.monotonic() - started)
+        record_usage(model_info.model, response, time.monotonic() - started)
+        return response
+
+    async def call_model(prompt: str, system: Optional[str] = None, schema: Any = None, **kwargs: Any) -> Dict[str, Any]:
+        system = system or DEFAULT_SYSTEM_MESSAGE
+        params = {**extra_params, **kwargs}
+        if LLM_SINGLEFLIGHT:
+            key = _llm_call_key(model_info, system + "\n" + prompt, {**params, "schema": schema_name(schema) if schema else None})
+            return await llm_flights.do(key, lambda: _recorded_call(prompt, params, system, schema))
+        return await _recorded_call(prompt, params, system, schema)
+
+    # Exposed so generate_object can key its response cache on the model and its params
+    call_model.model_info = model_info
+    call_model.params = extra_params
+    # Takes the system prompt as its own message instead of inline in the prompt,
+    # and a pydantic schema for native structured output
+    call_model.accepts_system = True
+    call_model.accepts_schema = True
     return call_model
+
+def get_stream_model(model_info: Optional[ModelInfo] = None) -> Callable[..., AsyncIterator[str]]:
+    """
+    Like get_model, but the returned callable streams the answer as plain text chunks
+    (an async iterator) as the provider produces them. Usage is recorded once the stream ends.
+    """
+    model_info = model_info or ModelInfo()
+    extra_params = _default_params(model_info)
+
+    async def _stream_model(prompt: str, params: Dict[str, Any], system: str, usage: Dict[str, Any]) -> AsyncIterator[str]:
+        messages = [{"role": "user", "content": prompt}]
+        if model_info.provider == "openai":
+            if not openai_client:
+                raise Exception("OpenAI client not properly configured")
+            stream = await openai_client.chat.completions.create(
+                model=model_info.model,
+                messages=[{"role": "system", "content": system}] + messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params
+            )
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage["usage"] = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        elif model_info.provider == "anthropic":
+            if not anthropic_client:
+                raise Exception("Anthropic client not properly configured")
+            anthropic_params = {k: v for k, v in params.items() if k != "reasoning_effort"}
+            async with anthropic_client.messages.stream(
+                model=model_info.model,
+                system=[{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}],
+                messages=messages,
+                **anthropic_params
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                final = await stream.get_final_message()
+                usage["usage"] = _anthropic_usage(final.usage)
+        else:
+            raise Exception(f"Unknown model provider: {model_info.provider}")
+
+    async def stream_model(prompt: str, system: Optional[str] = None, **kwargs: Any) -> AsyncIterator[str]:
+        system = system or DEFAULT_SYSTEM_MESSAGE
+        params = {**extra_params, **kwargs}
+        cassette = get_cassette()
+        request = {"provider": model_info.provider, "model": model_info.model, "system": system,
+                   "prompt": prompt, "params": params, "stream": True}
+        started = time.monotonic()
+        usage: Dict[str, Any] = {}
+        if cassette.replaying:
+            recorded = cassette.lookup("llm", request)
+            chunks = recorded["response"]["chunks"]
+            for chunk in chunks:
+                if cassette.latency_scale > 0 and recorded.get("elapsed"):
+                    await asyncio.sleep(recorded["elapsed"] * cassette.latency_scale / max(1, len(chunks)))
+                yield chunk
+            usage["usage"] = recorded["response"].get("usage")
+        else:
+            chunks: List[str] = []
+            try:
+                async for chunk in _limited_stream(model_info, lambda: _stream_model(prompt, params, system, usage)):
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                error_message = f"Error streaming {model_info.provider} model '{model_info.model}': {str(e)}"
+                print(error_message)
+                raise Exception(error_message) from e
+            if cassette.recording:
+                recorded_usage = usage.get("usage")
+                if hasattr(recorded_usage, "model_dump"):
+                    recorded_usage = recorded_usage.model_dump(mode="json")
+                cassette.record("llm", request, {"chunks": chunks, "usage": recorded_usage}, time.monotonic() - started)
+        record_usage(model_info.model, usage, time.monotonic() - started)
+
+    return stream_model
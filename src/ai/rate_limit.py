@@ -0,0 +1,411 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Mapping, Optional
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds to wait."""
+    if not value:
+        return None
+    now = time.time() if now is None else now
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - now)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def _header(headers: Mapping[str, str], *names: str) -> Optional[str]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            return value
+    return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = 3.0, cap: float = 30.0) -> float:
+    """
+    Jittered exponential backoff for retry number `attempt` (0-based). Retries from many
+    callers spread out instead of firing in lockstep, and never undercut a server Retry-After.
+    """
+    delay = min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, base / 2))
+    return delay
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by every Firecrawl call in the process.
+
+    `rate` is the steady requests/second and `burst` the bucket capacity. A rate of 0 disables
+    token accounting but still honours server-imposed pauses. The rate adapts AIMD-style:
+    it is cut on 429s or when the rate-limit headers show the quota running out, and grows back
+    towards the configured rate while requests succeed, so throughput settles just under quota.
+
+    If `state_path` is given, the bucket state lives in that file and is guarded by an
+    exclusive file lock, so several worker processes on one host share a single budget.
+    """
+    def __init__(self, rate: float = 0.0, burst: Optional[int] = None,
+                 min_rate: Optional[float] = None, state_path: Optional[str] = None,
+                 decrease_factor: float = 0.7, recovery_fraction: float = 0.05):
+        self.max_rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate + 0.999))
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.decrease_factor = decrease_factor
+        self.recovery_step = rate * recovery_fraction
+        self.state_path = state_path
+        self.throttled = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._state = {
+            "tokens": float(self.burst),
+            "rate": float(rate),
+            "updated": time.time(),
+            "blocked_until": 0.0,
+        }
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, float]]:
+        with self._lock:
+            if not self.state_path:
+                yield self._state
+                return
+            import fcntl
+            directory = os.path.dirname(self.state_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.state_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = {**self._state, **json.loads(f.read() or "{}")}
+                    except ValueError:
+                        state = dict(self._state)
+                    yield state
+                    self._state = state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _try_acquire(self) -> float:
+        """Take a token if one is available; otherwise return how long to wait before retrying."""
+        now = time.time()
+        with self._locked_state() as state:
+            if now < state["blocked_until"]:
+                return state["blocked_until"] - now
+            if self.max_rate <= 0:
+                return 0.0
+            elapsed = max(0.0, now - state["updated"])
+            state["tokens"] = min(float(self.burst), state["tokens"] + elapsed * state["rate"])
+            state["updated"] = now
+            if state["tokens"] >= 1:
+                state["tokens"] -= 1
+                return 0.0
+            return (1 - state["tokens"]) / state["rate"]
+
+    async def _off_loop(self, fn, *args):
+        # A shared state file is read and written under a blocking flock; keep that off the event loop
+        if self.state_path:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def acquire(self) -> None:
+        while True:
+            wait = await self._off_loop(self._try_acquire)
+            if wait <= 0:
+                return
+            self.throttled += 1
+            # Small jitter so waiters do not all wake on the same tick
+            await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+    def acquire_sync(self) -> None:
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                return
+            self.throttled += 1
+            time.sleep(wait + random.uniform(0, 0.05))
+
+    def observe(self, status_code: int, headers: Mapping[str, str]) -> Optional[float]:
+        """
+        Feed a response back into the limiter. Returns the server-requested delay in seconds
+        (from Retry-After or the rate-limit reset header) when there is one.
+        """
+        now = time.time()
+        retry_after = parse_retry_after(_header(headers, "Retry-After", "retry-after"), now)
+        remaining = _header(headers, "X-RateLimit-Remaining", "x-ratelimit-remaining", "RateLimit-Remaining")
+        reset = _header(headers, "X-RateLimit-Reset", "x-ratelimit-reset", "RateLimit-Reset")
+        reset_in = None
+        if reset is not None:
+            try:
+                reset_value = float(reset)
+                # Some APIs send an epoch timestamp, others a delta in seconds
+                reset_in = max(0.0, reset_value - now) if reset_value > 1e9 else reset_value
+            except ValueError:
+                reset_in = parse_retry_after(reset, now)
+
+        with self._locked_state() as state:
+            if status_code == 429:
+                self.rate_limited += 1
+                if retry_after is None:
+                    retry_after = reset_in
+                state["tokens"] = 0.0
+                if self.max_rate > 0:
+                    state["rate"] = max(self.min_rate, state["rate"] * self.decrease_factor)
+            elif status_code < 400 and self.max_rate > 0:
+                state["rate"] = min(self.max_rate, state["rate"] + self.recovery_step)
+
+            if remaining is not None and reset_in:
+                try:
+                    remaining_count = float(remaining)
+                except ValueError:
+                    remaining_count = None
+                if remaining_count is not None:
+                    if remaining_count <= 0:
+                        retry_after = max(retry_after or 0.0, reset_in)
+                    elif self.max_rate > 0:
+                        # Spread what is left of the window evenly instead of bursting into the wall
+                        state["rate"] = max(self.min_rate, min(state["rate"], remaining_count / reset_in))
+
+            if retry_after:
+                state["blocked_until"] = max(state["blocked_until"], now + retry_after)
+        return retry_after
+
+    async def observe_async(self, status_code: int, headers: Mapping[str, str]) -> Optional[float]:
+        """observe() for coroutines: a file-backed bucket updates its state in a thread."""
+        return await self._off_loop(self.observe, status_code, headers)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._locked_state() as state:
+            snapshot = dict(state)
+        return {
+            "configured_rate": self.max_rate,
+            "current_rate": snapshot["rate"],
+            "burst": self.burst,
+            "tokens": snapshot["tokens"],
+            "blocked_for": max(0.0, snapshot["blocked_until"] - time.time()),
+            "throttled": self.throttled,
+            "rate_limited": self.rate_limited,
+            "shared": bool(self.state_path),
+        }
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+def parse_reset(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Parse a rate-limit reset header into seconds from now. Accepts OpenAI durations ("1s",
+    "6m0s", "20ms"), Anthropic RFC 3339 timestamps, and plain seconds or HTTP dates.
+    """
+    if not value:
+        return None
+    now = time.time() if now is None else now
+    value = value.strip()
+    parts = _DURATION_RE.findall(value)
+    if parts and "".join(number + unit for number, unit in parts) == value:
+        return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() - now)
+    except ValueError:
+        return parse_retry_after(value, now)
+
+# Remaining/limit/reset header triplets: OpenAI per requests and tokens, Anthropic per
+# requests, tokens, input tokens and output tokens
+_QUOTA_HEADERS = [
+    (f"x-ratelimit-remaining-{kind}", f"x-ratelimit-limit-{kind}", f"x-ratelimit-reset-{kind}")
+    for kind in ("requests", "tokens")
+] + [
+    (f"anthropic-ratelimit-{kind}-remaining", f"anthropic-ratelimit-{kind}-limit", f"anthropic-ratelimit-{kind}-reset")
+    for kind in ("requests", "tokens", "input-tokens", "output-tokens")
+]
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on concurrent calls to one provider model, shared by every session in the process.
+
+    Each success raises the limit by 1/limit (about one more slot per round of calls) up to
+    max_limit; a 429 or overloaded error multiplies it by decrease_factor, at most once per
+    cooldown so one burst of failures counts once, and pauses new calls for any Retry-After.
+    Rate-limit headers hold the limit while under low_quota_fraction of a quota is left, and
+    pause new calls until the reset once a quota is used up.
+    """
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 decrease_factor: float = 0.5, cooldown: float = 1.0, low_quota_fraction: float = 0.1):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(min_limit, initial)))
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.low_quota_fraction = low_quota_fraction
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.blocked_until = 0.0
+        self.quota: Dict[str, float] = {}
+        self.calls = 0
+        self.overloaded = 0
+        self.queued = 0
+        self._low_quota = False
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def _wake(self) -> None:
+        """Wake as many waiters as there are free slots; called with the lock held."""
+        free = self.capacity - self.in_flight
+        while self._waiters and free > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+                free -= 1
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        queued = False
+        while True:
+            with self._lock:
+                now = time.time()
+                if now >= self.blocked_until and self.in_flight < self.capacity:
+                    self.in_flight += 1
+                    self.calls += 1
+                    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                    return
+                pause = self.blocked_until - now if now < self.blocked_until else None
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+            if not queued:
+                self.queued += 1
+                queued = True
+            try:
+                # Woken by a released slot, or when the pause ends
+                await asyncio.wait_for(waiter, pause)
+            except asyncio.TimeoutError:
+                pass
+            except BaseException:
+                with self._lock:
+                    # Pass on a wake-up this waiter received but can no longer use
+                    if waiter.done() and not waiter.cancelled():
+                        self._wake()
+                raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def observe_headers(self, headers: Optional[Mapping[str, str]]) -> Optional[float]:
+        """Read rate-limit headers; returns the pause in seconds when a quota is used up."""
+        if not headers:
+            return None
+        now = time.time()
+        pause = None
+        low = False
+        for remaining_name, limit_name, reset_name in _QUOTA_HEADERS:
+            try:
+                remaining = float(headers.get(remaining_name))
+            except (TypeError, ValueError):
+                continue
+            self.quota[remaining_name] = remaining
+            try:
+                quota = float(headers.get(limit_name))
+            except (TypeError, ValueError):
+                quota = 0.0
+            if remaining <= 0:
+                reset_in = parse_reset(headers.get(reset_name), now)
+                if reset_in:
+                    pause = max(pause or 0.0, reset_in)
+            elif quota > 0 and remaining / quota < self.low_quota_fraction:
+                low = True
+        with self._lock:
+            self._low_quota = low or pause is not None
+            if pause:
+                self.blocked_until = max(self.blocked_until, now + pause)
+        return pause
+
+    def on_success(self, headers: Optional[Mapping[str, str]] = None) -> None:
+        self.observe_headers(headers)
+        with self._lock:
+            if not self._low_quota:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_overload(self, headers: Optional[Mapping[str, str]] = None) -> Optional[float]:
+        """
+        Cut the limit after a 429 or overloaded response. Returns the server-requested delay
+        (Retry-After, or the reset of a used-up quota) when there is one.
+        """
+        now = time.time()
+        retry_after = parse_retry_after(_header(headers or {}, "retry-after", "Retry-After"), now)
+        pause = self.observe_headers(headers)
+        if retry_after is None:
+            retry_after = pause
+        with self._lock:
+            self.overloaded += 1
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+                self._last_decrease = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+        return retry_after
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "max_limit": self.max_limit,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+                "blocked_for": max(0.0, self.blocked_until - time.time()),
+                "calls": self.calls,
+                "queued": self.queued,
+                "overloaded": self.overloaded,
+                "quota_remaining": dict(self.quota),
+            }
+
+def _resolve(waiter: "asyncio.Future[None]") -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+class ConcurrencyLimits:
+    """One AdaptiveConcurrency per key (provider and model), created on first use."""
+    def __init__(self, **settings: Any):
+        self.settings = settings
+        self._limits: Dict[str, AdaptiveConcurrency] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> AdaptiveConcurrency:
+        with self._lock:
+            if key not in self._limits:
+                self._limits[key] = AdaptiveConcurrency(**self.settings)
+            return self._limits[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            limits = dict(self._limits)
+        return {key: limit.stats() for key, limit in limits.items()}
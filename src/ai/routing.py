@@ -0,0 +1,48 @@
+import os
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Union
+
+from ai.providers import ModelInfo, get_model, get_stream_model
+
+# Research stages that can each run on their own model
+STAGES = ("feedback", "queries", "learnings", "report")
+# Per-stage defaults, e.g. MODEL_QUERIES="gpt-4o-mini"; stages left unset use the main model
+STAGE_MODEL_DEFAULTS: Dict[str, str] = {stage: os.getenv(f"MODEL_{stage.upper()}", "") for stage in STAGES}
+
+class StageModels:
+    """
+    The model for each research stage. Small tasks (clarifying questions, search queries) can
+    run on a fast, cheap model while the report uses a strong one. Precedence per stage: an
+    explicit override, then the MODEL_<STAGE> environment default, then the main model.
+    """
+    def __init__(self, default: Optional[ModelInfo] = None,
+                 overrides: Optional[Mapping[str, Union[str, ModelInfo, None]]] = None):
+        self.default = default or ModelInfo()
+        overrides = dict(overrides or {})
+        unknown = set(overrides) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown stage(s) {', '.join(sorted(unknown))}; expected one of {', '.join(STAGES)}")
+        self.models: Dict[str, ModelInfo] = {}
+        for stage in STAGES:
+            model = overrides.get(stage) or STAGE_MODEL_DEFAULTS[stage]
+            self.models[stage] = self._model_info(model)
+
+    def _model_info(self, model: Union[str, ModelInfo, None]) -> ModelInfo:
+        if isinstance(model, ModelInfo):
+            return model
+        if not model:
+            return self.default
+        # The main model's params (temperature, reasoning effort) may not suit another model
+        info = ModelInfo(model, use_cache=self.default.use_cache)
+        return self.default if info.model == self.default.model else info
+
+    def __getitem__(self, stage: str) -> ModelInfo:
+        return self.models[stage]
+
+    def get_model(self, stage: str) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        return get_model(self.models[stage])
+
+    def get_stream_model(self, stage: str):
+        return get_stream_model(self.models[stage])
+
+    def describe(self) -> Dict[str, str]:
+        return {stage: info.model for stage, info in self.models.items()}
@@ -0,0 +1,51 @@
+import copy
+import os
+from typing import Any, Dict
+
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+STRUCTURED_REPAIR_ATTEMPTS = int(os.getenv("STRUCTURED_REPAIR_ATTEMPTS", 1))
+# Enough of a broken answer for the model to fix it without paying for the whole thing twice
+REPAIR_MAX_CHARS = 60000
+
+def schema_name(schema: Any) -> str:
+    return getattr(schema, "__name__", "response")
+
+def _strict(node: Any) -> Any:
+    if isinstance(node, dict):
+        node = {k: _strict(v) for k, v in node.items() if k != "default"}
+        if node.get("type") == "object" and "properties" in node:
+            # Strict mode wants every property required and nothing else allowed
+            node["required"] = list(node["properties"])
+            node["additionalProperties"] = False
+        return node
+    if isinstance(node, list):
+        return [_strict(v) for v in node]
+    return node
+
+def strict_json_schema(schema: Any) -> Dict[str, Any]:
+    """JSON schema of a pydantic model in the form OpenAI's strict structured output accepts."""
+    return _strict(copy.deepcopy(schema.model_json_schema()))
+
+def openai_response_format(schema: Any) -> Dict[str, Any]:
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": schema_name(schema), "schema": strict_json_schema(schema), "strict": True},
+    }
+
+def anthropic_tool(schema: Any) -> Dict[str, Any]:
+    return {
+        "name": schema_name(schema),
+        "description": "Return the answer in this structure.",
+        "input_schema": schema.model_json_schema(),
+    }
+
+def repair_prompt(text: str, error: Exception, schema: Any = None) -> str:
+    """Short follow-up asking the model to fix an answer that did not parse, instead of redoing the task."""
+    shape = f"It must match this JSON schema:\n{strict_json_schema(schema)}\n\n" if hasattr(schema, "model_json_schema") else ""
+    return (
+        f"Your previous answer could not be used because it is not valid JSON for the requested structure.\n"
+        f"Error: {str(error)[:500]}\n\n"
+        f"{shape}"
+        f"Return only the corrected JSON object, keeping the content of the answer unchanged.\n\n"
+        f"<answer>\n{text[:REPAIR_MAX_CHARS]}\n</answer>"
+    )
@@ -0,0 +1,62 @@
+import os
+from typing import List
+
+import tiktoken
+
+# Kept free of API clients so that offload worker processes can import it cheaply
+CONTEXT_SIZE: int = int(os.getenv("CONTEXT_SIZE", 128000))
+# How far back (in characters) trim_prompt may move a cut to land on a paragraph or sentence break
+SNAP_WINDOW: int = 2000
+# Generous upper bound on characters per token, used to size the part of a long prompt we tokenize
+TRIM_CHARS_PER_TOKEN: int = 8
+tokenizer = tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str) -> int:
+    return len(tokenizer.encode(text, disallowed_special=())) if text else 0
+
+def _snap_to_boundary(text: str) -> str:
+    """Cut text back to the last paragraph, line or sentence break in its final stretch, if there is one."""
+    window = min(SNAP_WINDOW, len(text) // 5)
+    floor = len(text) - window
+    for separator in ("\n\n", "\n", ". ", "? ", "! "):
+        position = text.rfind(separator, floor)
+        if position > 0:
+            return text[:position + len(separator)].rstrip()
+    return text
+
+def _encode_head(prompt: str, context_size: int) -> List[int]:
+    """
+    Tokens of the prompt, or of just a long enough head of it. A huge page trimmed to a small
+    budget only needs its first ~context_size tokens, so we encode a head cut just before a space
+    (tokenization never merges across that point, so its tokens match the full text's) and
+    fall back to the whole prompt only if the head turns out to be under budget.
+    """
+    window = context_size * TRIM_CHARS_PER_TOKEN
+    if len(prompt) > window:
+        cut = prompt.rfind(" ", 0, window)
+        while cut > 0 and prompt[cut - 1].isspace():
+            cut -= 1
+        if cut > 0:
+            tokens = tokenizer.encode(prompt[:cut], disallowed_special=())
+            if len(tokens) > context_size:
+                return tokens
+    return tokenizer.encode(prompt, disallowed_special=())
+
+def trim_prompt(prompt: str, context_size: int = CONTEXT_SIZE, snap: bool = True) -> str:
+    """
+    Trim the prompt to at most context_size tokens. The text is encoded once and cut at the exact
+    token boundary; with snap, the cut moves back to the nearest paragraph, line or sentence break
+    within the last few thousand characters. Nothing is re-tokenized, and for long prompts only
+    the head that can fit is tokenized at all.
+    """
+    if not prompt or context_size <= 0:
+        return ""
+    # Every token covers at least one byte, so short prompts cannot be over budget
+    if len(prompt) <= context_size and len(prompt.encode("utf-8")) <= context_size:
+        return prompt
+    tokens = _encode_head(prompt, context_size)
+    if len(tokens) <= context_size:
+        return prompt
+    # Decoding bytes lets us drop a multi-byte character split by the cut instead of mangling it
+    trimmed = tokenizer.decode_bytes(tokens[:context_size]).decode("utf-8", errors="ignore")
+    return _snap_to_boundary(trimmed) if snap else trimmed
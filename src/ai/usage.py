@@ -0,0 +1,129 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+USAGE_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "cached_tokens", "cache_write_tokens", "seconds", "cost_usd")
+
+# USD per million tokens: (uncached input, cached input, output), by model name prefix; the
+# longest matching prefix wins. Anthropic cache writes are billed at 1.25x the input price.
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "chatgpt-4o": (5.00, 5.00, 15.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "o1": (15.00, 7.50, 60.00),
+    "o1-mini": (1.10, 0.55, 4.40),
+    "o3": (2.00, 0.50, 8.00),
+    "o3-mini": (1.10, 0.55, 4.40),
+    "o4-mini": (1.10, 0.275, 4.40),
+    "claude-3-haiku": (0.25, 0.03, 1.25),
+    "claude-3-5-haiku": (0.80, 0.08, 4.00),
+    "claude-3-5-sonnet": (3.00, 0.30, 15.00),
+    "claude-3-7-sonnet": (3.00, 0.30, 15.00),
+    "claude-sonnet-4": (3.00, 0.30, 15.00),
+    "claude-3-opus": (15.00, 1.50, 75.00),
+    "claude-opus-4": (15.00, 1.50, 75.00),
+}
+
+def _get(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+def extract_usage(response: Any) -> Dict[str, int]:
+    """
+    Token counts from a chat completion (OpenAI object or the dict built for Anthropic).
+    prompt_tokens includes cached tokens; cached_tokens is the part served from the provider's
+    prompt cache and cache_write_tokens the part written to it (Anthropic only).
+    """
+    usage = _get(response, "usage")
+    details = _get(usage, "prompt_tokens_details")
+    return {
+        "prompt_tokens": _get(usage, "prompt_tokens") or 0,
+        "completion_tokens": _get(usage, "completion_tokens") or 0,
+        "cached_tokens": _get(details, "cached_tokens") or 0,
+        "cache_write_tokens": _get(usage, "cache_creation_input_tokens") or 0,
+    }
+
+def model_price(model: str) -> Optional[Tuple[float, float, float]]:
+    matches = [prefix for prefix in MODEL_PRICES if model.startswith(prefix)]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+def estimate_cost(model: str, usage: Dict[str, int]) -> float:
+    """Approximate USD cost of one call from list prices; 0 for models without a known price."""
+    price = model_price(model)
+    if price is None:
+        return 0.0
+    input_price, cached_price, output_price = price
+    cached = usage.get("cached_tokens", 0)
+    written = usage.get("cache_write_tokens", 0)
+    uncached = max(0, usage.get("prompt_tokens", 0) - cached - written)
+    return (
+        uncached * input_price + cached * cached_price + written * input_price * 1.25
+        + usage.get("completion_tokens", 0) * output_price
+    ) / 1_000_000
+
+def _summary(totals: Dict[str, float]) -> Dict[str, float]:
+    return {
+        **totals,
+        "avg_seconds": totals["seconds"] / totals["calls"] if totals["calls"] else 0.0,
+        "cached_ratio": totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0,
+    }
+
+class UsageTracker:
+    """
+    Totals of model calls, tokens (including provider-cached tokens), time spent and estimated
+    cost, per model and per research stage (feedback, queries, learnings, report).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models: Dict[str, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(USAGE_FIELDS, 0))
+        self.stages: Dict[str, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(USAGE_FIELDS, 0))
+
+    def record(self, model: str, usage: Dict[str, int], seconds: float = 0.0, stage: Optional[str] = None) -> None:
+        cost = estimate_cost(model, usage)
+        with self._lock:
+            for totals in (self.models[model], self.stages[stage or "other"]):
+                totals["calls"] += 1
+                totals["seconds"] += seconds
+                totals["cost_usd"] += cost
+                for name in ("prompt_tokens", "completion_tokens", "cached_tokens", "cache_write_tokens"):
+                    totals[name] += usage.get(name, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {model: _summary(totals) for model, totals in self.models.items()}
+            stages = {stage: _summary(totals) for stage, totals in self.stages.items()}
+        total = dict.fromkeys(USAGE_FIELDS, 0)
+        for totals in models.values():
+            for name in USAGE_FIELDS:
+                total[name] += totals[name]
+        return {"models": models, "stages": stages, "total": _summary(total)}
+
+# Process-wide totals, plus an optional tracker for the research job running in this context
+usage_tracker = UsageTracker()
+current_usage: ContextVar[Optional[UsageTracker]] = ContextVar("current_usage", default=None)
+# The research stage the calls in this context belong to
+current_stage: ContextVar[Optional[str]] = ContextVar("current_stage", default=None)
+
+@contextmanager
+def usage_stage(stage: str) -> Iterator[None]:
+    """Attribute the model calls made inside the block to a research stage."""
+    token = current_stage.set(stage)
+    try:
+        yield
+    finally:
+        current_stage.reset(token)
+
+def record_usage(model: str, response: Any, seconds: float = 0.0) -> Dict[str, int]:
+    usage = extract_usage(response)
+    stage = current_stage.get()
+    usage_tracker.record(model, usage, seconds, stage)
+    job_usage = current_usage.get()
+    if job_usage is not None:
+        job_usage.record(model, usage, seconds, stage)
+    return usage
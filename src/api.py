@@ -1,21 +1,52 @@
 import asyncio
+import json
 import uuid
 from datetime import datetime, timedelta
 from collections import defaultdict
 from typing import Dict, List, Optional, Any
 import traceback
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 
 from deep_research import deep_research, write_final_report
-from ai.providers import ModelInfo
+from ai.providers import (
+    ModelInfo, close_firecrawl_client, search_cache, llm_cache, search_flights, llm_flights,
+    firecrawl_rate_limiter, firecrawl_latency, llm_concurrency
+)
 from feedback import generate_feedback
 from output_manager import OutputManager
 from docs import router as docs_router
+from ai.cassette import get_cassette
+from ai.latency import LoopLagMonitor
+from ai.offload import cpu_offload
+from ai.routing import StageModels
+from research_scheduler import ResearchScheduler, research_budget, scheduler_stats
+from ai.usage import UsageTracker, current_usage, usage_tracker
+from search_policy import SearchPolicy
+from novelty import NoveltyPolicy
+from search_backends import get_search_backend, close_search_backend
 
-app = FastAPI(title="Deep Research API")
+# How late the event loop runs scheduled work; blocking CPU work in a coroutine shows up here
+loop_lag = LoopLagMonitor()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag.start()
+    try:
+        yield
+    finally:
+        # Release the pooled Firecrawl connections and worker pools, and flush a recording cassette
+        await loop_lag.stop()
+        cpu_offload.shutdown()
+        await close_search_backend()
+        await close_firecrawl_client()
+        get_cassette().save()
+
+app = FastAPI(title="Deep Research API", lifespan=lifespan)
 
 # Include the docs router
 app.include_router(docs_router)
@@ -30,23 +61,74 @@ class ResearchRequest(BaseModel):
     depth: Optional[int] = 2
     model: Optional[str] = None # e.g. "o3-mini", "chatgpt-4o-latest", "gpt-4o-mini"
     model_params: Optional[Dict] = None
+    search_limit: Optional[int] = Field(default=None, gt=0) # Pin Firecrawl results per query instead of adapting it
+    search_timeout: Optional[int] = Field(default=None, gt=0) # Pin Firecrawl timeout (ms) instead of adapting it
+    two_phase_search: Optional[bool] = None # Rank snippets first and scrape only the best hits
+    stream_search: Optional[bool] = None # Process pages as they arrive and drop stragglers
+    bypass_cache: Optional[bool] = False # Always call the model instead of reusing cached answers
+    stage_models: Optional[Dict[str, str]] = None # Per-stage models, e.g. {"queries": "gpt-4o-mini"}
+    min_new_urls: Optional[float] = Field(default=None, ge=0, le=1) # Stop a branch when fewer of its URLs than this share are new
+    min_new_learnings: Optional[float] = Field(default=None, ge=0, le=1) # Stop a branch when fewer of its learnings than this share are new
 
 class AnswerRequest(BaseModel):
     user_id: str
     job_id: str
     answers: List[str]
 
+class ReportStream:
+    """Chunks of a job's report as they are written; every subscriber gets them all from the start."""
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self._changed = asyncio.Event()
+
+    def append(self, text: str) -> None:
+        self.chunks.append(text)
+        self._notify()
+
+    def close(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        # Wake everyone waiting on the current event and start a fresh one for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                return
+            await changed.wait()
+
 class Session:
-    def __init__(self, prompt: str, breadth: int, depth: int, model_info: Optional[ModelInfo] = None):
+    def __init__(self, prompt: str, breadth: int, depth: int, model_info: Optional[ModelInfo] = None,
+                 search_policy: Optional[SearchPolicy] = None, stage_models: Optional[StageModels] = None,
+                 user_id: str = "default", novelty_policy: Optional[NoveltyPolicy] = None):
         self.prompt = prompt
+        self.user_id = user_id
         self.breadth = breadth
         self.depth = depth
         self._follow_up_questions: List[str] = []
         self._answers: List[str] = []
-        self.status = "pending_answers"  # pending_answers, running, completed, cancelled, failed
+        self.status = "pending_answers"  # pending_answers, queued, running, completed, cancelled, failed
         self.result: Optional[Dict[str, Any]] = None
         self.created_at = datetime.now()
         self.model_info = model_info or ModelInfo()
+        self.stage_models = stage_models or StageModels(self.model_info)
+        self.search_policy = search_policy or SearchPolicy()
+        self.novelty_policy = novelty_policy or NoveltyPolicy()
+        # Model calls made while this job runs, including provider-cached prompt tokens
+        self.usage = UsageTracker()
+        self.report_stream = ReportStream()
+        # Runs this job's research tree on bounded search and LLM worker pools, within the
+        # process-wide budget shared fairly between users
+        self.scheduler = ResearchScheduler(user_id=user_id)
         self.task = None
 
     @property
@@ -69,8 +151,14 @@ class Session:
     
 
     async def start_research(self):
+        admitted = False
         try:
+            # Wait for a job slot when RESEARCH_MAX_JOBS jobs are already researching
+            self.status = "queued"
+            await research_budget["jobs"].acquire(self.user_id)
+            admitted = True
             self.status = "running"
+            current_usage.set(self.usage)
             output = OutputManager(verbose=True)
             # output = None
             
@@ -87,7 +175,11 @@ class Session:
                 breadth=self.breadth,
                 depth=self.depth,
                 model_info=self.model_info,
-                on_progress=None
+                on_progress=None,
+                search_policy=self.search_policy,
+                stage_models=self.stage_models,
+                scheduler=self.scheduler,
+                novelty_policy=self.novelty_policy
             )
             
             # Extract learnings and visited URLs
@@ -99,13 +191,15 @@ class Session:
             output.debug(f"Visited URLs count: {len(visited_urls)}")
             output.debug(f"First URL if available: {visited_urls[0] if visited_urls else 'None'}")
             
-            # Generate the final report
-            report = await write_final_report(
-                prompt=combined_prompt,
-                learnings=learnings,
-                visited_urls=[],
-                model_info=self.model_info
-            )
+            # Generate the final report, the largest model call, within the shared LLM budget
+            async with research_budget["llm"].slot(self.user_id):
+                report = await write_final_report(
+                    prompt=combined_prompt,
+                    learnings=learnings,
+                    visited_urls=[],
+                    model_info=self.stage_models["report"],
+                    on_chunk=self.report_stream.append
+                )
             
             # Log final URL count before setting result
             output.debug(f"Final visited_urls count before setting result: {len(visited_urls)}")
@@ -117,12 +211,22 @@ class Session:
                 "prompt": self.prompt,
                 "questions_and_answers": follow_up_qas,
                 "report": report,
-                "sources": visited_urls
+                "sources": visited_urls,
+                # Learnings behind the report, each with the near-duplicates merged into it and its source URLs
+                "learnings": result.get("learning_sources", []),
+                # Branches not researched deeper because they found too little that was new
+                "novelty": self.novelty_policy.stats(),
+                "models": self.stage_models.describe(),
+                "usage": self.usage.stats()
             }
             self.status = "completed"
         except:
             traceback.print_exc()
             self.status = "failed"
+        finally:
+            if admitted:
+                research_budget["jobs"].release(self.user_id)
+            self.report_stream.close()
 
 def get_url(item):
     return (
@@ -154,12 +258,29 @@ async def start_research(request: ResearchRequest):
     
     # Create a new session
     job_id = str(uuid.uuid4())
-    model_info = ModelInfo(request.model, request.model_params)
+    model_info = ModelInfo(request.model, request.model_params, use_cache=not request.bypass_cache)
     print(model_info.model, model_info.model_params)
-    session = Session(request.prompt, request.breadth, request.depth, model_info)
+    search_policy = SearchPolicy(limit_override=request.search_limit, timeout_override=request.search_timeout)
+    if request.two_phase_search is not None:
+        search_policy.two_phase = request.two_phase_search
+    if request.stream_search is not None:
+        search_policy.streaming = request.stream_search
+    novelty_policy = NoveltyPolicy()
+    if request.min_new_urls is not None:
+        novelty_policy.min_new_urls = request.min_new_urls
+    if request.min_new_learnings is not None:
+        novelty_policy.min_new_learnings = request.min_new_learnings
+    try:
+        stage_models = StageModels(model_info, request.stage_models)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    session = Session(request.prompt, request.breadth, request.depth, model_info, search_policy, stage_models,
+                      user_id=request.user_id, novelty_policy=novelty_policy)
+    current_usage.set(session.usage)
     
     # Generate follow-up questions
-    follow_up_questions = await generate_feedback(query=request.prompt, model_info=model_info)
+    async with research_budget["llm"].slot(request.user_id):
+        follow_up_questions = await generate_feedback(query=request.prompt, model_info=stage_models["feedback"])
 
     session.follow_up_questions = follow_up_questions
     
@@ -215,9 +336,32 @@ async def get_research_status(user_id: str, job_id: str):
             "status": "completed",
             "results": session.result
         }
+    elif session.report_stream.chunks:
+        # The report is being written; return what there is so far
+        return {"status": session.status, "partial_report": "".join(session.report_stream.chunks)}
+    elif session.status == "running":
+        # Steps waiting for and holding the job's search and LLM workers
+        return {"status": session.status, "scheduler": session.scheduler.stats()}
     else:
         return {"status": session.status}
 
+@app.get("/research/stream")
+async def stream_research_report(user_id: str, job_id: str):
+    """Stream the report as Server-Sent Events while it is written ("chunk" events, then "done")"""
+    if user_id not in sessions:
+        raise HTTPException(status_code=404, detail="No user sessions found")
+    if job_id not in sessions[user_id]:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    session = sessions[user_id][job_id]
+
+    async def events():
+        async for chunk in session.report_stream.follow():
+            yield f"event: chunk\ndata: {json.dumps({'text': chunk})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'status': session.status})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/research/cancel")
 async def cancel_research_status(user_id: str, job_id: str):
     """Cancel a research session"""
@@ -246,5 +390,32 @@ async def get_research_sessions(user_id: str):
     
     return {"sessions": [{"job_id": job_id, "status": user_sessions[job_id]["status"]} for job_id in user_sessions]}
 
+@app.get("/stats")
+async def get_stats():
+    """Report shared cache, request-coalescing and rate-limit counters for capacity planning"""
+    # The caches count rows in sqlite and a shared rate limiter reads a locked file, so keep those off the loop
+    search_cache_stats, llm_cache_stats, firecrawl_rate_limit = await asyncio.gather(
+        asyncio.to_thread(search_cache.stats) if search_cache else asyncio.sleep(0),
+        asyncio.to_thread(llm_cache.stats) if llm_cache else asyncio.sleep(0),
+        asyncio.to_thread(firecrawl_rate_limiter.stats)
+    )
+    return {
+        "search_cache": search_cache_stats,
+        "llm_cache": llm_cache_stats,
+        "singleflight": {
+            "search": search_flights.stats(),
+            "llm": llm_flights.stats()
+        },
+        "firecrawl_rate_limit": firecrawl_rate_limit,
+        "firecrawl_latency": firecrawl_latency.stats(),
+        "llm_concurrency": llm_concurrency.stats(),
+        "search_backend": get_search_backend().stats(),
+        "cassette": get_cassette().stats(),
+        "llm_usage": usage_tracker.stats(),
+        "event_loop_lag": loop_lag.stats(),
+        "cpu_offload": cpu_offload.stats(),
+        "research_scheduler": scheduler_stats()
+    }
+
 if __name__ == "__main__":
     uvicorn.run("api:app", host="0.0.0.0", port=8001, reload=False)
\ No newline at end of file
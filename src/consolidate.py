@@ -0,0 +1,175 @@
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Sequence
+
+import numpy as np
+
+from relevance import STOPWORDS
+
+# Merge near-duplicate learnings before the final report
+LEARNING_CONSOLIDATION = os.getenv("LEARNING_CONSOLIDATION", "true").lower() in ("1", "true", "yes")
+# TF-IDF cosine similarity from which two learnings count as saying the same thing
+LEARNING_SIMILARITY = float(os.getenv("LEARNING_SIMILARITY", 0.5))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Words are cut to this many letters, a crude stemmer: "acidifies" and "acidification" match
+STEM_CHARS = 6
+
+@dataclass
+class LearningCluster:
+    """Near-duplicate learnings; `representative` and `members` are indexes into the input."""
+    representative: int
+    members: List[int] = field(default_factory=list)
+
+def _terms(text: str) -> List[str]:
+    # Unlike relevance.tokenize, short numbers are kept: "fell 3%" and "fell 7%" are different facts
+    return [t if t[0].isdigit() else t[:STEM_CHARS] for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def _figures(terms: Sequence[str]) -> FrozenSet[str]:
+    return frozenset(t for t in terms if any(c.isdigit() for c in t))
+
+def _same_figures(a: FrozenSet[str], b: FrozenSet[str]) -> bool:
+    return a <= b or b <= a
+
+def similarity_matrix(texts: Sequence[str]) -> np.ndarray:
+    """Pairwise TF-IDF cosine similarity (sublinear term frequency, smoothed IDF)."""
+    docs = [Counter(_terms(text)) for text in texts]
+    doc_freq = Counter(term for doc in docs for term in doc)
+    n = len(docs)
+    idf = {term: math.log((1 + n) / (1 + df)) + 1 for term, df in doc_freq.items()}
+    norms = np.array([
+        math.sqrt(sum(((1 + math.log(tf)) * idf[term]) ** 2 for term, tf in doc.items())) or 1.0
+        for doc in docs
+    ], dtype=np.float32)
+    # Terms found in one learning only add to its norm but never to a dot product
+    shared = {term: column for column, term in enumerate(t for t, df in doc_freq.items() if df > 1)}
+    weights = np.zeros((n, len(shared)), dtype=np.float32)
+    for row, doc in enumerate(docs):
+        for term, tf in doc.items():
+            column = shared.get(term)
+            if column is not None:
+                weights[row, column] = (1 + math.log(tf)) * idf[term]
+    weights /= norms[:, None]
+    similarity = weights @ weights.T
+    np.fill_diagonal(similarity, 1.0)
+    return similarity
+
+def cluster_learnings(learnings: Sequence[str], threshold: float = LEARNING_SIMILARITY) -> List[LearningCluster]:
+    """
+    Group near-duplicate learnings. In order, each learning joins the most similar cluster
+    whose first member it matches at `threshold` or more, provided the figures (numbers, years,
+    versions) of one are a subset of the other's; otherwise it starts a new cluster. Each
+    cluster's representative is the member with the most distinct terms, usually the most
+    specific phrasing. Clusters come back in order of their first member.
+    """
+    if not learnings:
+        return []
+    similarity = similarity_matrix(learnings)
+    figures = [_figures(_terms(text)) for text in learnings]
+    clusters: List[LearningCluster] = []
+    leaders: List[int] = []
+    for index in range(len(learnings)):
+        joined = False
+        if leaders:
+            scores = similarity[index, leaders]
+            for position in np.argsort(-scores, kind="stable"):
+                if scores[position] < threshold:
+                    break
+                if _same_figures(figures[index], figures[leaders[position]]):
+                    clusters[position].members.append(index)
+                    joined = True
+                    break
+        if not joined:
+            leaders.append(index)
+            clusters.append(LearningCluster(representative=index, members=[index]))
+    for cluster in clusters:
+        cluster.representative = max(cluster.members, key=lambda i: (len(set(_terms(learnings[i]))), -i))
+    return clusters
+
+def consolidate_learnings(learnings: Sequence[str], sources: Sequence[Sequence[str]],
+                          threshold: float = LEARNING_SIMILARITY) -> List[Dict[str, object]]:
+    """
+    Merge near-duplicate learnings into one entry each: {"learning": representative,
+    "merged": the other phrasings, "sources": URLs behind any member, first seen first}.
+    `sources` holds the URLs behind each learning.
+    """
+    merged = []
+    for cluster in cluster_learnings(learnings, threshold):
+        urls = [url for member in cluster.members for url in sources[member]]
+        merged.append({
+            "learning": learnings[cluster.representative],
+            "merged": [learnings[i] for i in cluster.members if i != cluster.representative],
+            "sources": list(dict.fromkeys(urls)),
+        })
+    return merged
+
+class LearningIndex:
+    """
+    Term vectors of a growing list of learnings with an inverted index. Each learning is
+    tokenised once, when added, and checking one against earlier ones only touches those
+    sharing a term with it instead of building the whole similarity matrix. Scores are the
+    TF-IDF cosine of similarity_matrix, with IDF over everything indexed so far.
+    """
+    def __init__(self):
+        self.docs: List[Dict[str, float]] = []
+        self.figures: List[FrozenSet[str]] = []
+        self.doc_freq: Counter = Counter()
+        # Term -> indexes of the learnings containing it, ascending
+        self.postings: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, text: str) -> int:
+        terms = _terms(text)
+        index = len(self.docs)
+        doc = {term: 1 + math.log(tf) for term, tf in Counter(terms).items()}
+        self.docs.append(doc)
+        self.figures.append(_figures(terms))
+        for term in doc:
+            self.doc_freq[term] += 1
+            self.postings.setdefault(term, []).append(index)
+        return index
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + len(self.docs)) / (1 + self.doc_freq[term])) + 1
+
+    def _norm(self, doc: Dict[str, float]) -> float:
+        return math.sqrt(sum((tf * self._idf(term)) ** 2 for term, tf in doc.items())) or 1.0
+
+    def is_novel(self, index: int, known: int, threshold: float = LEARNING_SIMILARITY) -> bool:
+        """Whether learning `index` is not a near-duplicate (as cluster_learnings would merge) of any of the first `known`."""
+        doc = self.docs[index]
+        idf = {term: self._idf(term) for term in doc}
+        norm = math.sqrt(sum((tf * idf[term]) ** 2 for term, tf in doc.items())) or 1.0
+        # Per candidate: dot product, and its norm over the shared terms only
+        dots: Dict[int, float] = {}
+        shared: Dict[int, float] = {}
+        for term, tf in doc.items():
+            weight = tf * idf[term]
+            for other in self.postings[term]:
+                if other >= known:
+                    break
+                other_weight = self.docs[other][term] * idf[term]
+                dots[other] = dots.get(other, 0.0) + weight * other_weight
+                shared[other] = shared.get(other, 0.0) + other_weight ** 2
+        for other, dot in dots.items():
+            # The full norm is at least the shared one, so most candidates are ruled out without it
+            if dot < threshold * norm * math.sqrt(shared[other]):
+                continue
+            if not _same_figures(self.figures[index], self.figures[other]):
+                continue
+            if dot / (norm * self._norm(self.docs[other])) >= threshold:
+                return False
+        return True
+
+def novel_learnings(learnings: Sequence[str], known: Sequence[str],
+                    threshold: float = LEARNING_SIMILARITY) -> List[bool]:
+    """Whether each learning is new, i.e. not a near-duplicate of any known one."""
+    index = LearningIndex()
+    for text in list(known) + list(learnings):
+        index.add(text)
+    return [index.is_novel(i, len(known), threshold) for i in range(len(known), len(index))]
@@ -1,26 +1,31 @@
 import asyncio
 import os
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 from ai.ai import generate_object
-from ai.providers import ModelInfo, get_model, trim_prompt, firecrawl_search
+from ai.cassette import get_cassette
+from ai.providers import ModelInfo, get_model, get_stream_model, firecrawl_latency
+from ai.routing import StageModels
+from ai.usage import usage_stage
+from ai.offload import cpu_offload, trim_prompt_async
+from ai.text import count_tokens
 from prompt import system_prompt
 from output_manager import OutputManager
+from page_store import PageStore, get_url
+from search_policy import SearchPolicy
+from consolidate import LEARNING_CONSOLIDATION, LEARNING_SIMILARITY, consolidate_learnings
+from novelty import NoveltyPolicy
+from relevance import ChunkIndex, rank_snippets, score_snippets
+from research_scheduler import ResearchNode, ResearchScheduler
+from research_store import ResearchStore
+from search_backends import SearchBackend, SearchResult, get_search_backend
+from token_budget import content_budget, estimate_tokens, split_budget
 from pydantic import BaseModel
 
 # Use a single shared OutputManager if you like, or have run.py pass in an instance.
 output = OutputManager()
 
-def get_url(item):
-    return (
-            item.get("url") or
-            item.get("metadata", {}).get("sourceURL") or
-            item.get("metadata", {}).get("pageUrl") or
-            item.get("metadata", {}).get("finalUrl") or
-            item.get("metadata", {}).get("url")
-        )
-
 @dataclass
 class ResearchProgress:
     current_depth: int
@@ -30,6 +35,9 @@ class ResearchProgress:
     current_query: Optional[str] = None
     total_queries: int = 0
     completed_queries: int = 0
+    # Scheduler steps waiting for a worker and running, across both pools
+    queued_steps: int = 0
+    running_steps: int = 0
 
 class SerpQuery(BaseModel):
     query: str
@@ -45,7 +53,12 @@ class SerpResultSchema(BaseModel):
 class FinalReportSchema(BaseModel):
     reportMarkdown: str
 
-CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", 2))
+# Most tokens a single page may get in the learnings prompt; the call's budget is split by relevance
+MAX_PAGE_TOKENS = 25000
+# Tokens a page already summarised by another query still gets, so that query keeps some context
+REVISIT_TOKENS = int(os.getenv("REVISIT_TOKENS", 1000))
+# Most tokens the learnings may take up in the final report prompt
+MAX_LEARNINGS_TOKENS = 150_000
 
 async def generate_serp_queries(
     query: str,
@@ -70,31 +83,120 @@ async def generate_serp_queries(
         f"<prompt>{query}</prompt>\n\n{extra}"
     )
 
-    res = await generate_object(
-        model=get_model(model_info),
-        system=system_prompt(),
-        prompt=prompt_text,
-        schema=SerpQueriesSchema
-    )
+    with usage_stage("queries"):
+        res = await generate_object(
+            model=get_model(model_info),
+            system=system_prompt(),
+            prompt=prompt_text,
+            schema=SerpQueriesSchema
+        )
     output.debug(f"Created {len(res['object'].queries)} queries", res["object"].queries)
     return res["object"].queries[:num_queries]
 
-async def process_serp_result(
+def _unvisited(query: str, hits: List[SearchResult], page_store: PageStore) -> List[SearchResult]:
+    """The hits the job has not visited yet; which those are depends on which queries finished first, so it is pinned."""
+    visited = [hit.url for hit in hits if page_store.has_url(hit.url)]
+    visited = get_cassette().decide("visited_urls", {"query": query, "urls": [hit.url for hit in hits]}, visited)
+    return [hit for hit in hits if hit.url not in visited]
+
+async def two_phase_search(
     query: str,
-    result: Dict[str, Any],
-    num_learnings: int = 3,
-    num_follow_up_questions: int = 3,
-    model_info: Optional[ModelInfo] = None
-) -> Any:
-    contents = []
-    for item in result.get("data", []):
-        if "markdown" in item:
-            contents.append(trim_prompt(item["markdown"], 25000))
+    research_goal: str,
+    limit: int,
+    timeout: int,
+    page_store: PageStore,
+    candidate_limit: int,
+    search_backend: Optional[SearchBackend] = None
+) -> Dict[str, Any]:
+    """
+    Search without scraping, rank the hits by snippet relevance to the query and research
+    goal, drop URLs the job has already visited, and scrape only the best `limit` in parallel.
+    """
+    search_backend = search_backend or get_search_backend()
+    hits = await search_backend.search(query, limit=candidate_limit, timeout=timeout, scrape=False)
+    candidates = _unvisited(query, hits, page_store)
+    ranked = rank_snippets(candidates, query, research_goal)
+    selected = [hit for _, hit in ranked[:limit]]
+    output.debug(f"Two-phase search for '{query}': {len(hits)} hits, {len(candidates)} unvisited, scraping {len(selected)}")
 
-    output.debug(f"Ran {query}, found {len(contents)} contents")
+    documents = await asyncio.gather(*(
+        search_backend.scrape(hit.url, timeout=timeout) for hit in selected
+    ))
+    data = [
+        hit.with_content(document)
+        for hit, document in zip(selected, documents)
+        if document is not None and document.markdown
+    ]
+    return {"data": data, "candidates": len(hits), "unvisited": len(candidates)}
 
-    contents_wrapped = "\n".join(f"<content>\n{c}\n</content>" for c in contents)
-    prompt_text = (
+async def streamed_search(
+    query: str,
+    research_goal: str,
+    limit: int,
+    timeout: int,
+    page_store: PageStore,
+    search_policy: SearchPolicy,
+    search_backend: Optional[SearchBackend] = None
+) -> Dict[str, Any]:
+    """
+    Search without scraping, then scrape the hits concurrently and register and trim each page
+    as soon as it arrives, so the slowest site no longer gates the whole batch. Already visited
+    URLs are not scraped again. With two-phase search enabled only the best snippets are scraped.
+    """
+    search_backend = search_backend or get_search_backend()
+    candidate_limit = limit * search_policy.candidate_multiplier if search_policy.two_phase else limit
+    hits = await search_backend.search(query, limit=candidate_limit, timeout=timeout, scrape=False)
+    candidates = _unvisited(query, hits, page_store)
+    if search_policy.two_phase:
+        selected = [hit for _, hit in rank_snippets(candidates, query, research_goal)[:limit]]
+        page_ids = []
+    else:
+        selected = candidates[:limit]
+        page_ids = page_store.add_many(hit for hit in hits[:limit] if hit not in candidates and page_store.has_url(hit.url))
+    output.debug(f"Streaming search for '{query}': {len(hits)} hits, {len(candidates)} unvisited, scraping {len(selected)}")
+
+    data = []
+    async for page in search_backend.scrape_many(
+        selected,
+        timeout=timeout,
+        straggler_factor=search_policy.straggler_factor,
+        straggler_min_fraction=search_policy.straggler_min_fraction,
+        straggler_grace=search_policy.straggler_grace
+    ):
+        page_id = page_store.add(page)
+        if page_id is None:
+            continue
+        # Splitting and indexing a large page is CPU work; do it off the loop while other pages load
+        await page_store.chunk_index(page_id)
+        if page_id not in page_ids:
+            page_ids.append(page_id)
+        data.append(page)
+    return {"data": data, "page_ids": page_ids, "candidates": len(hits), "unvisited": len(candidates)}
+
+async def focus_page(
+    markdown: str,
+    max_tokens: int,
+    texts: List[str],
+    page_store: Optional[PageStore] = None,
+    page_id: Optional[str] = None
+) -> str:
+    """
+    Cut a page to max_tokens by keeping the passages that best match the texts (BM25), in
+    document order, instead of just the top of the page. Pages that fit are returned whole.
+    """
+    if len(markdown) > max_tokens:
+        if page_store is not None and page_id:
+            index = await page_store.chunk_index(page_id)
+        else:
+            index = await cpu_offload.run(len(markdown), ChunkIndex, markdown)
+        markdown = await cpu_offload.run_local(
+            len(markdown), index.select, max_tokens, *texts, count_tokens=count_tokens
+        )
+    # A single passage larger than the budget may still need cutting
+    return await trim_prompt_async(markdown, max_tokens)
+
+def _learnings_prompt(query: str, num_learnings: int, contents_wrapped: str) -> str:
+    return (
         f"Given the following contents from a SERP search for <query>{query}</query>, generate a list of learnings.\n"
         f"Return your result in JSON format with the shape:\n"
         f'{{ "learnings": ["..."], "followUpQuestions": ["..."] }}\n\n'
@@ -103,12 +205,86 @@ async def process_serp_result(
         f"<contents>{contents_wrapped}</contents>"
     )
 
-    res = await generate_object(
-        model=get_model(model_info),
-        system=system_prompt(),
-        prompt=prompt_text,
-        schema=SerpResultSchema
+async def process_serp_result(
+    query: str,
+    result: Dict[str, Any],
+    num_learnings: int = 3,
+    num_follow_up_questions: int = 3,
+    model_info: Optional[ModelInfo] = None,
+    page_store: Optional[PageStore] = None,
+    revisit_tokens: int = 0,
+    research_goal: str = ""
+) -> Any:
+    """
+    Summarise a search result into learnings. With a page_store, the result may reference
+    pages by ID ({"page_ids": [...]}) instead of carrying their markdown, and pages the job
+    has already summarised are skipped (or, if revisit_tokens > 0, cut down to that many tokens).
+
+    The prompt is sized to the model: its context size, less the output reserve and the prompt
+    around the pages, is split across pages by relevance to the query and by length, and each
+    page contributes its passages that best match the query and research goal.
+    """
+    model_info = model_info or ModelInfo()
+    # (search result, markdown, most tokens it may get, page ID)
+    pages = []
+    claimed: List[str] = []
+    if page_store is None:
+        for item in result.get("data", []):
+            markdown = item.markdown if isinstance(item, SearchResult) else item.get("markdown")
+            if markdown:
+                pages.append((item, markdown, MAX_PAGE_TOKENS, None))
+    else:
+        page_ids = result.get("page_ids") or page_store.add_many(result.get("data", []))
+        claimed = page_store.claim(page_ids)
+        # Another node may have claimed a page first; replay makes the recorded run's claims
+        pinned = get_cassette().decide("claimed_pages", {"query": query, "page_ids": page_ids}, claimed)
+        if pinned != claimed:
+            page_store.release(page_id for page_id in claimed if page_id not in pinned)
+            page_store.claim(pinned)
+            claimed = list(pinned)
+        for page_id in page_ids:
+            page = page_store.get(page_id)
+            if not page.markdown:
+                continue
+            if page_id in claimed:
+                pages.append((page, page.markdown, MAX_PAGE_TOKENS, page_id))
+            elif revisit_tokens > 0:
+                pages.append((page, page.markdown, revisit_tokens, page_id))
+        output.debug(f"Ran {query}, {len(page_ids) - len(claimed)} of {len(page_ids)} pages already summarised")
+
+    system = system_prompt()
+    budget = content_budget(model_info, system + _learnings_prompt(query, num_learnings, ""))
+    budgets = split_budget(
+        budget,
+        score_snippets([item for item, _, _, _ in pages], query, research_goal),
+        [min(estimate_tokens(markdown), cap) for _, markdown, cap, _ in pages]
     )
+    output.debug(f"Ran {query}, page budgets {budgets} of {budget} tokens for {model_info.model}")
+    # Each page keeps its passages most relevant to the query; the CPU work runs in the offload pool
+    contents = list(await asyncio.gather(*(
+        focus_page(markdown, tokens, [query, research_goal], page_store, page_id)
+        for (_, markdown, _, page_id), tokens in zip(pages, budgets)
+        if tokens > 0
+    )))
+    output.debug(f"Ran {query}, found {len(contents)} contents")
+    if not contents:
+        return SerpResultSchema(learnings=[], followUpQuestions=[])
+
+    contents_wrapped = "\n".join(f"<content>\n{c}\n</content>" for c in contents)
+    prompt_text = _learnings_prompt(query, num_learnings, contents_wrapped)
+
+    try:
+        with usage_stage("learnings"):
+            res = await generate_object(
+                model=get_model(model_info),
+                system=system,
+                prompt=prompt_text,
+                schema=SerpResultSchema
+            )
+    except Exception:
+        if page_store is not None:
+            page_store.release(claimed)
+        raise
     output.debug(f"Created {len(res['object'].learnings)} learnings", res["object"].learnings)
     return res["object"]
 
@@ -119,12 +295,53 @@ async def deep_research(
     model_info: Optional[ModelInfo] = None,
     learnings: Optional[List[str]] = None,
     visited_urls: Optional[List[Dict]] = None,
-    on_progress: Optional[Callable[[ResearchProgress], None]] = None
+    on_progress: Optional[Callable[[ResearchProgress], None]] = None,
+    page_store: Optional[PageStore] = None,
+    search_policy: Optional[SearchPolicy] = None,
+    search_backend: Optional[SearchBackend] = None,
+    stage_models: Optional[StageModels] = None,
+    scheduler: Optional[ResearchScheduler] = None,
+    store: Optional[ResearchStore] = None,
+    novelty_policy: Optional[NoveltyPolicy] = None
 ) -> Dict[str, Any]:
+    """
+    Research a query breadth-first down to the given depth. Search queries and learnings are
+    generated with the "queries" and "learnings" models of stage_models (model_info, unless
+    MODEL_QUERIES / MODEL_LEARNINGS say otherwise).
+
+    The research tree runs on one scheduler: generating queries and summarising results take
+    "llm" workers, searching and scraping take "search" workers, so the number of steps in
+    flight is fixed by the worker counts instead of growing with breadth and depth.
+    Learnings and visited URLs go into one append-only ResearchStore; nodes hold only IDs.
+    Near-duplicate learnings from different branches are merged at the end (see consolidate),
+    and "learning_sources" lists each kept learning with its merged phrasings and source URLs.
+    With a novelty_policy, branches that stop finding new URLs and learnings are not researched
+    deeper; "pruned_branches" lists those decisions.
+    """
+    if stage_models is None:
+        stage_models = StageModels(model_info)
     if learnings is None:
         learnings = []
     if visited_urls is None:
         visited_urls = []
+    if page_store is None:
+        page_store = PageStore()
+    if search_policy is None:
+        search_policy = SearchPolicy()
+    if search_backend is None:
+        search_backend = get_search_backend()
+    if search_policy.latency is None:
+        search_policy.latency = search_backend.search_latency
+        if search_policy.latency is None:
+            search_policy.latency = firecrawl_latency
+    if search_policy.root_depth is None:
+        search_policy.root_depth = depth
+    if scheduler is None:
+        scheduler = ResearchScheduler()
+    if store is None:
+        store = ResearchStore()
+    if novelty_policy is None:
+        novelty_policy = NoveltyPolicy()
 
     progress = ResearchProgress(
         current_depth=depth,
@@ -138,136 +355,272 @@ async def deep_research(
     def report_progress(update: Dict[str, Any]) -> None:
         for k, v in update.items():
             setattr(progress, k, v)
+        progress.queued_steps = scheduler.queued()
+        progress.running_steps = scheduler.in_flight()
         if on_progress:
             on_progress(progress)
 
-    serp_queries = await generate_serp_queries(query, learnings, num_queries=breadth, model_info=model_info)
-    report_progress({
-        "total_queries": len(serp_queries),
-        "current_query": serp_queries[0].query if serp_queries else None
-    })
+    def fail(node: ResearchNode, error: Exception) -> None:
+        node.state = "failed"
+        node.error = error
+        output.debug(f"Error running {node.kind} step for: {node.query}: {error}")
 
-    loop = asyncio.get_running_loop()
-    sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
+    # Lower priorities run first: finishing deep branches keeps the frontier small
+    def expand(node: ResearchNode) -> Callable[[], Awaitable[None]]:
+        async def step() -> None:
+            node.state = "running"
+            branch_learnings = store.get_learnings(
+                learning_id for ancestor in scheduler.lineage(node.id) for learning_id in ancestor.learning_ids
+            )
+            try:
+                serp_queries = await generate_serp_queries(
+                    node.query, branch_learnings, num_queries=node.breadth, model_info=stage_models["queries"]
+                )
+            except Exception as e:
+                fail(node, e)
+                return
+            node.state = "done"
+            for serp_query in serp_queries:
+                child = scheduler.add_node(
+                    "search", serp_query.query, node.depth, node.breadth, research_goal=serp_query.researchGoal,
+                    parent=node.id
+                )
+                scheduler.submit("search", search(child), priority=child.depth)
+            report_progress({
+                "total_queries": progress.total_queries + len(serp_queries),
+                "current_query": serp_queries[0].query if serp_queries else progress.current_query
+            })
+        return step
 
-    async def process_query(serpQ: SerpQuery) -> Dict[str, Any]:
-        async with sem:
+    def search(node: ResearchNode) -> Callable[[], Awaitable[None]]:
+        async def step() -> None:
+            node.state = "running"
             try:
-                output.debug(f"Processing SERP query: {serpQ}")
-                result = await loop.run_in_executor(
-                    None,
-                    lambda: firecrawl_search(
-                        serpQ.query,
-                        timeout=15000,
-                        limit=5,
+                output.debug(f"Processing SERP query: {node.query}")
+                limit, timeout = search_policy.choose(node.depth)
+                # The adaptive limit follows the yield of whichever queries finished first
+                limit = get_cassette().decide("search_limit", {"query": node.query, "depth": node.depth}, limit)
+                output.debug(f"Search policy for '{node.query}': limit={limit}, timeout={timeout}")
+                if search_policy.streaming:
+                    result = await streamed_search(
+                        node.query,
+                        node.research_goal,
+                        limit=limit,
+                        timeout=timeout,
+                        page_store=page_store,
+                        search_policy=search_policy,
+                        search_backend=search_backend
                     )
-                )
-                output.debug(f"Search results received for query '{serpQ.query}': {result}")
+                elif search_policy.two_phase:
+                    result = await two_phase_search(
+                        node.query,
+                        node.research_goal,
+                        limit=limit,
+                        timeout=timeout,
+                        page_store=page_store,
+                        candidate_limit=limit * search_policy.candidate_multiplier,
+                        search_backend=search_backend
+                    )
+                else:
+                    result = {"data": await search_backend.search(node.query, limit=limit, timeout=timeout)}
+                output.debug(f"Search results received for query '{node.query}': {result}")
                 if not result.get("data"):
-                    output.debug(f"No results found for query: {serpQ.query}")
-                    # Return already collected URLs instead of empty list
-                    return {"learnings": learnings, "visited_urls": visited_urls}
+                    output.debug(f"No results found for query: {node.query}")
+                    node.state = "done"
+                    finish_query(node)
+                    return
 
+                # Reference pages by ID from here on; the markdown itself stays in the page store
+                known_pages = len(page_store.pages)
+                page_ids = result.get("page_ids") or page_store.add_many(result.get("data", []))
+                node.hits = result.get("candidates", len(result["data"]))
+                node.unvisited_hits = result.get("unvisited", len(page_store.pages) - known_pages)
+                search_policy.record(node.hits, node.unvisited_hits)
+            except Exception as e:
+                fail(node, e)
+                finish_query(node)
+                return
+            scheduler.submit("llm", learn(node, page_ids), priority=node.depth)
+        return step
+
+    def learn(node: ResearchNode, page_ids: List[int]) -> Callable[[], Awaitable[None]]:
+        async def step() -> None:
+            try:
                 new_learnings_obj = await process_serp_result(
-                    serpQ.query,
-                    result,
-                    num_learnings=breadth // 2,
-                    num_follow_up_questions=breadth // 2,
-                    model_info=model_info
+                    node.query,
+                    {"page_ids": page_ids},
+                    num_learnings=node.breadth // 2,
+                    num_follow_up_questions=node.breadth // 2,
+                    model_info=stage_models["learnings"],
+                    page_store=page_store,
+                    revisit_tokens=REVISIT_TOKENS,
+                    research_goal=node.research_goal
                 )
-                new_urls = []
-                for item in result.get("data", []):
-                    if get_url(item):
-                        new_urls.append(item)
-                
-                output.debug(f"Found {len(new_urls)} new URLs for query: {serpQ.query}")
-                output.debug(f"First new URL item: {new_urls[0] if new_urls else 'None'}")
-
-                all_learnings = learnings + new_learnings_obj.learnings
-                all_urls = visited_urls + new_urls
-                output.debug(f"Total URLs after adding new ones: {len(all_urls)}")
-                new_depth = depth - 1
-                if new_depth > 0:
-                    output.debug(f"Researching deeper, breadth: {breadth // 2}, depth: {new_depth}")
-                    report_progress({
-                        "current_depth": new_depth,
-                        "current_breadth": breadth // 2,
-                        "completed_queries": progress.completed_queries + 1,
-                        "current_query": serpQ.query,
-                    })
-                    next_query = (
-                        f"Previous research goal: {serpQ.researchGoal}\n"
-                        f"Follow-up research directions: {chr(10).join(new_learnings_obj.followUpQuestions)}"
-                    ).strip()
-                    return await deep_research(
-                        query=next_query,
-                        breadth=breadth // 2,
-                        depth=new_depth,
-                        model_info=model_info,
-                        learnings=all_learnings,
-                        visited_urls=all_urls,
-                        on_progress=on_progress
-                    )
-                else:
-                    report_progress({
-                        "current_depth": 0,
-                        "completed_queries": progress.completed_queries + 1,
-                        "current_query": serpQ.query,
-                    })
-                    return {"learnings": all_learnings, "visited_urls": all_urls}
             except Exception as e:
-                output.debug(f"Error running query: {serpQ.query}: {e}")
-                # Return already collected URLs instead of empty list
-                return {"learnings": learnings, "visited_urls": visited_urls}
-
-    tasks = [process_query(q) for q in serp_queries]
-    results = await asyncio.gather(*tasks)
-
-    # Use a list comprehension for learnings to remove duplicates (they're strings)
-    final_learnings = list({l for r in results for l in r["learnings"]})
-    
-    # For URLs, don't use a set as it might lose information due to dictionary equality
-    # Instead, keep track of seen URLs by their actual URL string to avoid duplicates
-    seen_urls = set()
-    final_urls = []
-    for result in results:
-        for url_item in result.get("visited_urls", []):
-            url_string = get_url(url_item)
-            if url_string and url_string not in seen_urls:
-                seen_urls.add(url_string)
-                final_urls.append(url_item)
-    
+                fail(node, e)
+                finish_query(node)
+                return
+            known_learnings = len(store.learnings)
+            node.learning_ids = store.add_learnings(new_learnings_obj.learnings, node.id)
+            node.follow_up_questions = list(new_learnings_obj.followUpQuestions)
+            node.url_ids = store.add_urls(
+                (page_store.reference(page_id) for page_id in page_ids if get_url(page_store.get(page_id))),
+                node.id
+            )
+            node.state = "done"
+            output.debug(f"Found {len(node.url_ids)} new URLs for query: {node.query}")
+
+            new_depth = node.depth - 1
+            if new_depth > 0 and node.learning_ids and novelty_policy.enabled:
+                node.pruned = saturated(node, known_learnings)
+            if new_depth > 0 and not node.learning_ids:
+                # Follow-ups from a query that learned nothing would start from empty context
+                output.debug(f"No learnings for '{node.query}', not researching deeper")
+            elif new_depth > 0 and not node.pruned:
+                output.debug(f"Researching deeper, breadth: {node.breadth // 2}, depth: {new_depth}")
+                next_query = (
+                    f"Previous research goal: {node.research_goal}\n"
+                    f"Follow-up research directions: {chr(10).join(node.follow_up_questions)}"
+                ).strip()
+                child = scheduler.add_node("expand", next_query, new_depth, node.breadth // 2, parent=node.id)
+                scheduler.submit("llm", expand(child), priority=child.depth)
+            finish_query(node, new_depth)
+        return step
+
+    def saturated(node: ResearchNode, known_learnings: int) -> bool:
+        """
+        Whether the node found too little the job did not know. Learning IDs below `known_learnings`
+        were there before it; URL novelty is measured on the search hits, since two-phase and
+        streamed searches never scrape the visited ones.
+        """
+        fresh = [i for i in node.learning_ids if i >= known_learnings]
+        if fresh and known_learnings and novelty_policy.min_new_learnings > 0:
+            # Only the known learnings sharing a term with a fresh one are scored
+            index = store.learning_index()
+            new_learnings = sum(index.is_novel(i, known_learnings, novelty_policy.similarity) for i in fresh)
+        else:
+            new_learnings = len(fresh)
+        decision = novelty_policy.assess(
+            node.query, node.depth,
+            urls=node.hits, new_urls=node.unvisited_hits,
+            learnings=len(node.learning_ids), new_learnings=new_learnings
+        )
+        if decision["pruned"]:
+            output.debug(f"Pruning follow-up research for '{node.query}': {decision}")
+        return decision["pruned"]
+
+    def finish_query(node: ResearchNode, new_depth: int = 0) -> None:
+        report_progress({
+            "current_depth": new_depth,
+            "current_breadth": node.breadth // 2 if new_depth > 0 else progress.current_breadth,
+            "completed_queries": progress.completed_queries + 1,
+            "current_query": node.query,
+        })
+
+    root = scheduler.add_node("expand", query, depth, breadth)
+    root.learning_ids = store.add_learnings(learnings, root.id)
+    root.url_ids = store.add_urls(visited_urls, root.id)
+    scheduler.submit("llm", expand(root), priority=depth)
+    await scheduler.run()
+    if root.state == "failed":
+        raise root.error
+
+    # Collect learnings and URLs in tree order (each query before its follow-ups), so prompts
+    # built from them are reproducible; duplicates keep their first position
+    nodes = list(scheduler.walk(root.id))
+    learning_ids = list(dict.fromkeys(learning_id for node in nodes for learning_id in node.learning_ids))
+    final_urls = store.get_urls(url_id for node in nodes for url_id in node.url_ids)
+
+    # The URLs behind each learning: those found by every node that produced it
+    sources: Dict[int, List[str]] = {}
+    for node in nodes:
+        urls = [get_url(store.urls[url_id]) for url_id in node.url_ids]
+        for learning_id in node.learning_ids:
+            sources.setdefault(learning_id, []).extend(urls)
+    texts = store.get_learnings(learning_ids)
+    learning_sources = [sources.get(learning_id, []) for learning_id in learning_ids]
+    if LEARNING_CONSOLIDATION and len(texts) > 1:
+        consolidated = await cpu_offload.run(
+            sum(len(text) for text in texts), consolidate_learnings, texts, learning_sources, LEARNING_SIMILARITY
+        )
+        output.debug(f"Consolidated {len(texts)} learnings into {len(consolidated)}")
+    else:
+        consolidated = [
+            {"learning": text, "merged": [], "sources": list(dict.fromkeys(urls))}
+            for text, urls in zip(texts, learning_sources)
+        ]
+    final_learnings = [entry["learning"] for entry in consolidated]
+
     output.debug(f"deep_research final URLs count: {len(final_urls)}")
     output.debug(f"deep_research first URL item: {final_urls[0] if final_urls else 'None'}")
-    
-    return {"learnings": final_learnings, "visited_urls": final_urls}
+    output.debug(f"deep_research scheduler: {scheduler.stats()}")
+
+    return {
+        "learnings": final_learnings,
+        "visited_urls": final_urls,
+        "learning_sources": consolidated,
+        "pruned_branches": novelty_policy.pruned(),
+    }
+
+def _sources_section(visited_urls: List[Dict]) -> str:
+    if not visited_urls:
+        return ""
+    return "\n\n## Sources\n\n" + "\n".join(f"- {get_url(u)}" for u in visited_urls)
 
 async def write_final_report(
     prompt: str,
     learnings: List[str],
     visited_urls: List[Dict],
-    model_info: Optional[ModelInfo] = None
+    model_info: Optional[ModelInfo] = None,
+    on_chunk: Optional[Callable[[str], Any]] = None
 ) -> str:
-    learnings_wrapped = "\n".join(f"<learning>\n{l}\n</learning>" for l in learnings)
-    trimmed_learnings = trim_prompt(learnings_wrapped, 150_000)
-    full_prompt = (
+    """
+    Write the final report. With on_chunk the report is streamed as plain Markdown and every
+    chunk is passed to on_chunk (sync or async) as soon as the model produces it, sources last.
+    """
+    model_info = model_info or ModelInfo()
+    if on_chunk is None:
+        output_format = (
+            f"Return your result in JSON format with the following structure:\n"
+            f'{{ "reportMarkdown": <your report markdown> }}.\n\n'
+        )
+    else:
+        output_format = "Write the report directly in Markdown, without wrapping it in JSON or a code block.\n\n"
+    instructions = (
         f"Given the following prompt from the user, write a final report on the topic using the learnings from research. "
         f"Make it as detailed as possible, aim for 3 or more pages, and include ALL the learnings from research. "
-        f"Return your result in JSON format with the following structure:\n"
-        f'{{ "reportMarkdown": <your report markdown> }}.\n\n'
+        f"{output_format}"
         f"<prompt>{prompt}</prompt>\n\n"
         f"Here are all the learnings from previous research:\n\n"
-        f"<learnings>\n{trimmed_learnings}\n</learnings>"
     )
-    res = await generate_object(
-        model=get_model(model_info),
-        system=system_prompt(),
-        prompt=full_prompt,
-        schema=FinalReportSchema
-    )
-    report = res["object"].reportMarkdown
-    if visited_urls:
-        sources_section = "\n\n## Sources\n\n" + "\n".join(f"- {get_url(u)}" for u in visited_urls)
-    else:
-        sources_section = ""
-    return report + sources_section
+    system = system_prompt()
+    learnings_wrapped = "\n".join(f"<learning>\n{l}\n</learning>" for l in learnings)
+    # Learnings get whatever the model's context leaves after the instructions and the report itself
+    learnings_budget = min(MAX_LEARNINGS_TOKENS, content_budget(model_info, system + instructions, cap=0))
+    trimmed_learnings = await trim_prompt_async(learnings_wrapped, learnings_budget)
+    full_prompt = f"{instructions}<learnings>\n{trimmed_learnings}\n</learnings>"
+    if on_chunk is None:
+        with usage_stage("report"):
+            res = await generate_object(
+                model=get_model(model_info),
+                system=system,
+                prompt=full_prompt,
+                schema=FinalReportSchema
+            )
+        return res["object"].reportMarkdown + _sources_section(visited_urls)
+
+    chunks = []
+
+    async def emit(text: str) -> None:
+        chunks.append(text)
+        result = on_chunk(text)
+        if asyncio.iscoroutine(result):
+            await result
+
+    with usage_stage("report"):
+        async for chunk in get_stream_model(model_info)(full_prompt, system=system):
+            await emit(chunk)
+    sources = _sources_section(visited_urls)
+    if sources:
+        await emit(sources)
+    return "".join(chunks)
@@ -88,7 +88,17 @@ API_DOCS_HTML = """
   "breadth": 4,                 // Optional: Number of search queries per iteration (default: 4)
   "depth": 2,                   // Optional: Number of recursive exploration iterations (default: 2)
   "model": "string",            // Optional: LLM model to use (e.g., "o3-mini", "chatgpt-4o-latest")
-  "model_params": {}            // Optional: Additional parameters for the LLM
+  "model_params": {},           // Optional: Additional parameters for the LLM
+  "search_limit": 5,            // Optional: Pin results per search query (adaptive by default)
+  "search_timeout": 15000,      // Optional: Pin the search timeout in ms (adaptive by default)
+  "two_phase_search": false,    // Optional: Rank snippets first and scrape only the best hits
+  "stream_search": false,       // Optional: Process pages as they arrive and drop stragglers
+  "bypass_cache": false,        // Optional: Always call the model instead of reusing cached answers
+  "stage_models": {             // Optional: Models per stage (feedback, queries, learnings, report)
+    "queries": "gpt-4o-mini"
+  },
+  "min_new_urls": 0.2,          // Optional: Stop branches where fewer of the URLs are new (0 = off)
+  "min_new_learnings": 0.3      // Optional: Stop branches where fewer of the learnings are new (0 = off)
 }</code></pre>
         
         <h4>Response</h4>
@@ -152,7 +162,9 @@ API_DOCS_HTML = """
         
         <h4>Response (in progress)</h4>
         <pre><code>{
-  "status": "running"           // Current status of the research
+  "status": "running",          // Current status of the research
+  "scheduler": {...},           // Queued/running steps per worker pool, while researching
+  "partial_report": "..."       // Report written so far, once writing has started
 }</code></pre>
         
         <h4>Response (completed)</h4>
@@ -161,11 +173,52 @@ API_DOCS_HTML = """
   "results": {
     "prompt": "Combined query with answers",
     "report": "Markdown report content",
-    "sources": ["URL 1", "URL 2", "..."]
+    "sources": ["URL 1", "URL 2", "..."],
+    "learnings": [              // Near-duplicates merged, with the URLs behind each
+      {"learning": "...", "merged": ["..."], "sources": ["URL 1"]}
+    ],
+    "novelty": {                // Branches not researched deeper for finding too little new
+      "min_new_urls": 0.2, "min_new_learnings": 0.3, "assessed": 12,
+      "pruned": [{"query": "...", "depth": 2, "url_novelty": 0.0, "learning_novelty": 0.25, "...": "..."}]
+    }
   }
 }</code></pre>
     </div>
 
+    <div class="endpoint">
+        <h3><span class="method get">GET</span>/research/stream</h3>
+        <p>Stream the final report as Server-Sent Events while it is being written. Chunks written before the client connected are sent first.</p>
+        
+        <h4>Query Parameters</h4>
+        <table>
+            <tr>
+                <th>Parameter</th>
+                <th>Type</th>
+                <th>Description</th>
+                <th>Required</th>
+            </tr>
+            <tr>
+                <td>user_id</td>
+                <td>string</td>
+                <td>Unique identifier for the user</td>
+                <td>Yes</td>
+            </tr>
+            <tr>
+                <td>job_id</td>
+                <td>string</td>
+                <td>Unique identifier for the research session</td>
+                <td>Yes</td>
+            </tr>
+        </table>
+        
+        <h4>Events</h4>
+        <pre><code>event: chunk
+data: {"text": "## Introduction\n..."}   // Next piece of the report markdown
+
+event: done
+data: {"status": "completed"}           // Sent once, when the job finishes</code></pre>
+    </div>
+
     <div class="endpoint">
         <h3><span class="method get">GET</span>/research/cancel</h3>
         <p>Cancel a running research session.</p>
@@ -237,6 +290,7 @@ API_DOCS_HTML = """
     <p>A research session can have the following status values:</p>
     <ul>
         <li><strong>pending_answers</strong>: Waiting for answers to follow-up questions</li>
+        <li><strong>queued</strong>: Waiting for a job slot (when <code>RESEARCH_MAX_JOBS</code> jobs are already running)</li>
         <li><strong>running</strong>: Research is in progress</li>
         <li><strong>completed</strong>: Research is complete and results are available</li>
         <li><strong>cancelled</strong>: Research was cancelled by the user</li>
@@ -1,6 +1,7 @@
 from ai.ai import generate_object
 from prompt import system_prompt
 from ai.providers import ModelInfo, get_model
+from ai.usage import usage_stage
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -17,10 +18,11 @@ async def generate_feedback(query: str, num_questions: int = 5, model_info: Opti
         f"<query>{query}</query>"
     )
 
-    result = await generate_object(
-        model=get_model(model_info),
-        system=system_prompt(),
-        prompt=prompt_text,
-        schema=FeedbackSchema
-    )
+    with usage_stage("feedback"):
+        result = await generate_object(
+            model=get_model(model_info),
+            system=system_prompt(),
+            prompt=prompt_text,
+            schema=FeedbackSchema
+        )
     return result["object"].questions[:num_questions]
@@ -0,0 +1,64 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from consolidate import LEARNING_SIMILARITY
+
+# Prune a branch's follow-up research when less than this share of its URLs / learnings was
+# new to the job (0 disables the measure; by default nothing is pruned)
+NOVELTY_MIN_URLS = float(os.getenv("NOVELTY_MIN_URLS", 0))
+NOVELTY_MIN_LEARNINGS = float(os.getenv("NOVELTY_MIN_LEARNINGS", 0))
+
+@dataclass
+class NoveltyPolicy:
+    """
+    Stops research branches that have saturated. After each search node that would research
+    deeper, `assess` takes the share of its URLs the job had not visited and the share of its
+    learnings that are not near-duplicates (TF-IDF cosine at `similarity` or more) of known
+    ones. When every enabled share is below its minimum, the node's descendants are pruned.
+
+    `decisions` keeps every assessment, pruned or not, in the order they were made.
+    """
+    min_new_urls: float = NOVELTY_MIN_URLS
+    min_new_learnings: float = NOVELTY_MIN_LEARNINGS
+    similarity: float = LEARNING_SIMILARITY
+    decisions: list = field(default_factory=list)
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_new_urls > 0 or self.min_new_learnings > 0
+
+    def assess(self, query: str, depth: int, urls: int, new_urls: int,
+               learnings: int, new_learnings: int) -> Dict[str, Any]:
+        """Decide whether to prune below a node that has `depth` levels left; nothing found counts as nothing new."""
+        url_novelty = new_urls / urls if urls else 0.0
+        learning_novelty = new_learnings / learnings if learnings else 0.0
+        low = []
+        if self.min_new_urls > 0:
+            low.append(url_novelty < self.min_new_urls)
+        if self.min_new_learnings > 0:
+            low.append(learning_novelty < self.min_new_learnings)
+        decision = {
+            "query": query,
+            "depth": depth,
+            "urls": urls,
+            "new_urls": new_urls,
+            "url_novelty": round(url_novelty, 3),
+            "learnings": learnings,
+            "new_learnings": new_learnings,
+            "learning_novelty": round(learning_novelty, 3),
+            "pruned": bool(low) and all(low),
+        }
+        self.decisions.append(decision)
+        return decision
+
+    def pruned(self) -> List[Dict[str, Any]]:
+        return [decision for decision in self.decisions if decision["pruned"]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "min_new_urls": self.min_new_urls,
+            "min_new_learnings": self.min_new_learnings,
+            "assessed": len(self.decisions),
+            "pruned": self.pruned(),
+        }
@@ -0,0 +1,136 @@
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from ai.offload import cpu_offload
+from relevance import ChunkIndex
+from search_backends import SearchResult
+
+# Query parameters that never change the page content
+TRACKING_PARAMS = {"fbclid", "gclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src"}
+
+def get_url(item):
+    if isinstance(item, SearchResult):
+        return item.url
+    return (
+            item.get("url") or
+            item.get("metadata", {}).get("sourceURL") or
+            item.get("metadata", {}).get("pageUrl") or
+            item.get("metadata", {}).get("finalUrl") or
+            item.get("metadata", {}).get("url")
+        )
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL so trivially different links to the same page compare equal."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "https"
+    if scheme == "http":
+        scheme = "https"
+    netloc = parts.netloc.lower()
+    if netloc.startswith("www."):
+        netloc = netloc[4:]
+    if netloc.endswith(":443") or netloc.endswith(":80"):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class PageStore:
+    """
+    Per-job store of scraped pages, keyed by canonical URL and content hash.
+    Each document is held once no matter how many queries return it; search results refer
+    to pages by ID, and the store remembers which pages have already been summarised.
+    """
+    def __init__(self):
+        self.pages: Dict[str, SearchResult] = {}
+        self._url_index: Dict[str, str] = {}
+        self._summarised: Set[str] = set()
+        self._chunk_indexes: Dict[str, ChunkIndex] = {}
+        self.duplicates = 0
+
+    def add(self, item: Union[SearchResult, Dict[str, Any]]) -> Optional[str]:
+        """Register a search result and return its page ID (None if it has no URL)."""
+        result = item if isinstance(item, SearchResult) else SearchResult.from_firecrawl(item)
+        if result is None:
+            return None
+        canonical = canonical_url(result.url)
+        if canonical in self._url_index:
+            page_id = self._url_index[canonical]
+            page = self.pages[page_id]
+            if result.markdown and not page.markdown:
+                # First sighting was a snippet only; keep the content now that we have it
+                page.markdown = result.markdown
+                page.metadata = {**page.metadata, **result.metadata}
+                self._chunk_indexes.pop(page_id, None)
+            else:
+                self.duplicates += 1
+            return page_id
+
+        # Pages with identical content (mirrors, redirects) collapse onto one ID
+        page_id = content_hash(result.markdown or canonical)[:16]
+        if page_id in self.pages:
+            self.duplicates += 1
+        else:
+            self.pages[page_id] = result
+        self._url_index[canonical] = page_id
+        return page_id
+
+    def add_many(self, items: Iterable[Union[SearchResult, Dict[str, Any]]]) -> List[str]:
+        """Register items and return their page IDs in order, without repeats."""
+        page_ids: List[str] = []
+        for item in items:
+            page_id = self.add(item)
+            if page_id and page_id not in page_ids:
+                page_ids.append(page_id)
+        return page_ids
+
+    def has_url(self, url: str) -> bool:
+        return canonical_url(url) in self._url_index
+
+    def get(self, page_id: str) -> SearchResult:
+        return self.pages[page_id]
+
+    def markdown(self, page_id: str) -> str:
+        return self.pages[page_id].markdown
+
+    async def chunk_index(self, page_id: str) -> ChunkIndex:
+        """The page split into ranked-ready passages; built once (off the event loop when large)."""
+        if page_id not in self._chunk_indexes:
+            markdown = self.pages[page_id].markdown
+            self._chunk_indexes[page_id] = await cpu_offload.run(len(markdown), ChunkIndex, markdown)
+        return self._chunk_indexes[page_id]
+
+    def reference(self, page_id: str) -> Dict[str, Any]:
+        """Lightweight copy of a page (metadata only) for visited_urls and API sources."""
+        return {**self.pages[page_id].to_dict(include_markdown=False), "page_id": page_id}
+
+    def is_summarised(self, page_id: str) -> bool:
+        return page_id in self._summarised
+
+    def claim(self, page_ids: Iterable[str]) -> List[str]:
+        """Mark pages as summarised and return the ones that were not already claimed."""
+        claimed = []
+        for page_id in page_ids:
+            if page_id not in self._summarised:
+                self._summarised.add(page_id)
+                claimed.append(page_id)
+        return claimed
+
+    def release(self, page_ids: Iterable[str]) -> None:
+        """Undo a claim, e.g. when the summarisation call failed."""
+        self._summarised.difference_update(page_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pages": len(self.pages),
+            "urls": len(self._url_index),
+            "duplicates": self.duplicates,
+            "summarised": len(self._summarised),
+            "markdown_chars": sum(len(p.markdown) for p in self.pages.values()),
+        }
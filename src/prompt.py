@@ -1,7 +1,26 @@
+import os
 from datetime import datetime
 
-def system_prompt() -> str:
-    now = datetime.now().isoformat()
+# How precisely "Today is ..." is stated. Coarser values keep the prompt byte-identical for
+# longer, so the LLM response cache and provider prompt caches can hit.
+SYSTEM_PROMPT_TIME_GRANULARITY = os.getenv("SYSTEM_PROMPT_TIME_GRANULARITY", "day")
+
+TIME_FORMATS = {
+    "day": "%Y-%m-%d",
+    "hour": "%Y-%m-%dT%H:00",
+    "minute": "%Y-%m-%dT%H:%M",
+    "second": "%Y-%m-%dT%H:%M:%S",
+}
+
+def current_time(granularity: str = None) -> str:
+    granularity = granularity or SYSTEM_PROMPT_TIME_GRANULARITY
+    now = datetime.now()
+    if granularity in TIME_FORMATS:
+        return now.strftime(TIME_FORMATS[granularity])
+    return now.isoformat()
+
+def system_prompt(granularity: str = None) -> str:
+    now = current_time(granularity)
     return f"""You are an expert researcher. Today is {now}. Follow these instructions when responding:
   - You may be asked to research subjects that is after your knowledge cutoff, assume the user is right when presented with news.
   - The user is a highly experienced analyst, no need to simplify it, be as detailed as possible and make sure your response is correct.
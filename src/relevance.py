@@ -0,0 +1,160 @@
+import math
+import re
+from collections import Counter
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# Target passage size when splitting pages for ranking (about 300-400 tokens)
+CHUNK_CHARS = 1500
+# Average characters per token, for fitting passages into a token budget before exact trimming
+CHARS_PER_TOKEN = 4
+# Placed where passages were left out, so the model knows the text is not contiguous
+GAP_MARKER = "[...]"
+# Allowance for the separator and a possible gap marker next to each selected passage
+PASSAGE_JOIN_TOKENS = 4
+# Passages in a row that may fail to fit before selection gives up on filling the last gap
+SELECT_MAX_MISSES = 20
+
+# Common words that say nothing about relevance
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how in is it its of on or that the this to was
+were what when where which who why will with about into than then there these those their
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+def score_snippet(query_terms: Counter, title: str, description: str) -> float:
+    """Overlap between query terms and a search snippet; title matches count double."""
+    title_terms = set(tokenize(title))
+    description_terms = set(tokenize(description))
+    if not title_terms and not description_terms:
+        return 0.0
+    score = 0.0
+    for term, weight in query_terms.items():
+        if term in title_terms:
+            score += 2 * weight
+        if term in description_terms:
+            score += weight
+    # Mild length normalisation so long keyword-stuffed snippets do not always win
+    return score / math.sqrt(len(title_terms) + len(description_terms))
+
+def _field(item: Any, name: str) -> str:
+    value = item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+    return value or ""
+
+def score_snippets(items: Sequence[Any], *texts: str) -> List[float]:
+    """Relevance of each SERP hit (dict or SearchResult with title/description) to the texts, in order."""
+    query_terms = Counter(t for text in texts for t in tokenize(text or ""))
+    return [score_snippet(query_terms, _field(item, "title"), _field(item, "description")) for item in items]
+
+def rank_snippets(items: Sequence[Any], *texts: str) -> List[Tuple[float, Any]]:
+    """Rank SERP hits (dicts or SearchResults with title/description) by relevance to the texts, best first."""
+    scored = list(zip(score_snippets(items, *texts), items))
+    # Stable sort keeps the search engine's own order between equal scores
+    return sorted(scored, key=lambda pair: pair[0], reverse=True)
+
+def _cut_long_block(block: str, chunk_chars: int) -> List[str]:
+    """Cut an oversized paragraph at line or sentence breaks, or hard at chunk_chars if there are none."""
+    pieces = []
+    while len(block) > chunk_chars:
+        cut = max(block.rfind("\n", 0, chunk_chars), block.rfind(". ", 0, chunk_chars) + 1)
+        if cut < chunk_chars // 4:
+            cut = chunk_chars
+        pieces.append(block[:cut].strip())
+        block = block[cut:].strip()
+    if block:
+        pieces.append(block)
+    return pieces
+
+def split_chunks(text: str, chunk_chars: int = CHUNK_CHARS) -> List[str]:
+    """Split markdown into passages of up to about chunk_chars, merging short paragraphs."""
+    chunks: List[str] = []
+    current = ""
+    for block in PARAGRAPH_RE.split(text or ""):
+        block = block.strip()
+        if not block:
+            continue
+        for piece in _cut_long_block(block, chunk_chars):
+            if current and len(current) + len(piece) + 2 > chunk_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+class ChunkIndex:
+    """
+    A page split into passages with the term counts BM25 needs. Building it is the expensive
+    part and does not depend on the query, so it is done once per page; scoring it against a
+    query is a few NumPy operations over an (passages x query terms) frequency array.
+    """
+    def __init__(self, text: str, chunk_chars: int = CHUNK_CHARS):
+        self.chunks = split_chunks(text, chunk_chars)
+        self.counts = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self.lengths = np.array([sum(counts.values()) for counts in self.counts], dtype=float)
+        self.doc_freq = Counter(term for counts in self.counts for term in counts)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def scores(self, *texts: str, k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+        """BM25 score of every passage against the terms of the texts (repeated terms weigh more)."""
+        query_terms = Counter(t for text in texts for t in tokenize(text or ""))
+        if not query_terms or not self.chunks:
+            return np.zeros(len(self.chunks))
+        terms = list(query_terms)
+        tf = np.array([[counts.get(term, 0) for term in terms] for counts in self.counts], dtype=float)
+        df = np.array([self.doc_freq.get(term, 0) for term in terms], dtype=float)
+        idf = np.log((len(self.chunks) - df + 0.5) / (df + 0.5) + 1.0)
+        weights = idf * np.array([query_terms[term] for term in terms], dtype=float)
+        norm = k1 * (1 - b + b * self.lengths / (self.lengths.mean() or 1.0))
+        return (tf * (k1 + 1) / (tf + norm[:, None])) @ weights
+
+    def select(self, max_tokens: int, *texts: str,
+               count_tokens: Optional[Callable[[str], int]] = None) -> str:
+        """
+        The best-scoring passages that fit in max_tokens, in document order, with a gap marker
+        where passages were skipped. Without any matching terms this is the top of the page.
+        Sizes are estimated from characters unless count_tokens is given, which is then only
+        called for the passages considered, not the whole page.
+        """
+        estimates = np.array([len(chunk) for chunk in self.chunks]) / CHARS_PER_TOKEN + PASSAGE_JOIN_TOKENS
+        if count_tokens is None and estimates.sum() <= max_tokens:
+            return "\n\n".join(self.chunks)
+        # A stable sort keeps document order between equal scores
+        order = np.argsort(-self.scores(*texts), kind="stable")
+        smallest = estimates.min() if len(estimates) else 0
+        chosen, used, misses = [], 0.0, 0
+        for i in order:
+            # Stop once nothing can fit, or once passages keep turning out too big to be worth counting
+            if max_tokens - used < smallest or misses >= SELECT_MAX_MISSES:
+                break
+            size = count_tokens(self.chunks[i]) + PASSAGE_JOIN_TOKENS if count_tokens else estimates[i]
+            if used + size <= max_tokens:
+                chosen.append(int(i))
+                used += size
+                misses = 0
+            else:
+                misses += 1
+        if not chosen:
+            if not self.chunks:
+                return ""
+            # Budget below one passage: take the best one and let the caller trim it
+            chosen = [int(order[0])]
+        if len(chosen) == len(self.chunks):
+            return "\n\n".join(self.chunks)
+        parts, previous = [], -1
+        for i in sorted(chosen):
+            if i != previous + 1:
+                parts.append(GAP_MARKER)
+            parts.append(self.chunks[i])
+            previous = i
+        if previous != len(self.chunks) - 1:
+            parts.append(GAP_MARKER)
+        return "\n\n".join(parts)
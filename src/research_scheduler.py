@@ -0,0 +1,312 @@
+import asyncio
+import itertools
+import os
+import time
+import traceback
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from ai.latency import LatencyTracker
+
+CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", 2))
+# Workers per job for searching/scraping and for model calls; together they bound a job's concurrency
+RESEARCH_SEARCH_WORKERS = int(os.getenv("RESEARCH_SEARCH_WORKERS", CONCURRENCY_LIMIT))
+RESEARCH_LLM_WORKERS = int(os.getenv("RESEARCH_LLM_WORKERS", CONCURRENCY_LIMIT))
+# Steps in flight across every job in the process, per pool, and jobs researching at once (0 = no limit)
+RESEARCH_SEARCH_BUDGET = int(os.getenv("RESEARCH_SEARCH_BUDGET", 8))
+RESEARCH_LLM_BUDGET = int(os.getenv("RESEARCH_LLM_BUDGET", 8))
+RESEARCH_MAX_JOBS = int(os.getenv("RESEARCH_MAX_JOBS", 0))
+# Fair-share weights by user_id, e.g. "batch=1,interactive=3"; unlisted users weigh 1
+RESEARCH_USER_WEIGHTS = os.getenv("RESEARCH_USER_WEIGHTS", "")
+
+POOLS = ("search", "llm")
+
+@dataclass
+class ResearchNode:
+    """
+    One node of a research tree. An "expand" node asks the model for search queries; a
+    "search" node runs one of those queries and summarises what it found. `learning_ids` and
+    `url_ids` point into the job's ResearchStore at what this node added; what a branch knows
+    is the union along its lineage.
+    """
+    id: int
+    kind: str
+    query: str
+    depth: int
+    breadth: int
+    research_goal: str = ""
+    parent: Optional[int] = None
+    state: str = "pending"  # pending, running, done, failed
+    children: List[int] = field(default_factory=list)
+    learning_ids: List[int] = field(default_factory=list)
+    url_ids: List[int] = field(default_factory=list)
+    follow_up_questions: List[str] = field(default_factory=list)
+    # Search hits, and how many of them the job had not visited when the search returned
+    hits: int = 0
+    unvisited_hits: int = 0
+    error: Optional[Exception] = None
+    # Set when the node found too little new to be worth researching deeper
+    pruned: bool = False
+
+@dataclass(order=True)
+class _Step:
+    priority: int
+    seq: int
+    run: Callable[[], Awaitable[None]] = field(compare=False)
+    queued_at: float = field(compare=False, default=0.0)
+
+def parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for item in value.split(","):
+        user, _, weight = item.partition("=")
+        if user.strip() and weight.strip():
+            weights[user.strip()] = float(weight)
+    return weights
+
+class FairShareLimiter:
+    """
+    A concurrency budget shared by every job in the process and split fairly between users.
+    While slots are short, each freed slot goes to the waiting user holding the fewest slots
+    for their weight (ties: whoever has waited longest), so a user with one large job cannot
+    starve the others. A limit of 0 admits everything and only counts. Event-loop only.
+    """
+    def __init__(self, limit: int, weights: Optional[Mapping[str, float]] = None):
+        self.limit = limit
+        self.weights = dict(weights or {})
+        self.in_use = 0
+        self.user_in_use: Dict[str, int] = {}
+        self.granted: Dict[str, int] = {}
+        self.queued = 0
+        self.wait = LatencyTracker()
+        self._seq = itertools.count()
+        self._waiters: Dict[str, Deque[Tuple[int, asyncio.Future]]] = {}
+
+    def _weight(self, user: str) -> float:
+        return max(self.weights.get(user, 1.0), 1e-6)
+
+    def _take(self, user: str) -> None:
+        self.in_use += 1
+        self.user_in_use[user] = self.user_in_use.get(user, 0) + 1
+        self.granted[user] = self.granted.get(user, 0) + 1
+
+    def _grant(self) -> None:
+        while self._waiters and self.in_use < self.limit:
+            user = min(self._waiters, key=lambda u: (self.user_in_use.get(u, 0) / self._weight(u), self._waiters[u][0][0]))
+            _, waiter = self._waiters[user].popleft()
+            if not self._waiters[user]:
+                del self._waiters[user]
+            if not waiter.done():
+                self._take(user)
+                waiter.set_result(None)
+
+    async def acquire(self, user: str) -> None:
+        if self.limit <= 0 or (self.in_use < self.limit and not self._waiters):
+            self._take(user)
+            return
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user, deque()).append((next(self._seq), waiter))
+        self.queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the caller gave up; hand the slot on
+                self.release(user)
+            else:
+                waiter.cancel()
+            raise
+        self.wait.record((time.perf_counter() - started) * 1000)
+
+    def release(self, user: str) -> None:
+        self.in_use -= 1
+        self.user_in_use[user] -= 1
+        if not self.user_in_use[user]:
+            del self.user_in_use[user]
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, user: str) -> AsyncIterator[None]:
+        await self.acquire(user)
+        try:
+            yield
+        finally:
+            self.release(user)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "waiting": {user: sum(1 for _, w in waiters if not w.done()) for user, waiters in self._waiters.items()},
+            "in_use_by_user": dict(self.user_in_use),
+            "granted_by_user": dict(self.granted),
+            "queued": self.queued,
+            "wait": self.wait.stats(),
+        }
+
+class ResearchBudget:
+    """Process-wide fair-share budgets: steps in flight per pool ("search", "llm") and running jobs ("jobs")."""
+    def __init__(self, search: int = RESEARCH_SEARCH_BUDGET, llm: int = RESEARCH_LLM_BUDGET,
+                 jobs: int = RESEARCH_MAX_JOBS, weights: Optional[Mapping[str, float]] = None):
+        self.limiters = {
+            "search": FairShareLimiter(search, weights),
+            "llm": FairShareLimiter(llm, weights),
+            "jobs": FairShareLimiter(jobs, weights),
+        }
+
+    def __getitem__(self, name: str) -> FairShareLimiter:
+        return self.limiters[name]
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+research_budget = ResearchBudget(weights=parse_weights(RESEARCH_USER_WEIGHTS))
+
+class ResearchScheduler:
+    """
+    Runs a research tree as a frontier of steps on fixed worker pools ("search" and "llm"),
+    so a job never has more than `search_workers + llm_workers` steps in flight, whatever
+    its breadth and depth. A step may submit follow-up steps; lower priority values run first.
+    run() returns once the frontier is empty and every worker is idle.
+
+    Each step also takes a slot of the process-wide `budget` for its pool on behalf of
+    `user_id`, so concurrent jobs share one upstream budget fairly.
+    """
+    def __init__(self, search_workers: int = RESEARCH_SEARCH_WORKERS, llm_workers: int = RESEARCH_LLM_WORKERS,
+                 user_id: str = "default", budget: Optional[ResearchBudget] = None):
+        self.workers = {"search": max(1, search_workers), "llm": max(1, llm_workers)}
+        self.user_id = user_id
+        self.budget = budget if budget is not None else research_budget
+        self.nodes: Dict[int, ResearchNode] = {}
+        self._ids = itertools.count()
+        self._seq = itertools.count()
+        self._queues: Dict[str, asyncio.PriorityQueue] = {pool: asyncio.PriorityQueue() for pool in POOLS}
+        self._outstanding = 0
+        self._idle: Optional[asyncio.Event] = None
+        self.running = {pool: 0 for pool in POOLS}
+        self.peak_queued = {pool: 0 for pool in POOLS}
+        self.completed = {pool: 0 for pool in POOLS}
+        self.failed = {pool: 0 for pool in POOLS}
+        self.wait = {pool: LatencyTracker() for pool in POOLS}
+
+    def add_node(self, kind: str, query: str, depth: int, breadth: int, **fields: Any) -> ResearchNode:
+        node = ResearchNode(id=next(self._ids), kind=kind, query=query, depth=depth, breadth=breadth, **fields)
+        self.nodes[node.id] = node
+        if node.parent is not None:
+            self.nodes[node.parent].children.append(node.id)
+        return node
+
+    def walk(self, node_id: int) -> Iterator[ResearchNode]:
+        """The node and its descendants, each before its children, children in creation order."""
+        stack = [node_id]
+        while stack:
+            node = self.nodes[stack.pop()]
+            yield node
+            stack.extend(reversed(node.children))
+
+    def lineage(self, node_id: int) -> List[ResearchNode]:
+        """The node's ancestors from the root down, ending with the node itself."""
+        path = []
+        current: Optional[int] = node_id
+        while current is not None:
+            path.append(self.nodes[current])
+            current = self.nodes[current].parent
+        return path[::-1]
+
+    def submit(self, pool: str, run: Callable[[], Awaitable[None]], priority: int = 0) -> None:
+        self._outstanding += 1
+        if self._idle is not None:
+            self._idle.clear()
+        queue = self._queues[pool]
+        queue.put_nowait(_Step(priority, next(self._seq), run, time.perf_counter()))
+        self.peak_queued[pool] = max(self.peak_queued[pool], queue.qsize())
+
+    async def _worker(self, pool: str) -> None:
+        queue = self._queues[pool]
+        limiter = self.budget[pool]
+        while True:
+            step = await queue.get()
+            await limiter.acquire(self.user_id)
+            self.wait[pool].record((time.perf_counter() - step.queued_at) * 1000)
+            self.running[pool] += 1
+            try:
+                await step.run()
+                self.completed[pool] += 1
+            except Exception:
+                # Steps handle their own errors; this only keeps a bug from stalling the job
+                traceback.print_exc()
+                self.failed[pool] += 1
+            finally:
+                limiter.release(self.user_id)
+                self.running[pool] -= 1
+                queue.task_done()
+                self._outstanding -= 1
+                if self._outstanding == 0:
+                    self._idle.set()
+
+    async def run(self) -> None:
+        self._idle = asyncio.Event()
+        if self._outstanding == 0:
+            return
+        workers = [
+            asyncio.create_task(self._worker(pool))
+            for pool, count in self.workers.items()
+            for _ in range(count)
+        ]
+        active_schedulers.add(self)
+        try:
+            await self._idle.wait()
+        finally:
+            active_schedulers.discard(self)
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def queued(self) -> int:
+        return sum(queue.qsize() for queue in self._queues.values())
+
+    def in_flight(self) -> int:
+        return sum(self.running.values())
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for node in self.nodes.values():
+            states[node.state] = states.get(node.state, 0) + 1
+        return {
+            "pools": {
+                pool: {
+                    "workers": self.workers[pool],
+                    "running": self.running[pool],
+                    "queued": self._queues[pool].qsize(),
+                    "peak_queued": self.peak_queued[pool],
+                    "completed": self.completed[pool],
+                    "failed": self.failed[pool],
+                    "wait": self.wait[pool].stats(),
+                }
+                for pool in POOLS
+            },
+            "nodes": states,
+            "pruned": sum(1 for node in self.nodes.values() if node.pruned),
+        }
+
+# Schedulers of the jobs running right now, for process-wide queue metrics
+active_schedulers: "weakref.WeakSet[ResearchScheduler]" = weakref.WeakSet()
+
+def scheduler_stats() -> Dict[str, Any]:
+    """Queued and running steps per pool, summed over the jobs in this process."""
+    schedulers = list(active_schedulers)
+    return {
+        "jobs": len(schedulers),
+        "budget": research_budget.stats(),
+        **{
+            pool: {
+                "queued": sum(scheduler._queues[pool].qsize() for scheduler in schedulers),
+                "running": sum(scheduler.running[pool] for scheduler in schedulers),
+                "workers": sum(scheduler.workers[pool] for scheduler in schedulers),
+            }
+            for pool in POOLS
+        },
+    }
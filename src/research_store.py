@@ -0,0 +1,84 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from consolidate import LearningIndex
+from page_store import get_url
+
+class ResearchStore:
+    """
+    Append-only learnings and visited URLs of one research job. Each learning and URL is held
+    once; research nodes keep the IDs of what they added, and a branch's knowledge is the
+    IDs along its path, so nothing is copied down the tree. Exact duplicates map to the ID
+    first seen (learnings by text, URLs by their address), found in an incrementally kept
+    index instead of re-scanning the lists.
+    """
+    def __init__(self):
+        self.learnings: List[str] = []
+        self.urls: List[Dict[str, Any]] = []
+        # ID of the node that first produced each learning / URL
+        self.learning_nodes: List[Optional[int]] = []
+        self.url_nodes: List[Optional[int]] = []
+        self._learning_index: Dict[str, int] = {}
+        self._url_index: Dict[str, int] = {}
+        self.duplicate_learnings = 0
+        self.duplicate_urls = 0
+        self._term_index = LearningIndex()
+
+    def add_learnings(self, learnings: Iterable[str], node_id: Optional[int] = None) -> List[int]:
+        """Append learnings and return their IDs in order, without repeats."""
+        ids: List[int] = []
+        for learning in learnings:
+            learning_id = self._learning_index.get(learning)
+            if learning_id is None:
+                learning_id = len(self.learnings)
+                self.learnings.append(learning)
+                self.learning_nodes.append(node_id)
+                self._learning_index[learning] = learning_id
+            else:
+                self.duplicate_learnings += 1
+            if learning_id not in ids:
+                ids.append(learning_id)
+        return ids
+
+    def add_urls(self, items: Iterable[Dict[str, Any]], node_id: Optional[int] = None) -> List[int]:
+        """Append visited URL items and return their IDs in order; items without a URL are skipped."""
+        ids: List[int] = []
+        for item in items:
+            url = get_url(item)
+            if not url:
+                continue
+            url_id = self._url_index.get(url)
+            if url_id is None:
+                url_id = len(self.urls)
+                self.urls.append(item)
+                self.url_nodes.append(node_id)
+                self._url_index[url] = url_id
+            else:
+                self.duplicate_urls += 1
+            if url_id not in ids:
+                ids.append(url_id)
+        return ids
+
+    def learning_index(self) -> LearningIndex:
+        """Term vectors of the learnings, by ID; built on first use and then extended incrementally."""
+        for learning in self.learnings[len(self._term_index):]:
+            self._term_index.add(learning)
+        return self._term_index
+
+    def has_url(self, url: str) -> bool:
+        return url in self._url_index
+
+    def get_learnings(self, ids: Iterable[int]) -> List[str]:
+        """Learnings for the IDs in order, each once."""
+        return [self.learnings[i] for i in dict.fromkeys(ids)]
+
+    def get_urls(self, ids: Iterable[int]) -> List[Dict[str, Any]]:
+        """URL items for the IDs in order, each once."""
+        return [self.urls[i] for i in dict.fromkeys(ids)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "learnings": len(self.learnings),
+            "urls": len(self.urls),
+            "duplicate_learnings": self.duplicate_learnings,
+            "duplicate_urls": self.duplicate_urls,
+        }
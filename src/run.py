@@ -3,16 +3,27 @@ import sys
 
 from cli_style import ask_user, show_header
 from deep_research import deep_research, write_final_report
+from ai.providers import ModelInfo, close_firecrawl_client
+from ai.cassette import get_cassette
+from ai.offload import cpu_offload
+from ai.routing import STAGES, StageModels
+from ai.usage import usage_tracker
+from search_backends import close_search_backend
 from feedback import generate_feedback
 from output_manager import OutputManager
 
 def print_help_and_exit():
     usage = (
         "Usage:\n"
-        "  python src/run.py [--verbose] [--help]\n\n"
+        "  python src/run.py [--verbose] [--no-cache] [--<stage>-model=MODEL ...] [--help]\n\n"
         "Options:\n"
-        "  --verbose     Show debug logs\n"
-        "  --help        Show this help message\n"
+        "  --verbose               Show debug logs\n"
+        "  --no-cache              Always call the model instead of reusing cached answers\n"
+        "  --feedback-model=MODEL  Model for the clarifying questions\n"
+        "  --queries-model=MODEL   Model for generating search queries\n"
+        "  --learnings-model=MODEL Model for summarising search results\n"
+        "  --report-model=MODEL    Model for the final report\n"
+        "  --help                  Show this help message\n"
     )
     print(usage)
     sys.exit(1)
@@ -28,11 +39,15 @@ def get_url(item):
 
 async def run():
     # Allowed arguments
-    allowed_args = {"--verbose", "--help"}
-
-    # Identify invalid flags (any that aren't allowed)
-    user_args = set(sys.argv[1:])
-    invalid = [arg for arg in user_args if arg not in allowed_args]
+    allowed_args = {"--verbose", "--no-cache", "--help"}
+    stage_flags = {f"--{stage}-model": stage for stage in STAGES}
+
+    # Identify invalid flags (any that aren't allowed); stage models are given as --<stage>-model=MODEL
+    user_args = {arg for arg in sys.argv[1:] if "=" not in arg}
+    stage_args = dict(arg.split("=", 1) for arg in sys.argv[1:] if "=" in arg)
+    invalid = [arg for arg in user_args if arg not in allowed_args] + [
+        flag for flag, value in stage_args.items() if flag not in stage_flags or not value
+    ]
     if invalid:
         # unknown arg, show usage and exit
         print_help_and_exit()
@@ -46,6 +61,14 @@ async def run():
 
     # Create an OutputManager instance with the desired verbosity
     output = OutputManager(verbose=verbose_mode)
+    model_info = ModelInfo(use_cache="--no-cache" not in user_args)
+    try:
+        stage_models = StageModels(model_info, {stage_flags[flag]: value for flag, value in stage_args.items()})
+    except Exception as e:
+        # e.g. a model name the provider does not know
+        print(f"Error: {e}\n")
+        print_help_and_exit()
+    output.debug(f"Stage models: {stage_models.describe()}")
 
     show_header("Deep Research")
 
@@ -76,7 +99,7 @@ async def run():
 
     output.debug("Creating research plan...")
 
-    follow_up_questions = await generate_feedback(query=initial_query)
+    follow_up_questions = await generate_feedback(query=initial_query, model_info=stage_models["feedback"])
     output.info("\nTo better understand your research needs, please answer these follow-up questions:")
 
     answers = []
@@ -97,7 +120,9 @@ async def run():
         query=combined_query,
         breadth=breadth,
         depth=depth,
-        on_progress=output.update_progress
+        model_info=model_info,
+        on_progress=output.update_progress,
+        stage_models=stage_models
     )
     output.stop_progress()
 
@@ -108,20 +133,38 @@ async def run():
     output.debug(f"\nVisited URLs ({len(visited_urls)}):\n{chr(10).join([get_url(u) for u in visited_urls])}")
     output.debug("Writing final report...")
 
-    report = await write_final_report(
-        prompt=combined_query,
-        learnings=learnings,
-        visited_urls=visited_urls
-    )
+    # Write output.md as the report streams in, so it can be followed while it is written
+    output.info("\nWriting report to output.md")
+    with open("output.md", "w", encoding="utf-8") as f:
+        def write_chunk(text: str) -> None:
+            f.write(text)
+            f.flush()
+
+        report = await write_final_report(
+            prompt=combined_query,
+            learnings=learnings,
+            visited_urls=visited_urls,
+            model_info=stage_models["report"],
+            on_chunk=write_chunk
+        )
 
     output.debug("\nFinal Report:\n")
     output.debug(report)
+    usage = usage_tracker.stats()
+    output.debug(f"\nModel usage: {usage['total']}")
+    for stage, totals in usage["stages"].items():
+        output.debug(
+            f"  {stage}: {totals['calls']} calls, {totals['prompt_tokens']} prompt + {totals['completion_tokens']} "
+            f"completion tokens, {totals['avg_seconds']:.1f}s avg, ${totals['cost_usd']:.4f}"
+        )
 
     # Final user-facing message
     output.info("\nReport has been saved to output.md")
 
-    with open("output.md", "w", encoding="utf-8") as f:
-        f.write(report)
+    await close_search_backend()
+    await close_firecrawl_client()
+    cpu_offload.shutdown()
+    get_cassette().save()
 
 if __name__ == "__main__":
     asyncio.run(run())
@@ -0,0 +1,374 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import statistics
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from ai.latency import LatencyTracker
+from ai.providers import AsyncFirecrawlClient, async_firecrawl_search, async_firecrawl_scrape, firecrawl_latency
+from ai.rate_limit import TokenBucket
+from output_manager import OutputManager
+
+output = OutputManager()
+
+SEARCH_BACKENDS = os.getenv("SEARCH_BACKENDS", "firecrawl")
+LOCAL_FIRECRAWL_BASE_URL = os.getenv("LOCAL_FIRECRAWL_BASE_URL", "http://localhost:3002/v1")
+LOCAL_FIRECRAWL_API_KEY = os.getenv("LOCAL_FIRECRAWL_API_KEY", "")
+# Requests/second for the self-hosted instance, separate from the hosted quota (0 = no limit)
+LOCAL_FIRECRAWL_RPS = float(os.getenv("LOCAL_FIRECRAWL_RPS", 0))
+
+@dataclass
+class SearchResult:
+    """A search hit normalised across backends. `markdown` is empty until the page is scraped."""
+    url: str
+    title: str = ""
+    description: str = ""
+    markdown: str = ""
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_firecrawl(cls, item: Dict[str, Any]) -> Optional["SearchResult"]:
+        metadata = item.get("metadata") or {}
+        url = (
+            item.get("url") or
+            metadata.get("sourceURL") or
+            metadata.get("pageUrl") or
+            metadata.get("finalUrl") or
+            metadata.get("url")
+        )
+        if not url:
+            return None
+        return cls(
+            url=url,
+            title=item.get("title") or metadata.get("title") or "",
+            description=item.get("description") or metadata.get("description") or "",
+            markdown=item.get("markdown") or "",
+            metadata=metadata,
+        )
+
+    def with_content(self, document: "SearchResult") -> "SearchResult":
+        """Combine this snippet with the scraped document for the same URL."""
+        return SearchResult(
+            url=self.url,
+            title=self.title or document.title,
+            description=self.description or document.description,
+            markdown=document.markdown,
+            metadata={**self.metadata, **document.metadata},
+        )
+
+    def to_dict(self, include_markdown: bool = True) -> Dict[str, Any]:
+        data = {
+            "url": self.url,
+            "title": self.title,
+            "description": self.description,
+            "metadata": self.metadata,
+        }
+        if include_markdown:
+            data["markdown"] = self.markdown
+        return data
+
+class SearchBackend(ABC):
+    """Interface every search backend implements."""
+    name = "base"
+    stragglers_dropped = 0
+    # Observed search latency, which sizes search timeouts; None if the backend keeps none
+    search_latency: Optional[LatencyTracker] = None
+
+    @abstractmethod
+    async def search(self, query: str, limit: int = 5, timeout: int = 15000,
+                     scrape: bool = True) -> List[SearchResult]:
+        """Search for `query`; with scrape=False the hits carry no markdown."""
+
+    @abstractmethod
+    async def scrape(self, url: str, timeout: int = 15000) -> Optional[SearchResult]:
+        """Scrape one URL to markdown, or None when it could not be fetched."""
+
+    async def _scrape_hit(self, hit: SearchResult, timeout: int) -> Optional[SearchResult]:
+        if hit.markdown:
+            return hit
+        document = await self.scrape(hit.url, timeout=timeout)
+        if document is None or not document.markdown:
+            return None
+        return hit.with_content(document)
+
+    async def scrape_many(self, hits: Sequence[SearchResult], timeout: int = 15000,
+                          straggler_factor: float = 0.0, straggler_min_fraction: float = 0.5,
+                          straggler_grace: float = 1.0) -> AsyncIterator[SearchResult]:
+        """
+        Scrape hits concurrently and yield each page as soon as it is ready, in completion order.
+
+        With a straggler_factor, once `straggler_min_fraction` of the pages are in, the rest get
+        `straggler_factor` times the median page time so far (at least `straggler_grace` seconds)
+        and are cancelled after that, so one slow site does not hold up the whole batch.
+        """
+        if not hits:
+            return
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        pending = {asyncio.ensure_future(self._scrape_hit(hit, timeout)) for hit in hits}
+        needed = max(1, math.ceil(len(hits) * straggler_min_fraction))
+        durations: List[float] = []
+        deadline: Optional[float] = None
+        try:
+            while pending:
+                wait = None if deadline is None else max(0.0, deadline - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    output.debug(f"Dropping {len(pending)} straggling page(s) after {loop.time() - started:.1f}s")
+                    self.stragglers_dropped += len(pending)
+                    break
+                for task in done:
+                    durations.append(loop.time() - started)
+                    try:
+                        page = task.result()
+                    except Exception as e:
+                        output.debug(f"Scrape failed: {e}")
+                        continue
+                    if page is not None:
+                        yield page
+                if deadline is None and straggler_factor > 0 and len(durations) >= needed:
+                    deadline = started + max(straggler_grace, straggler_factor * statistics.median(durations))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "stragglers_dropped": self.stragglers_dropped}
+
+    async def aclose(self) -> None:
+        pass
+
+class FirecrawlBackend(SearchBackend):
+    """
+    Firecrawl search through the pooled async client. Without a base_url this is the hosted
+    API configured by FIRECRAWL_BASE_URL; with one it targets another (e.g. self-hosted)
+    instance, which gets its own rate limiter (`rate` requests/second, 0 for none) and
+    latency tracker so its traffic neither spends nor skews the hosted API's.
+    """
+    def __init__(self, name: str = "firecrawl", base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 rate: float = 0.0):
+        self.name = name
+        self.client = None
+        self.search_latency = firecrawl_latency
+        if base_url:
+            self.client = AsyncFirecrawlClient(base_url=base_url, api_key=api_key, rate_limiter=TokenBucket(rate=rate),
+                                               latency=LatencyTracker())
+            self.search_latency = self.client.latency
+
+    async def search(self, query: str, limit: int = 5, timeout: int = 15000,
+                     scrape: bool = True) -> List[SearchResult]:
+        response = await async_firecrawl_search(query, timeout=timeout, limit=limit, scrape=scrape, client=self.client)
+        results = [SearchResult.from_firecrawl(item) for item in response.get("data", [])]
+        return [r for r in results if r is not None]
+
+    async def scrape(self, url: str, timeout: int = 15000) -> Optional[SearchResult]:
+        document = await async_firecrawl_scrape(url, timeout=timeout, client=self.client)
+        if not document.get("markdown"):
+            return None
+        return SearchResult.from_firecrawl({"url": url, **document})
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {**super().stats(), "latency": self.search_latency.stats()}
+        if self.client is not None:
+            stats["rate_limit"] = self.client.rate_limiter.stats()
+        return stats
+
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+
+class FakeSearchBackend(SearchBackend):
+    """
+    Offline backend returning deterministic pages generated from the query (or canned results
+    registered with `add`). Latency can be simulated, which makes it a stand-in for tests
+    and benchmarks that must not touch the network.
+    """
+    def __init__(self, name: str = "fake", latency: float = 0.0, latency_jitter: float = 0.0,
+                 page_chars: int = 4000, fail: bool = False):
+        self.name = name
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.page_chars = page_chars
+        self.fail = fail
+        self.calls = 0
+        # Per-URL scrape latency overrides, e.g. to simulate a straggling site
+        self.url_latency: Dict[str, float] = {}
+        self._canned: Dict[str, List[SearchResult]] = {}
+
+    def add(self, query: str, results: Sequence[SearchResult]) -> None:
+        self._canned[query.strip().lower()] = list(results)
+
+    async def _sleep(self, url: Optional[str] = None) -> None:
+        delay = self.url_latency.get(url, self.latency) + random.uniform(0, self.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _page(self, url: str, query: str) -> str:
+        words = query.split() or ["page"]
+        seed = int(hashlib.sha256(url.encode("utf-8")).hexdigest(), 16)
+        rng = random.Random(seed)
+        paragraphs = [f"# {query}"]
+        size = len(paragraphs[0])
+        while size < self.page_chars:
+            sentence = " ".join(rng.choice(words + ["data", "report", "analysis", "trend", "source"])
+                                for _ in range(rng.randint(8, 20)))
+            paragraph = f"{sentence.capitalize()}. Figure {rng.randint(1, 999)} shows a {rng.randint(1, 99)}% change."
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        return "\n\n".join(paragraphs)[:self.page_chars]
+
+    async def search(self, query: str, limit: int = 5, timeout: int = 15000,
+                     scrape: bool = True) -> List[SearchResult]:
+        self.calls += 1
+        await self._sleep()
+        if self.fail:
+            raise Exception(f"{self.name} backend unavailable")
+        canned = self._canned.get(query.strip().lower())
+        if canned is not None:
+            results = canned[:limit]
+        else:
+            digest = hashlib.sha256(query.encode("utf-8")).hexdigest()
+            results = [
+                SearchResult(
+                    url=f"https://{self.name}.local/{digest[:12]}/{i}",
+                    title=f"{query} ({i + 1})",
+                    description=f"Result {i + 1} for {query}",
+                )
+                for i in range(limit)
+            ]
+        if not scrape:
+            return [SearchResult(r.url, r.title, r.description, "", dict(r.metadata)) for r in results]
+        return [
+            SearchResult(r.url, r.title, r.description, r.markdown or self._page(r.url, query), dict(r.metadata))
+            for r in results
+        ]
+
+    async def scrape(self, url: str, timeout: int = 15000) -> Optional[SearchResult]:
+        self.calls += 1
+        await self._sleep(url)
+        if self.fail:
+            return None
+        for results in self._canned.values():
+            for r in results:
+                if r.url == url and r.markdown:
+                    return r
+        return SearchResult(url=url, markdown=self._page(url, "scraped page"))
+
+class RaceSearchBackend(SearchBackend):
+    """
+    Sends each query to several backends at once and returns the first good answer (at least
+    `min_results` hits), cancelling the rest. If no backend gives a good answer the largest
+    result set is returned.
+    """
+    def __init__(self, backends: Sequence[SearchBackend], min_results: int = 1):
+        self.name = "race(" + ",".join(b.name for b in backends) + ")"
+        self.backends = list(backends)
+        self.min_results = min_results
+        # Timeouts follow the first backend listed that tracks latency
+        self.search_latency = next((b.search_latency for b in self.backends if b.search_latency is not None), None)
+        self.wins: Counter = Counter()
+        self.errors: Counter = Counter()
+
+    async def _race(self, calls: List[asyncio.Future], is_good, size) -> Any:
+        best = None
+        try:
+            for finished in asyncio.as_completed(calls):
+                try:
+                    backend, value = await finished
+                except Exception as e:
+                    output.debug(f"Search backend failed during race: {e}")
+                    continue
+                if is_good(value):
+                    self.wins[backend.name] += 1
+                    return value
+                if best is None or size(value) > size(best):
+                    best = value
+            return best
+        finally:
+            for task in calls:
+                if not task.done():
+                    task.cancel()
+
+    def _launch(self, make_call) -> List[asyncio.Future]:
+        async def run(backend: SearchBackend):
+            try:
+                return backend, await make_call(backend)
+            except Exception:
+                self.errors[backend.name] += 1
+                raise
+        return [asyncio.ensure_future(run(b)) for b in self.backends]
+
+    async def search(self, query: str, limit: int = 5, timeout: int = 15000,
+                     scrape: bool = True) -> List[SearchResult]:
+        calls = self._launch(lambda b: b.search(query, limit=limit, timeout=timeout, scrape=scrape))
+        results = await self._race(
+            calls,
+            is_good=lambda value: value is not None and len(value) >= self.min_results,
+            size=lambda value: len(value or [])
+        )
+        return results or []
+
+    async def scrape(self, url: str, timeout: int = 15000) -> Optional[SearchResult]:
+        calls = self._launch(lambda b: b.scrape(url, timeout=timeout))
+        result = await self._race(
+            calls,
+            is_good=lambda value: value is not None and bool(value.markdown),
+            size=lambda value: len(value.markdown) if value else 0
+        )
+        return result or None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "wins": dict(self.wins),
+            "errors": dict(self.errors),
+            "stragglers_dropped": self.stragglers_dropped,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+    async def aclose(self) -> None:
+        for backend in self.backends:
+            await backend.aclose()
+
+def build_search_backend(names: Optional[str] = None) -> SearchBackend:
+    """
+    Build a backend from a comma separated list of names ("firecrawl", "local", "fake").
+    More than one name races them against each other.
+    """
+    backends: List[SearchBackend] = []
+    for name in (names or SEARCH_BACKENDS).split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name == "firecrawl":
+            backends.append(FirecrawlBackend())
+        elif name == "local":
+            backends.append(FirecrawlBackend(name="local", base_url=LOCAL_FIRECRAWL_BASE_URL, api_key=LOCAL_FIRECRAWL_API_KEY,
+                                            rate=LOCAL_FIRECRAWL_RPS))
+        elif name == "fake":
+            backends.append(FakeSearchBackend())
+        else:
+            raise ValueError(f"Unknown search backend: {name}")
+    if not backends:
+        raise ValueError("No search backend configured")
+    return backends[0] if len(backends) == 1 else RaceSearchBackend(backends)
+
+_default_backend: Optional[SearchBackend] = None
+
+def get_search_backend() -> SearchBackend:
+    """The process-wide backend configured by SEARCH_BACKENDS."""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = build_search_backend()
+    return _default_backend
+
+async def close_search_backend() -> None:
+    global _default_backend
+    if _default_backend is not None:
+        await _default_backend.aclose()
+        _default_backend = None
@@ -0,0 +1,91 @@
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from ai.latency import LatencyTracker
+
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", 5))
+SEARCH_MIN_LIMIT = int(os.getenv("SEARCH_MIN_LIMIT", 2))
+SEARCH_MAX_TIMEOUT = int(os.getenv("SEARCH_MAX_TIMEOUT", 15000))
+SEARCH_MIN_TIMEOUT = int(os.getenv("SEARCH_MIN_TIMEOUT", 5000))
+SEARCH_TWO_PHASE = os.getenv("SEARCH_TWO_PHASE", "false").lower() in ("1", "true", "yes")
+SEARCH_CANDIDATE_MULTIPLIER = int(os.getenv("SEARCH_CANDIDATE_MULTIPLIER", 3))
+SEARCH_STREAMING = os.getenv("SEARCH_STREAMING", "false").lower() in ("1", "true", "yes")
+SEARCH_STRAGGLER_FACTOR = float(os.getenv("SEARCH_STRAGGLER_FACTOR", 2.0))
+SEARCH_STRAGGLER_MIN_FRACTION = float(os.getenv("SEARCH_STRAGGLER_MIN_FRACTION", 0.5))
+SEARCH_STRAGGLER_GRACE = float(os.getenv("SEARCH_STRAGGLER_GRACE", 1.0))
+
+@dataclass
+class SearchPolicy:
+    """
+    Picks the Firecrawl `limit` and `timeout` for each query of a research job.
+
+    - limit shrinks with depth and with the job's yield (the share of returned URLs that
+      were new), so deep, low-yield branches scrape fewer pages;
+    - timeout follows observed Firecrawl latency (p90 with headroom) instead of always
+      allowing the maximum.
+
+    `limit_override` / `timeout_override` pin the values for the whole job. With `two_phase`,
+    searches first fetch `limit * candidate_multiplier` unscraped hits and scrape only the best `limit`.
+    With `streaming`, pages are scraped one by one and handed on as they arrive; stragglers
+    slower than `straggler_factor` times the median page are dropped (0 waits for every page).
+    """
+    min_limit: int = SEARCH_MIN_LIMIT
+    max_limit: int = SEARCH_MAX_LIMIT
+    min_timeout: int = SEARCH_MIN_TIMEOUT
+    max_timeout: int = SEARCH_MAX_TIMEOUT
+    limit_override: Optional[int] = None
+    timeout_override: Optional[int] = None
+    two_phase: bool = SEARCH_TWO_PHASE
+    candidate_multiplier: int = SEARCH_CANDIDATE_MULTIPLIER
+    streaming: bool = SEARCH_STREAMING
+    straggler_factor: float = SEARCH_STRAGGLER_FACTOR
+    straggler_min_fraction: float = SEARCH_STRAGGLER_MIN_FRACTION
+    straggler_grace: float = SEARCH_STRAGGLER_GRACE
+    latency: Optional[LatencyTracker] = None
+    root_depth: Optional[int] = None
+    min_latency_samples: int = 5
+    returned_urls: int = 0
+    new_urls: int = 0
+    decisions: list = field(default_factory=list)
+
+    def url_yield(self) -> float:
+        """Fraction of returned URLs that were new to the job (optimistic until we have data)."""
+        if self.returned_urls < self.max_limit:
+            return 1.0
+        return self.new_urls / self.returned_urls
+
+    def choose(self, depth: int) -> Tuple[int, int]:
+        """Return (limit, timeout_ms) for a query issued with `depth` levels remaining."""
+        root_depth = self.root_depth or depth or 1
+        level = max(0, root_depth - depth)
+        # Each level below the root trims a quarter of the pages, down to half at most
+        depth_scale = max(0.5, 1 - 0.25 * level)
+        yield_scale = 0.5 + 0.5 * self.url_yield()
+        limit = round(self.max_limit * depth_scale * yield_scale)
+        limit = max(self.min_limit, min(self.max_limit, limit))
+
+        timeout = self.max_timeout
+        if self.latency is not None and len(self.latency) >= self.min_latency_samples:
+            timeout = int(self.latency.percentile(90) * 1.5)
+            timeout = max(self.min_timeout, min(self.max_timeout, timeout))
+
+        if self.limit_override is not None:
+            limit = self.limit_override
+        if self.timeout_override is not None:
+            timeout = self.timeout_override
+        self.decisions.append({"depth": depth, "limit": limit, "timeout": timeout})
+        return limit, timeout
+
+    def record(self, returned: int, new: int) -> None:
+        """Record how many URLs a query returned and how many of them the job had not seen."""
+        self.returned_urls += returned
+        self.new_urls += new
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "returned_urls": self.returned_urls,
+            "new_urls": self.new_urls,
+            "url_yield": self.url_yield(),
+            "decisions": len(self.decisions),
+        }
@@ -0,0 +1,75 @@
+import math
+import os
+from typing import List, Sequence
+
+from ai.providers import ModelInfo
+from ai.text import count_tokens
+
+# Most prompt tokens a single summarisation call may spend on page content, whatever the model allows
+SERP_CONTENT_BUDGET: int = int(os.getenv("SERP_CONTENT_BUDGET", 60000))
+# Tokens kept free for the answer (and any reasoning) when the model params set no limit
+OUTPUT_TOKEN_RESERVE: int = int(os.getenv("OUTPUT_TOKEN_RESERVE", 16000))
+# A page cut shorter than this rarely says anything useful
+MIN_PAGE_TOKENS: int = 300
+# The <content> tags and newlines around each page
+PAGE_WRAPPER_TOKENS: int = 8
+# Prose and markdown average about 4 characters per token
+CHARS_PER_TOKEN: float = 4.0
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for planning; trim_prompt enforces the exact budget afterwards."""
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+def output_reserve(model_info: ModelInfo) -> int:
+    """Tokens to leave for the answer: the model params' limit, else OUTPUT_TOKEN_RESERVE (a quarter of small contexts)."""
+    for name in ("max_completion_tokens", "max_tokens"):
+        if model_info.model_params.get(name):
+            return int(model_info.model_params[name])
+    return min(OUTPUT_TOKEN_RESERVE, model_info.context_size // 4)
+
+def content_budget(model_info: ModelInfo, overhead: str = "", cap: int = SERP_CONTENT_BUDGET) -> int:
+    """
+    Tokens left for page content in one call: the model's context size less the reserved output
+    and the prompt around the pages (overhead), and at most cap (0 for no cap).
+    """
+    available = model_info.context_size - output_reserve(model_info) - count_tokens(overhead)
+    if cap > 0:
+        available = min(available, cap)
+    return max(0, available)
+
+def _water_fill(total: int, active: List[int], weights: Sequence[float], demands: Sequence[int]) -> List[int]:
+    budgets = [0] * len(demands)
+    remaining = max(0, total)
+    unfilled = list(active)
+    while unfilled and remaining > 0:
+        weight_sum = sum(weights[i] for i in unfilled)
+        full = [i for i in unfilled if remaining * weights[i] / weight_sum >= demands[i]]
+        if not full:
+            for i in unfilled:
+                budgets[i] = int(remaining * weights[i] / weight_sum)
+            break
+        # Pages that need less than their share take only what they need; the rest is shared again
+        for i in full:
+            budgets[i] = demands[i]
+            remaining -= demands[i]
+            unfilled.remove(i)
+    return budgets
+
+def split_budget(total: int, scores: Sequence[float], demands: Sequence[int],
+                 min_tokens: int = MIN_PAGE_TOKENS) -> List[int]:
+    """
+    Split a token budget across pages in proportion to their relevance scores. No page gets more
+    than its demand (its length, capped), and what short pages leave over goes to the others.
+    Pages that would get less than min_tokens are dropped, least relevant first, so the rest
+    stay useful; the most relevant page is always kept. Returns one budget per page (0 = drop).
+    """
+    top = max(scores, default=0.0)
+    # A small floor keeps pages without matching terms in the running, just with a smaller share
+    weights = [max(score, 0.0) + (0.1 * top if top > 0 else 1.0) for score in scores]
+    active = [i for i, demand in enumerate(demands) if demand > 0]
+    while True:
+        budgets = _water_fill(total - PAGE_WRAPPER_TOKENS * len(active), active, weights, demands)
+        starved = [i for i in active if budgets[i] < min(min_tokens, demands[i])]
+        if not starved or len(active) == 1:
+            return budgets
+        active.remove(min(starved, key=lambda i: weights[i]))
@@ -1,5 +1,13 @@
 import sys
 import os
+from openai.types.chat.chat_completion import ChatCompletion
 
 # Add the src directory to the system path so that the deep_research package can be imported
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))) 
\ No newline at end of file
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))) 
+
+def chat_completion(content):
+    """A minimal OpenAI chat completion whose message is `content`."""
+    return ChatCompletion.model_validate({
+        "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    })
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+import ai.providers as providers
+from ai.providers import async_firecrawl_search, firecrawl_client
+
+def _response(status_code=200, payload=None, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.json.return_value = payload or {}
+    response.raise_for_status = MagicMock()
+    return response
+
+@pytest.mark.asyncio
+@patch("ai.providers.search_cache", new=None)
+@patch("ai.providers.httpx.AsyncClient.post", new_callable=AsyncMock)
+async def test_async_search_reuses_pooled_client(mock_post):
+    mock_post.return_value = _response(payload={
+        "success": True,
+        "data": [{"url": "http://example.com", "markdown": "Example content"}]
+    })
+
+    first = await async_firecrawl_search("test query", limit=1, timeout=5000)
+    client = firecrawl_client._client
+    second = await async_firecrawl_search("another query", limit=1, timeout=5000)
+
+    assert first["data"][0]["url"] == "http://example.com"
+    assert second["success"] is True
+    assert firecrawl_client._client is client
+    assert mock_post.call_count == 2
+    await providers.close_firecrawl_client()
+
+@pytest.mark.asyncio
+@patch("ai.providers.search_cache", new=None)
+@patch("ai.providers.asyncio.sleep", new_callable=AsyncMock)
+@patch("ai.providers.httpx.AsyncClient.post", new_callable=AsyncMock)
+async def test_async_search_retries_rate_limits(mock_post, mock_sleep):
+    mock_post.side_effect = [
+        _response(status_code=429),
+        _response(payload={"success": True, "data": []}),
+    ]
+
+    result = await async_firecrawl_search("retry query", limit=1, timeout=5000)
+
+    assert result["data"] == []
+    assert mock_post.call_count == 2
+    mock_sleep.assert_awaited_once()
+    await providers.close_firecrawl_client()
+
+@pytest.mark.asyncio
+@patch("ai.providers.search_cache", new=None)
+@patch("ai.providers.httpx.AsyncClient.post", new_callable=AsyncMock)
+async def test_async_search_error_returns_empty(mock_post):
+    mock_post.side_effect = Exception("Request failed")
+
+    result = await async_firecrawl_search("error query", limit=1, timeout=5000)
+    assert result == {"data": []}
+    await providers.close_firecrawl_client()
+
+@pytest.mark.asyncio
+@patch("ai.providers.search_cache", new=None)
+@patch("ai.providers.httpx.AsyncClient.post", new_callable=AsyncMock)
+async def test_concurrent_identical_searches_are_coalesced(mock_post):
+    mock_post.return_value = _response(payload={"success": True, "data": [{"url": "http://example.com"}]})
+
+    results = await asyncio.gather(
+        async_firecrawl_search("same query", limit=1, timeout=5000),
+        async_firecrawl_search("  Same   Query ", limit=1, timeout=5000),
+    )
+
+    assert results[0] is results[1]
+    mock_post.assert_called_once()
+    await providers.close_firecrawl_client()
+
+@pytest.mark.asyncio
+@patch("ai.providers.asyncio.sleep", new_callable=AsyncMock)
+@patch("ai.providers.httpx.AsyncClient.post", new_callable=AsyncMock)
+async def test_latency_times_each_attempt_and_counts_timeouts(mock_post, mock_sleep):
+    from ai.latency import LatencyTracker
+    import httpx
+    latency = LatencyTracker()
+    mock_post.side_effect = [httpx.ReadTimeout("slow"), _response(status_code=503), _response(payload={"success": True})]
+    client = providers.AsyncFirecrawlClient(rate_limiter=providers.TokenBucket(rate=0))
+    response = await client._post("/search", {}, timeout=45, latency=latency)
+    assert response.status_code == 200
+    # The timed-out attempt counts as the full 45s; backoff sleeps are not part of any sample
+    assert len(latency) == 3
+    assert latency.percentile(100) >= 45000
+    assert latency.percentile(50) < 1000
+    await client.aclose()
@@ -0,0 +1,69 @@
+import secrets
+import time
+from unittest.mock import patch
+from ai.cache import DiskCache, normalize_query, search_cache_key
+
+def _payload(query, **overrides):
+    payload = {
+        "query": query,
+        "limit": 5,
+        "timeout": 15000,
+        "tbs": "",
+        "lang": "en",
+        "country": "us",
+        "location": "",
+        "scrapeOptions": {}
+    }
+    payload.update(overrides)
+    return payload
+
+def test_round_trip_and_counters(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("missing") is None
+    cache.set("key", {"data": [{"url": "http://example.com", "markdown": "Example"}]})
+    assert cache.get("key")["data"][0]["url"] == "http://example.com"
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["bytes"] > 0
+
+def test_survives_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    DiskCache(path).set("key", {"value": 1})
+    assert DiskCache(path).get("key") == {"value": 1}
+
+def test_expired_entries_miss(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), ttl=10)
+    cache.set("key", {"value": 1})
+    with patch("ai.cache.time.time", return_value=time.time() + 60):
+        assert cache.get("key") is None
+    assert cache.stats()["expired"] == 1
+
+def test_lru_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=300)
+    cache.set("old", {"value": secrets.token_hex(150)})
+    cache.set("new", {"value": secrets.token_hex(150)})
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+    assert cache.stats()["evictions"] >= 1
+
+def test_running_size_tracks_writes_without_rescanning(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=10_000)
+    cache.set("a", {"value": "x" * 100})
+    cache.set("b", {"value": "y" * 100})
+    cache.set("a", {"value": secrets.token_hex(50)})
+    assert cache._bytes == cache.stats()["bytes"]
+    # Under budget, writes never sum the whole table
+    with patch.object(DiskCache, "_stored_bytes", side_effect=AssertionError("full scan")):
+        cache.set("c", {"value": 1})
+    assert cache._bytes == cache.stats()["bytes"]
+    cache.clear()
+    assert cache._bytes == 0
+
+def test_search_key_normalizes_query():
+    assert normalize_query('  "Coral   Reefs" ') == "coral reefs"
+    assert search_cache_key(_payload("Coral reefs")) == search_cache_key(_payload("  coral   REEFS", timeout=5000))
+    assert search_cache_key(_payload("coral reefs")) != search_cache_key(_payload("coral reefs", limit=3))
+    assert search_cache_key(_payload("coral reefs")) != search_cache_key(_payload("coral reefs", scrapeOptions={"formats": ["markdown"]}))
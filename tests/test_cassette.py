@@ -0,0 +1,133 @@
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+import ai.providers as providers
+from ai.cassette import Cassette, CassetteMiss, cassette_key, set_cassette
+from ai.providers import AsyncFirecrawlClient, ModelInfo, get_model
+from conftest import chat_completion
+
+@pytest.fixture
+def cassette_path(tmp_path):
+    yield str(tmp_path / "run.jsonl.zst")
+    set_cassette(None)
+
+def test_key_ignores_timestamps_and_timeouts():
+    first = cassette_key("llm", {"prompt": "Today is 2025-01-01T10:00:00.123. Go", "timeout": 5000})
+    second = cassette_key("llm", {"prompt": "Today is 2026-03-04T11:12:13.456. Go", "timeout": 9000})
+    assert first == second
+    assert first != cassette_key("llm", {"prompt": "Something else"})
+
+def test_round_trip_replays_repeats_in_order(cassette_path):
+    recorder = Cassette(cassette_path, mode="record")
+    recorder.record("llm", {"prompt": "q"}, "first", 0.5)
+    recorder.record("llm", {"prompt": "q"}, "second", 0.5)
+    recorder.save()
+
+    player = Cassette(cassette_path, mode="replay")
+    assert player.lookup("llm", {"prompt": "q"})["response"] == "first"
+    assert player.lookup("llm", {"prompt": "q"})["response"] == "second"
+    assert player.lookup("llm", {"prompt": "q"})["response"] == "second"
+    with pytest.raises(CassetteMiss):
+        player.lookup("llm", {"prompt": "unknown"})
+    assert player.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+@patch("ai.providers.search_cache", new=None)
+async def test_firecrawl_requests_replay_without_network(cassette_path):
+    payload = {"success": True, "data": [{"url": "https://example.com", "markdown": "Content"}]}
+    response = MagicMock(status_code=200, headers={})
+    response.json.return_value = payload
+
+    set_cassette(Cassette(cassette_path, mode="record"))
+    client = AsyncFirecrawlClient()
+    with patch.object(client, "_post", new=AsyncMock(return_value=response)):
+        recorded = await client.search("coral reefs", timeout=5000, limit=1)
+    providers.get_cassette().save()
+
+    set_cassette(Cassette(cassette_path, mode="replay"))
+    replay_client = AsyncFirecrawlClient()
+    with patch.object(replay_client, "_post", new=AsyncMock()) as mock_post:
+        # A different (adaptive) timeout still matches the recording
+        replayed = await replay_client.search("coral reefs", timeout=8000, limit=1)
+    assert replayed == recorded == payload
+    mock_post.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_model_calls_replay_without_network(cassette_path):
+    openai = MagicMock()
+    openai.chat.completions.create = AsyncMock(return_value=chat_completion('{"questions": []}'))
+    model_info = ModelInfo("gpt-4o")
+
+    set_cassette(Cassette(cassette_path, mode="record"))
+    with patch("ai.providers.openai_client", new=openai):
+        await get_model(model_info)("prompt at 2025-01-01T10:00:00")
+    providers.get_cassette().save()
+
+    set_cassette(Cassette(cassette_path, mode="replay"))
+    with patch("ai.providers.openai_client", new=None):
+        response = await get_model(model_info)("prompt at 2025-06-01T08:30:00")
+    assert response.choices[0].message.content == '{"questions": []}'
+    assert openai.chat.completions.create.await_count == 1
+
+@pytest.mark.asyncio
+@patch("ai.providers.search_cache", new=None)
+@patch("ai.providers.llm_cache", new=None)
+async def test_deep_research_run_replays_whatever_order_steps_finish_in(cassette_path):
+    import asyncio
+    import hashlib
+    import json
+    import re
+    from deep_research import deep_research
+    from search_backends import FirecrawlBackend
+
+    pages = {f"https://site{i}.example": f"PAGE{i}: reefs and ocean warming facts, part {i}." for i in range(5)}
+    delays = {"record": {}, "replay": {}}
+
+    def slow(mode, key):
+        # While recording, later queries finish first; replay runs without delays
+        return delays[mode].setdefault(key, 0.02 / (1 + len(delays[mode]))) if mode == "record" else 0
+
+    async def firecrawl_post(path, json=None, timeout=None, mode="record"):
+        query = json["query"]
+        await asyncio.sleep(slow(mode, "search:" + query))
+        start = int(hashlib.sha256(query.encode()).hexdigest(), 16) % 5
+        urls = [f"https://site{(start + i) % 5}.example" for i in range(min(json["limit"], 3))]
+        body = {"success": True, "data": [{"url": url, "markdown": pages[url]} for url in urls]}
+        return MagicMock(status_code=200, headers={}, json=MagicMock(return_value=body))
+
+    async def create(mode="record", **kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        schema = kwargs["response_format"]["json_schema"]["name"]
+        await asyncio.sleep(slow(mode, prompt))
+        tag = hashlib.sha256(prompt.encode()).hexdigest()[:6]
+        if schema == "SerpQueriesSchema":
+            content = {"queries": [{"query": f"q-{tag}-{i}", "researchGoal": "reefs"} for i in range(2)]}
+        else:
+            content = {"learnings": ["Learned " + " ".join(sorted(set(re.findall(r"PAGE\d", prompt))))],
+                       "followUpQuestions": [f"follow {tag}"]}
+        return chat_completion(json.dumps(content))
+
+    async def run(mode):
+        async def model_call(**kwargs):
+            return await create(mode, **kwargs)
+
+        async def http_post(path, **kwargs):
+            return await firecrawl_post(path, mode=mode, **kwargs)
+
+        openai = MagicMock()
+        openai.chat.completions.create = AsyncMock(side_effect=model_call)
+        with patch("ai.providers.openai_client", new=openai), \
+                patch("ai.providers.httpx.AsyncClient.post", new=AsyncMock(side_effect=http_post)):
+            return await deep_research("coral reefs", breadth=2, depth=2, model_info=ModelInfo("gpt-4o"),
+                                       search_backend=FirecrawlBackend())
+
+    set_cassette(Cassette(cassette_path, mode="record"))
+    recorded = await run("record")
+    providers.get_cassette().save()
+    assert recorded["learnings"]
+
+    player = Cassette(cassette_path, mode="replay")
+    set_cassette(player)
+    replayed = await run("replay")
+    assert player.stats()["misses"] == 0
+    assert replayed["learnings"] == recorded["learnings"]
+    assert [u["url"] for u in replayed["visited_urls"]] == [u["url"] for u in recorded["visited_urls"]]
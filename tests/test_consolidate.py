@@ -0,0 +1,32 @@
+from consolidate import cluster_learnings, consolidate_learnings, similarity_matrix
+
+LEARNINGS = [
+    "Coral bleaching rose 14% in 2020 as ocean temperatures climbed.",
+    "Ocean acidification slows coral skeleton growth.",
+    "In 2020 coral bleaching increased by 14% because ocean temperatures climbed sharply.",
+    "Coral bleaching rose 30% in 2016 as ocean temperatures climbed.",
+    "Acidification of the ocean slows the growth of coral skeletons.",
+]
+
+def test_similarity_matrix_is_cosine():
+    similarity = similarity_matrix(LEARNINGS)
+    assert similarity.shape == (5, 5)
+    assert all(abs(similarity[i, i] - 1) < 1e-5 for i in range(5))
+    assert similarity[0, 2] > similarity[0, 1]
+
+def test_paraphrases_merge_but_different_figures_do_not():
+    clusters = cluster_learnings(LEARNINGS, threshold=0.5)
+    assert [sorted(cluster.members) for cluster in clusters] == [[0, 2], [1, 4], [3]]
+    # The more specific phrasing represents the cluster
+    assert clusters[0].representative == 2
+
+def test_consolidated_learnings_keep_every_source():
+    sources = [["https://a.example"], ["https://b.example"], ["https://c.example", "https://a.example"], [], []]
+    merged = consolidate_learnings(LEARNINGS, sources, threshold=0.5)
+    assert merged[0] == {
+        "learning": LEARNINGS[2],
+        "merged": [LEARNINGS[0]],
+        "sources": ["https://a.example", "https://c.example"],
+    }
+    assert [entry["learning"] for entry in merged[1:]] == [LEARNINGS[1], LEARNINGS[3]]
+    assert consolidate_learnings([], []) == []
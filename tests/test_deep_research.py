@@ -0,0 +1,113 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+from page_store import PageStore
+from search_backends import FakeSearchBackend, SearchResult
+
+@pytest.mark.asyncio
+async def test_two_phase_search_scrapes_best_unvisited_hits():
+    from deep_research import two_phase_search
+
+    backend = FakeSearchBackend()
+    backend.add("coral reef decline", [
+        SearchResult("https://visited.example", "Coral reefs", "Coral reef decline"),
+        SearchResult("https://offtopic.example", "Football scores", "Weekend results"),
+        SearchResult("https://best.example", "Coral reef decline", "Why coral reefs decline", "Scraped page"),
+    ])
+    store = PageStore()
+    store.add({"url": "https://visited.example", "markdown": "Already have this"})
+
+    result = await two_phase_search("coral reef decline", "Find causes of coral reef decline",
+                                    limit=1, timeout=5000, page_store=store, candidate_limit=3,
+                                    search_backend=backend)
+
+    assert [r.url for r in result["data"]] == ["https://best.example"]
+    assert result["data"][0].markdown == "Scraped page"
+    assert result["candidates"] == 3
+    assert result["unvisited"] == 2
+    # One SERP-only search plus a single scrape
+    assert backend.calls == 2
+
+@pytest.mark.asyncio
+async def test_streamed_search_registers_and_trims_pages():
+    from deep_research import streamed_search
+    from search_policy import SearchPolicy
+
+    backend = FakeSearchBackend(page_chars=300)
+    backend.add("coral reef decline", [
+        SearchResult("https://visited.example", "Coral reefs"),
+        SearchResult("https://new.example", "Coral reef decline"),
+    ])
+    store = PageStore()
+    visited_id = store.add({"url": "https://visited.example", "markdown": "Already have this"})
+
+    result = await streamed_search("coral reef decline", "Find causes", limit=2, timeout=5000,
+                                   page_store=store, search_policy=SearchPolicy(straggler_factor=0),
+                                   search_backend=backend)
+
+    assert [r.url for r in result["data"]] == ["https://new.example"]
+    assert result["page_ids"][0] == visited_id
+    new_id = result["page_ids"][1]
+    assert new_id in store._chunk_indexes
+    # Search plus one scrape; the visited page is not fetched again
+    assert backend.calls == 2
+
+@pytest.mark.asyncio
+@patch("deep_research.generate_object", new_callable=AsyncMock)
+async def test_process_serp_result_sends_relevant_passages_from_deep_in_the_page(mock_generate_object):
+    from deep_research import process_serp_result, SerpResultSchema
+    from ai.providers import ModelInfo
+
+    mock_generate_object.return_value = {
+        "object": SerpResultSchema(learnings=[], followUpQuestions=[]),
+        "raw": {}
+    }
+    boilerplate = "\n\n".join(f"Menu entry {i}: home, about, shop, contact, careers." for i in range(2000))
+    fact = "Coral cover on the reef fell 14 percent after the 2016 bleaching event."
+    result = {"data": [{"url": "https://reef.example", "title": "Reef report", "markdown": boilerplate + "\n\n" + fact}]}
+
+    await process_serp_result("coral bleaching", result, model_info=ModelInfo("gpt-4o", context_size=4000),
+                              research_goal="How much coral cover was lost")
+
+    prompt = mock_generate_object.await_args.kwargs["prompt"]
+    assert fact in prompt
+    assert len(prompt) < len(boilerplate)
+
+@pytest.mark.asyncio
+@patch("deep_research.generate_object", new_callable=AsyncMock)
+async def test_pages_claimed_by_another_query_still_give_some_context(mock_generate_object):
+    from deep_research import process_serp_result, SerpResultSchema
+    from ai.providers import ModelInfo
+
+    mock_generate_object.return_value = {"object": SerpResultSchema(learnings=["a"], followUpQuestions=[]), "raw": {}}
+    store = PageStore()
+    page_id = store.add({"url": "https://reef.example", "markdown": "Reef cover fell 14 percent. " * 2000})
+    store.claim([page_id])
+
+    await process_serp_result("coral", {"page_ids": [page_id]}, model_info=ModelInfo("gpt-4o"), page_store=store)
+    mock_generate_object.assert_not_called()
+
+    await process_serp_result("coral", {"page_ids": [page_id]}, model_info=ModelInfo("gpt-4o"), page_store=store,
+                              revisit_tokens=500)
+    prompt = mock_generate_object.await_args.kwargs["prompt"]
+    assert "Reef cover fell 14 percent" in prompt
+    assert len(prompt) < 500 * 6
+
+@pytest.mark.asyncio
+async def test_queries_that_learn_nothing_are_not_researched_deeper():
+    from deep_research import deep_research, SerpQueriesSchema, SerpQuery, SerpResultSchema
+    from research_scheduler import ResearchScheduler
+    from search_policy import SearchPolicy
+
+    async def fake_generate_object(model, system, prompt, schema):
+        if schema is SerpQueriesSchema:
+            return {"object": SerpQueriesSchema(queries=[SerpQuery(query=f"q{i}", researchGoal="g") for i in range(2)])}
+        learnings = [] if "<query>q1</query>" in prompt else ["learned"]
+        return {"object": SerpResultSchema(learnings=learnings, followUpQuestions=["more"])}
+
+    scheduler = ResearchScheduler()
+    with patch("deep_research.generate_object", new=fake_generate_object):
+        await deep_research("coral reefs", breadth=2, depth=2, search_policy=SearchPolicy(),
+                            search_backend=FakeSearchBackend(), scheduler=scheduler)
+    expanded_from = {scheduler.nodes[node.parent].query for node in scheduler.nodes.values()
+                     if node.kind == "expand" and node.parent is not None}
+    assert expanded_from == {"q0"}
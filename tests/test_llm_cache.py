@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from openai.types.chat.chat_completion import ChatCompletion
+from pydantic import BaseModel
+from typing import List
+from ai.ai import generate_object
+from ai.cache import DiskCache, llm_cache_key
+from ai.providers import ModelInfo, get_model
+from prompt import current_time, system_prompt
+
+class QuestionsSchema(BaseModel):
+    questions: List[str]
+
+class QueriesSchema(BaseModel):
+    queries: List[str]
+
+def _openai_client(content):
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=ChatCompletion.model_validate({
+        "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    }))
+    return client
+
+@pytest.fixture
+def llm_cache(tmp_path):
+    cache = DiskCache(str(tmp_path / "llm.sqlite3"))
+    with patch("ai.providers.llm_cache", new=cache):
+        yield cache
+    cache.close()
+
+def test_key_depends_on_model_params_schema_and_prompt():
+    base = llm_cache_key("openai", "gpt-4o", "prompt", {"temperature": 0.3}, QuestionsSchema)
+    assert base == llm_cache_key("openai", "gpt-4o", "prompt  \r\n", {"temperature": 0.3}, QuestionsSchema)
+    assert base != llm_cache_key("openai", "gpt-4o-mini", "prompt", {"temperature": 0.3}, QuestionsSchema)
+    assert base != llm_cache_key("openai", "gpt-4o", "prompt", {"temperature": 0.7}, QuestionsSchema)
+    assert base != llm_cache_key("openai", "gpt-4o", "prompt", {"temperature": 0.3}, QueriesSchema)
+    assert base != llm_cache_key("openai", "gpt-4o", "other prompt", {"temperature": 0.3}, QuestionsSchema)
+
+def test_system_prompt_is_stable_within_a_day():
+    assert current_time("day").count("-") == 2 and "T" not in current_time("day")
+    assert system_prompt("day") == system_prompt("day")
+
+@pytest.mark.asyncio
+async def test_repeated_calls_are_served_from_cache(llm_cache):
+    client = _openai_client('{"questions": ["Why?"]}')
+    with patch("ai.providers.openai_client", new=client):
+        model = get_model(ModelInfo("gpt-4o"))
+        first = await generate_object(model=model, system=system_prompt(), prompt="Reefs", schema=QuestionsSchema)
+        second = await generate_object(model=model, system=system_prompt(), prompt="Reefs", schema=QuestionsSchema)
+
+    assert first["object"] == second["object"] == QuestionsSchema(questions=["Why?"])
+    assert second["raw"]["cached"] is True
+    assert client.chat.completions.create.await_count == 1
+    assert llm_cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_bypass_and_failed_parses_skip_cache(llm_cache):
+    client = _openai_client('{"questions": ["Why?"]}')
+    with patch("ai.providers.openai_client", new=client):
+        model = get_model(ModelInfo("gpt-4o", use_cache=False))
+        await generate_object(model=model, prompt="Reefs", schema=QuestionsSchema)
+        await generate_object(model=model, prompt="Reefs", schema=QuestionsSchema)
+    assert client.chat.completions.create.await_count == 2
+
+    broken = _openai_client("not json")
+    with patch("ai.providers.openai_client", new=broken):
+        model = get_model(ModelInfo("gpt-4o"))
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await generate_object(model=model, prompt="Reefs", schema=QuestionsSchema)
+    # Each call makes one bounded repair attempt before giving up
+    assert broken.chat.completions.create.await_count == 4
+    assert llm_cache.stats()["writes"] == 0
@@ -0,0 +1,102 @@
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+from unittest.mock import patch, AsyncMock, MagicMock
+from ai.providers import ModelInfo, get_model
+from ai.rate_limit import AdaptiveConcurrency, ConcurrencyLimits, parse_reset
+from conftest import chat_completion
+
+def _rate_limited(headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers or {}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+def test_parse_reset_formats():
+    assert parse_reset("1s") == 1.0
+    assert parse_reset("6m0s") == 360.0
+    assert parse_reset("20ms") == pytest.approx(0.02)
+    assert parse_reset("12") == 12.0
+    now = time.time()
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now + 30))
+    assert 28 <= parse_reset(stamp, now) <= 31
+
+def test_limit_grows_on_success_and_halves_on_overload():
+    limit = AdaptiveConcurrency(initial=4, max_limit=8, cooldown=0)
+    # About one more slot per round of `limit` successful calls
+    for _ in range(5):
+        limit.on_success()
+    assert limit.capacity == 5
+    for _ in range(200):
+        limit.on_success()
+    assert limit.capacity == 8
+    limit.on_overload()
+    assert limit.capacity == 4
+
+def test_overloads_in_one_burst_cut_once():
+    limit = AdaptiveConcurrency(initial=16, cooldown=60)
+    for _ in range(5):
+        limit.on_overload()
+    assert limit.capacity == 8
+    assert limit.stats()["overloaded"] == 5
+
+def test_headers_hold_growth_and_pause_when_quota_is_used_up():
+    limit = AdaptiveConcurrency(initial=4)
+    limit.on_success({"x-ratelimit-remaining-requests": "5", "x-ratelimit-limit-requests": "100"})
+    assert limit.limit == 4
+    limit.on_success({"anthropic-ratelimit-tokens-remaining": "0", "anthropic-ratelimit-tokens-limit": "80000",
+                      "anthropic-ratelimit-tokens-reset": "5s"})
+    assert limit.limit == 4
+    assert 4 < limit.stats()["blocked_for"] <= 5
+    assert limit.on_overload({"retry-after": "7"}) == 7.0
+
+@pytest.mark.asyncio
+async def test_slots_cap_concurrent_calls():
+    limit = AdaptiveConcurrency(initial=2, max_limit=2)
+    running = []
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limit.slot():
+            running.append(1)
+            peak = max(peak, len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+    assert limit.stats()["in_flight"] == 0
+    assert limit.stats()["queued"] == 4
+
+@pytest.mark.asyncio
+@patch("ai.providers.llm_cache", new=None)
+@patch("ai.providers.llm_concurrency", new=ConcurrencyLimits(initial=8, cooldown=0))
+async def test_model_call_retries_429_and_lowers_the_limit():
+    from ai import providers
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=[_rate_limited({"retry-after": "0"}), chat_completion("ok")])
+    with patch("ai.providers.openai_client", new=client), patch("ai.providers.asyncio.sleep", new=AsyncMock()):
+        response = await get_model(ModelInfo("gpt-4o"))("prompt")
+
+    assert response.choices[0].message.content == "ok"
+    assert client.chat.completions.create.await_count == 2
+    stats = providers.llm_concurrency.stats()["openai:gpt-4o"]
+    assert stats["overloaded"] == 1
+    assert 4 <= stats["limit"] < 5
+
+@pytest.mark.asyncio
+@patch("ai.providers.llm_cache", new=None)
+@patch("ai.providers.llm_concurrency", new=ConcurrencyLimits(initial=8, cooldown=0))
+async def test_client_errors_are_not_retried():
+    from ai import providers
+    error = openai.BadRequestError("bad request", response=httpx.Response(
+        400, request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions")), body=None)
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=error)
+    with patch("ai.providers.openai_client", new=client):
+        with pytest.raises(Exception, match="bad request"):
+            await get_model(ModelInfo("gpt-4o-mini"))("prompt")
+    assert client.chat.completions.create.await_count == 1
+    assert providers.llm_concurrency.stats()["openai:gpt-4o-mini"]["in_flight"] == 0
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch
+from ai.providers import ModelInfo
+from ai.routing import StageModels
+from ai.usage import UsageTracker, current_usage, estimate_cost, record_usage, usage_stage
+from search_backends import FakeSearchBackend
+from search_policy import SearchPolicy
+
+def test_stage_models_precedence():
+    main = ModelInfo("gpt-4o")
+    with patch.dict("ai.routing.STAGE_MODEL_DEFAULTS", {"queries": "gpt-4o-mini", "report": "gpt-4o-mini"}):
+        stages = StageModels(main, {"report": "o3-mini"})
+    assert stages["feedback"] is main
+    assert stages["learnings"] is main
+    assert stages["queries"].model == "gpt-4o-mini"
+    assert stages["report"].model == "o3-mini-2025-01-31"
+    assert StageModels(main, {"queries": "gpt-4o"})["queries"] is main
+
+def test_stage_models_reject_unknown_stage():
+    with pytest.raises(ValueError):
+        StageModels(ModelInfo("gpt-4o"), {"summary": "gpt-4o-mini"})
+
+def test_usage_is_reported_per_stage_with_cost():
+    response = {"usage": {"prompt_tokens": 1_000_000, "completion_tokens": 100_000,
+                          "prompt_tokens_details": {"cached_tokens": 200_000}}}
+    assert estimate_cost("gpt-4o-mini", {"prompt_tokens": 1_000_000, "completion_tokens": 100_000,
+                                         "cached_tokens": 200_000}) == pytest.approx(0.8 * 0.15 + 0.2 * 0.075 + 0.1 * 0.60)
+    assert estimate_cost("unknown-model", {"prompt_tokens": 1000}) == 0
+
+    job_usage = UsageTracker()
+    token = current_usage.set(job_usage)
+    try:
+        with usage_stage("queries"):
+            record_usage("gpt-4o-mini", response, seconds=1.0)
+            record_usage("gpt-4o-mini", response, seconds=3.0)
+        with usage_stage("report"):
+            record_usage("gpt-4o", response, seconds=10.0)
+        record_usage("gpt-4o", response)
+    finally:
+        current_usage.reset(token)
+
+    stages = job_usage.stats()["stages"]
+    assert stages["queries"]["calls"] == 2
+    assert stages["queries"]["avg_seconds"] == 2.0
+    assert stages["report"]["cost_usd"] > stages["queries"]["cost_usd"] > 0
+    assert stages["other"]["calls"] == 1
+
+@pytest.mark.asyncio
+async def test_deep_research_routes_stages_to_their_models():
+    from deep_research import deep_research, SerpQueriesSchema, SerpQuery, SerpResultSchema
+
+    seen = []
+
+    async def fake_generate_object(model, system, prompt, schema):
+        seen.append((schema.__name__, model.model_info.model))
+        if schema is SerpQueriesSchema:
+            return {"object": SerpQueriesSchema(queries=[SerpQuery(query="coral", researchGoal="reefs")])}
+        return {"object": SerpResultSchema(learnings=["A learning"], followUpQuestions=[])}
+
+    stages = StageModels(ModelInfo("gpt-4o"), {"queries": "gpt-4o-mini", "learnings": "o1-mini"})
+    with patch("deep_research.generate_object", new=fake_generate_object):
+        result = await deep_research("coral reefs", breadth=1, depth=1, stage_models=stages,
+                                     search_policy=SearchPolicy(), search_backend=FakeSearchBackend())
+
+    assert result["learnings"] == ["A learning"]
+    assert seen == [("SerpQueriesSchema", "gpt-4o-mini"), ("SerpResultSchema", "o1-mini")]
+
+def test_cli_rejects_unknown_stage_model_with_usage(capsys):
+    import asyncio
+    import run
+    with patch("sys.argv", ["run.py", "--queries-model=no-such-model"]):
+        with pytest.raises(SystemExit):
+            asyncio.run(run.run())
+    assert "Usage:" in capsys.readouterr().out
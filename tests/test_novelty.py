@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from consolidate import novel_learnings
+from novelty import NoveltyPolicy
+from research_scheduler import ResearchScheduler
+from search_backends import FakeSearchBackend
+from search_policy import SearchPolicy
+
+def test_novel_learnings_ignores_paraphrases_of_known_ones():
+    known = ["Warm oceans bleach coral reefs.", "Coral bleaching rose 14% in 2020."]
+    new = ["Coral reefs bleach in warm oceans.", "Coral bleaching rose 30% in 2016.", "Overfishing removes grazing fish."]
+    assert novel_learnings(new, known) == [False, True, True]
+    assert novel_learnings(new, []) == [True, True, True]
+
+def test_policy_prunes_only_when_every_enabled_measure_is_low():
+    policy = NoveltyPolicy(min_new_urls=0.5, min_new_learnings=0.5)
+    assert not policy.assess("a", 2, urls=4, new_urls=1, learnings=2, new_learnings=2)["pruned"]
+    assert policy.assess("b", 2, urls=4, new_urls=1, learnings=2, new_learnings=0)["pruned"]
+    # Nothing found counts as nothing new
+    assert policy.assess("c", 2, urls=0, new_urls=0, learnings=0, new_learnings=0)["pruned"]
+    assert [decision["query"] for decision in policy.pruned()] == ["b", "c"]
+    assert policy.stats()["assessed"] == 3
+
+    off = NoveltyPolicy(min_new_urls=0, min_new_learnings=0)
+    assert not off.enabled
+    assert not off.assess("d", 2, urls=4, new_urls=0, learnings=2, new_learnings=0)["pruned"]
+
+@pytest.mark.asyncio
+async def test_saturated_branches_are_not_researched_deeper():
+    from deep_research import deep_research, SerpQueriesSchema, SerpQuery, SerpResultSchema
+
+    facts = ["Warm oceans bleach coral reefs.", "Overfishing removes grazing fish from reefs.",
+             "Runoff carries nutrients that feed algae.", "Storms break branching corals apart."]
+
+    async def fake_generate_object(model, system, prompt, schema):
+        await asyncio.sleep(0)
+        if schema is SerpQueriesSchema:
+            tag = prompt.count("Follow-up")
+            return {"object": SerpQueriesSchema(queries=[
+                SerpQuery(query=f"q{tag}-{i}", researchGoal="goal") for i in range(4)
+            ])}
+        query = prompt.split("<query>")[1].split("</query>")[0]
+        # First-level queries learn something new; their follow-ups only rephrase the first fact
+        learning = facts[int(query[-1])] if query.startswith("q0") else "Coral reefs bleach in warm oceans."
+        return {"object": SerpResultSchema(learnings=[learning], followUpQuestions=["more"])}
+
+    async def run(policy):
+        scheduler = ResearchScheduler(search_workers=2, llm_workers=2)
+        result = await deep_research("coral reefs", breadth=4, depth=3, search_policy=SearchPolicy(),
+                                     search_backend=FakeSearchBackend(), scheduler=scheduler, novelty_policy=policy)
+        return result, scheduler
+
+    with patch("deep_research.generate_object", new=fake_generate_object):
+        full, full_scheduler = await run(NoveltyPolicy(min_new_urls=0, min_new_learnings=0))
+        pruned, scheduler = await run(NoveltyPolicy(min_new_urls=0, min_new_learnings=0.5))
+
+    # 4 first-level queries with 2 follow-ups each; all 8 follow-ups only repeat a known fact
+    assert len(pruned["pruned_branches"]) == 8
+    assert all(decision["learning_novelty"] == 0 and decision["depth"] == 2 for decision in pruned["pruned_branches"])
+    assert scheduler.stats()["pruned"] == 8
+    assert not any(node.depth == 1 for node in scheduler.nodes.values())
+    assert len(scheduler.nodes) < len(full_scheduler.nodes)
+    assert full["pruned_branches"] == []
+    assert pruned["learnings"] == full["learnings"]
+
+@pytest.mark.asyncio
+async def test_two_phase_url_novelty_counts_visited_hits():
+    from deep_research import deep_research, SerpQueriesSchema, SerpQuery, SerpResultSchema
+    from page_store import PageStore
+    from search_backends import SearchResult
+
+    known = [SearchResult(url=f"https://known.example/{i}", markdown="Known page.") for i in range(3)]
+    backend = FakeSearchBackend()
+    for i in range(4):
+        # First-level queries find only unseen pages; follow-ups mostly pages the job already has
+        backend.add(f"q0-{i}", [SearchResult(url=f"https://first.example/{i}/{j}", title=f"q0-{i}") for j in range(4)])
+        backend.add(f"q1-{i}", known + [SearchResult(url=f"https://second.example/{i}", title=f"q1-{i}")])
+
+    async def fake_generate_object(model, system, prompt, schema):
+        await asyncio.sleep(0)
+        if schema is SerpQueriesSchema:
+            tag = prompt.count("Follow-up")
+            return {"object": SerpQueriesSchema(queries=[
+                SerpQuery(query=f"q{tag}-{i}", researchGoal="goal") for i in range(4)
+            ])}
+        query = prompt.split("<query>")[1].split("</query>")[0]
+        return {"object": SerpResultSchema(learnings=[f"Fact from {query}."], followUpQuestions=["more"])}
+
+    page_store = PageStore()
+    page_store.add_many(known)
+    with patch("deep_research.generate_object", new=fake_generate_object):
+        result = await deep_research(
+            "coral reefs", breadth=4, depth=3, page_store=page_store,
+            search_policy=SearchPolicy(two_phase=True, candidate_multiplier=1, limit_override=4),
+            search_backend=backend, scheduler=ResearchScheduler(search_workers=2, llm_workers=2),
+            novelty_policy=NoveltyPolicy(min_new_urls=0.5, min_new_learnings=0)
+        )
+
+    # Only the unvisited follow-up page is scraped, but novelty still counts the visited hits
+    assert result["pruned_branches"]
+    assert all(decision["query"].startswith("q1") and decision["urls"] == 4 and decision["url_novelty"] <= 0.25
+               for decision in result["pruned_branches"])
+
+def test_store_index_grows_with_the_store():
+    from research_store import ResearchStore
+    store = ResearchStore()
+    store.add_learnings(["Warm oceans bleach coral reefs."])
+    assert len(store.learning_index()) == 1
+    known = len(store.learnings)
+    ids = store.add_learnings(["Coral reefs bleach in warm oceans.", "Overfishing removes grazing fish."])
+    index = store.learning_index()
+    assert len(index) == 3
+    assert [index.is_novel(i, known) for i in ids] == [False, True]
+
+def test_request_thresholds_are_fractions():
+    from pydantic import ValidationError
+    from api import ResearchRequest
+    assert ResearchRequest(user_id="u", prompt="p", min_new_learnings=0.3).min_new_learnings == 0.3
+    for value in (-0.1, 1.5):
+        with pytest.raises(ValidationError):
+            ResearchRequest(user_id="u", prompt="p", min_new_urls=value)
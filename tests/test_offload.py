@@ -0,0 +1,51 @@
+import asyncio
+import time
+import pytest
+from ai.latency import LoopLagMonitor
+from ai.offload import CpuOffload, trim_prompt_async
+from ai.text import trim_prompt
+
+PAGE = "\n\n".join(f"Paragraph {i} says revenue grew {i} percent." for i in range(5000))
+
+def test_mode_follows_size_thresholds():
+    offload = CpuOffload(inline_max_chars=100, process_min_chars=1000, threads=2, processes=1)
+    assert offload.mode(50) == "inline"
+    assert offload.mode(500) == "thread"
+    assert offload.mode(5000) == "process"
+    assert CpuOffload(inline_max_chars=100, process_min_chars=0, threads=2).mode(5000) == "thread"
+
+@pytest.mark.asyncio
+async def test_small_inputs_stay_inline():
+    offload = CpuOffload(inline_max_chars=100, process_min_chars=0)
+    assert await offload.run(10, len, "short") == 5
+    assert offload._thread_pool is None
+    assert offload.stats()["inline"]["count"] == 1
+
+@pytest.mark.asyncio
+async def test_thread_and_process_pools_match_inline_trim():
+    offload = CpuOffload(inline_max_chars=100, process_min_chars=len(PAGE), threads=2, processes=1)
+    try:
+        threaded = await offload.run(len(PAGE) - 1, trim_prompt, PAGE, 500)
+        in_process = await offload.run(len(PAGE), trim_prompt, PAGE, 500)
+    finally:
+        offload.shutdown()
+    assert threaded == in_process == trim_prompt(PAGE, 500)
+    assert offload.stats()["thread"]["count"] == 1
+    assert offload.stats()["process"]["count"] == 1
+
+@pytest.mark.asyncio
+async def test_trim_prompt_async():
+    assert await trim_prompt_async(PAGE, 500) == trim_prompt(PAGE, 500)
+    assert await trim_prompt_async("", 500) == ""
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_sees_blocking_work():
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    await asyncio.sleep(0.05)
+    time.sleep(0.2)  # blocks the loop, as inline CPU work would
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+    stats = monitor.stats()
+    assert stats["count"] >= 2
+    assert stats["max_ms"] >= 150
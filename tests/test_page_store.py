@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+from page_store import PageStore, canonical_url
+
+def _item(url, markdown="Example content", **extra):
+    return {"url": url, "markdown": markdown, "title": "Example", **extra}
+
+def test_canonical_url_strips_noise():
+    assert canonical_url("http://www.Example.com/a/?utm_source=x&b=2#top") == "https://example.com/a?b=2"
+    assert canonical_url("https://example.com/a") == canonical_url("https://example.com/a/")
+
+def test_same_page_is_stored_once():
+    store = PageStore()
+    first = store.add(_item("https://example.com/a"))
+    second = store.add(_item("http://www.example.com/a/?utm_medium=email"))
+    mirror = store.add(_item("https://mirror.example.org/a"))
+
+    assert first == second == mirror
+    assert store.stats()["pages"] == 1
+    assert store.stats()["duplicates"] == 2
+
+def test_reference_drops_content():
+    store = PageStore()
+    page_id = store.add(_item("https://example.com/a"))
+    reference = store.reference(page_id)
+    assert "markdown" not in reference
+    assert reference["url"] == "https://example.com/a"
+    assert reference["page_id"] == page_id
+
+def test_claim_only_returns_new_pages():
+    store = PageStore()
+    ids = store.add_many([_item("https://example.com/a", "A"), _item("https://example.com/b", "B")])
+    assert store.claim(ids[:1]) == ids[:1]
+    assert store.claim(ids) == ids[1:]
+    store.release(ids[:1])
+    assert not store.is_summarised(ids[0])
+
+@pytest.mark.asyncio
+@patch("deep_research.generate_object", new_callable=AsyncMock)
+async def test_process_serp_result_skips_summarised_pages(mock_generate_object):
+    from deep_research import process_serp_result, SerpResultSchema
+
+    mock_generate_object.return_value = {
+        "object": SerpResultSchema(learnings=["A learning"], followUpQuestions=["A question"]),
+        "raw": {}
+    }
+    store = PageStore()
+    result = {"data": [_item("https://example.com/a", "Page A")]}
+
+    first = await process_serp_result("query", result, page_store=store)
+    second = await process_serp_result("query", result, page_store=store)
+
+    assert first.learnings == ["A learning"]
+    assert second.learnings == []
+    mock_generate_object.assert_awaited_once()
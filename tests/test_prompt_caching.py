@@ -0,0 +1,69 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+from openai.types.chat.chat_completion import ChatCompletion
+from pydantic import BaseModel
+from typing import List
+from ai.ai import generate_object
+from ai.providers import ModelInfo, get_model
+from ai.usage import UsageTracker, current_usage, extract_usage
+
+class QuestionsSchema(BaseModel):
+    questions: List[str]
+
+@pytest.mark.asyncio
+@patch("ai.providers.llm_cache", new=None)
+async def test_openai_gets_system_prompt_as_leading_message():
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=ChatCompletion.model_validate({
+        "id": "cmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": '{"questions": []}'}}],
+        "usage": {"prompt_tokens": 2000, "completion_tokens": 10, "total_tokens": 2010,
+                  "prompt_tokens_details": {"cached_tokens": 1536}},
+    }))
+    job_usage = UsageTracker()
+    current_usage.set(job_usage)
+    with patch("ai.providers.openai_client", new=client):
+        await generate_object(model=get_model(ModelInfo("gpt-4o")), system="Shared instructions",
+                              prompt="Variable part", schema=QuestionsSchema)
+
+    messages = client.chat.completions.create.call_args.kwargs["messages"]
+    assert messages == [
+        {"role": "system", "content": "Shared instructions"},
+        {"role": "user", "content": "Variable part"},
+    ]
+    total = job_usage.stats()["total"]
+    assert total["cached_tokens"] == 1536
+    assert total["cached_ratio"] == pytest.approx(0.768)
+
+@pytest.mark.asyncio
+@patch("ai.providers.llm_cache", new=None)
+async def test_anthropic_marks_system_prompt_cacheable():
+    usage = SimpleNamespace(input_tokens=100, output_tokens=20,
+                            cache_read_input_tokens=1500, cache_creation_input_tokens=0)
+    client = MagicMock()
+    client.messages.create = AsyncMock(return_value=SimpleNamespace(
+        id="msg-1", model="claude-3-5-sonnet-latest", stop_reason="end_turn", usage=usage,
+        content=[SimpleNamespace(text='{"questions": []}')]
+    ))
+    with patch("ai.providers.anthropic_client", new=client):
+        response = await get_model(ModelInfo("claude-3-5-sonnet-latest"))("Variable part", system="Shared instructions")
+
+    kwargs = client.messages.create.call_args.kwargs
+    assert kwargs["system"] == [{"type": "text", "text": "Shared instructions", "cache_control": {"type": "ephemeral"}}]
+    assert kwargs["messages"] == [{"role": "user", "content": "Variable part"}]
+    assert extract_usage(response) == {
+        "prompt_tokens": 1600, "completion_tokens": 20, "cached_tokens": 1500, "cache_write_tokens": 0
+    }
+
+@pytest.mark.asyncio
+async def test_plain_callables_still_get_inline_system_prompt():
+    prompts = []
+
+    async def model(prompt, **kwargs):
+        prompts.append(prompt)
+        return {"choices": [{"message": {"content": '{"questions": ["Why?"]}'}}]}
+
+    await generate_object(model=model, system="System", prompt="Prompt", schema=QuestionsSchema)
+    assert prompts == ["System\nPrompt"]
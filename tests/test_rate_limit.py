@@ -0,0 +1,72 @@
+import asyncio
+import fcntl
+import time
+import pytest
+from ai.rate_limit import TokenBucket, backoff_delay, parse_retry_after
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("not a date") is None
+    now = time.time()
+    http_date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(now + 30))
+    assert 28 <= parse_retry_after(http_date, now) <= 31
+
+def test_backoff_is_jittered_and_respects_retry_after():
+    delays = {round(backoff_delay(1), 6) for _ in range(20)}
+    assert len(delays) > 1
+    assert all(3.0 <= d <= 6.0 for d in delays)
+    assert backoff_delay(0, retry_after=20) >= 20
+
+def test_bucket_allows_burst_then_throttles():
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket._try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket._try_acquire()
+    assert 0 < wait <= 0.5
+
+def test_unlimited_bucket_still_honours_retry_after():
+    bucket = TokenBucket(rate=0)
+    assert bucket._try_acquire() == 0.0
+    assert bucket.observe(429, {"Retry-After": "5"}) == 5.0
+    assert 4 < bucket._try_acquire() <= 5
+
+def test_rate_decreases_on_429_and_recovers():
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.observe(429, {})
+    lowered = bucket.stats()["current_rate"]
+    assert lowered < 10
+    for _ in range(100):
+        bucket.observe(200, {})
+    assert bucket.stats()["current_rate"] == 10
+
+def test_rate_limit_headers_pace_remaining_quota():
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.observe(200, {"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": "10"})
+    assert bucket.stats()["current_rate"] == pytest.approx(1.0)
+    bucket.observe(200, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "10"})
+    assert bucket.stats()["blocked_for"] > 9
+
+def test_file_backed_bucket_is_shared(tmp_path):
+    path = str(tmp_path / "bucket.json")
+    first = TokenBucket(rate=1, burst=2, state_path=path)
+    second = TokenBucket(rate=1, burst=2, state_path=path)
+    assert first._try_acquire() == 0.0
+    assert second._try_acquire() == 0.0
+    assert first._try_acquire() > 0
+    second.observe(429, {"Retry-After": "30"})
+    assert first._try_acquire() > 29
+
+@pytest.mark.asyncio
+async def test_file_lock_waits_off_the_event_loop(tmp_path):
+    path = str(tmp_path / "bucket.json")
+    bucket = TokenBucket(rate=10, burst=1, state_path=path)
+    with open(path, "a+") as held:
+        # Another worker process holds the state file
+        fcntl.flock(held, fcntl.LOCK_EX)
+        acquire = asyncio.create_task(bucket.acquire())
+        started = time.perf_counter()
+        await asyncio.sleep(0.05)
+        assert time.perf_counter() - started < 0.5
+        assert not acquire.done()
+        fcntl.flock(held, fcntl.LOCK_UN)
+    await asyncio.wait_for(acquire, 1)
@@ -0,0 +1,50 @@
+from relevance import GAP_MARKER, ChunkIndex, rank_snippets, split_chunks, tokenize
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("The Effects of Ocean Warming on Coral") == ["effects", "ocean", "warming", "coral"]
+
+def test_rank_snippets_prefers_relevant_hits():
+    items = [
+        {"url": "https://a.example", "title": "Celebrity news", "description": "Gossip and more"},
+        {"url": "https://b.example", "title": "Coral bleaching", "description": "Ocean warming drives coral bleaching"},
+        {"url": "https://c.example", "title": "Ocean facts", "description": "Facts about the sea"},
+    ]
+    ranked = rank_snippets(items, "coral bleaching", "Understand how ocean warming affects coral reefs")
+    assert [item["url"] for _, item in ranked] == ["https://b.example", "https://c.example", "https://a.example"]
+
+def test_split_chunks_merges_paragraphs_and_cuts_long_ones():
+    text = "Short one.\n\nShort two.\n\n" + "A long sentence about reefs. " * 200
+    chunks = split_chunks(text, chunk_chars=500)
+    assert chunks[0].startswith("Short one.\n\nShort two.")
+    assert all(len(chunk) <= 500 for chunk in chunks)
+    assert "".join(chunks).count("reefs") == 200
+
+def test_bm25_prefers_passages_with_rare_query_terms():
+    index = ChunkIndex("Home | About | Contact\n\nCoral bleaching is driven by ocean warming.\n\nSubscribe to our newsletter.", chunk_chars=50)
+    scores = index.scores("coral bleaching", "ocean warming")
+    assert scores.argmax() == 1
+    assert scores[0] == scores[2] == 0
+
+def test_select_keeps_relevant_passages_deep_in_the_page_in_document_order():
+    boilerplate = [f"Navigation menu item {i} with links and more links." for i in range(40)]
+    facts = ["Coral cover fell 14 percent after the 2016 bleaching event.",
+             "Bleaching recovery takes a decade on most reefs."]
+    paragraphs = boilerplate[:20] + [facts[0]] + boilerplate[20:] + [facts[1]]
+    index = ChunkIndex("\n\n".join(paragraphs), chunk_chars=60)
+
+    selected = index.select(40, "coral bleaching", "reef recovery")
+    assert facts[0] in selected and facts[1] in selected
+    assert selected.index(facts[0]) < selected.index(facts[1])
+    assert selected.startswith(GAP_MARKER)
+    assert "Navigation menu item 0 " not in selected
+
+def test_select_without_matches_keeps_the_top_of_the_page():
+    index = ChunkIndex("\n\n".join(f"Paragraph {i} of filler text." for i in range(50)), chunk_chars=40)
+    selected = index.select(30, "quantum chromodynamics")
+    assert selected.startswith("Paragraph 0 ")
+    assert selected.endswith(GAP_MARKER)
+
+def test_select_with_exact_counts_fits_the_budget():
+    index = ChunkIndex("\n\n".join(f"Reef survey {i} found coral bleaching." for i in range(200)), chunk_chars=100)
+    selected = index.select(500, "coral bleaching", count_tokens=len)
+    assert 300 < len(selected) <= 500
@@ -0,0 +1,87 @@
+import asyncio
+import httpx
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+from ai.providers import ModelInfo, get_stream_model
+from ai.usage import UsageTracker, current_usage
+
+def _chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+@pytest.mark.asyncio
+async def test_openai_stream_yields_chunks_and_records_usage():
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=3, prompt_tokens_details=None)
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=_aiter([
+        _chunk("# Report"), _chunk("\n\nBody"), _chunk(usage=usage)
+    ]))
+    job_usage = UsageTracker()
+    current_usage.set(job_usage)
+    with patch("ai.providers.openai_client", new=client):
+        chunks = [c async for c in get_stream_model(ModelInfo("gpt-4o"))("Write", system="System")]
+
+    assert chunks == ["# Report", "\n\nBody"]
+    assert client.chat.completions.create.call_args.kwargs["stream"] is True
+    assert job_usage.stats()["total"]["completion_tokens"] == 3
+
+@pytest.mark.asyncio
+async def test_final_report_streams_chunks_then_sources():
+    from deep_research import write_final_report
+
+    def fake_stream_model(model_info=None):
+        async def stream(prompt, system=None):
+            assert "reportMarkdown" not in prompt
+            for text in ["# Title", "\n\nFindings"]:
+                yield text
+        return stream
+
+    received = []
+    with patch("deep_research.get_stream_model", new=fake_stream_model):
+        report = await write_final_report("Topic", ["A learning"], [{"url": "https://example.com"}],
+                                          on_chunk=received.append)
+
+    assert received[:2] == ["# Title", "\n\nFindings"]
+    assert "https://example.com" in received[2]
+    assert report == "".join(received)
+
+@pytest.mark.asyncio
+async def test_report_stream_replays_then_follows():
+    from api import ReportStream
+
+    stream = ReportStream()
+    stream.append("one ")
+
+    async def collect():
+        return [chunk async for chunk in stream.follow()]
+
+    subscriber = asyncio.create_task(collect())
+    await asyncio.sleep(0)
+    stream.append("two")
+    await asyncio.sleep(0)
+    stream.close()
+    assert await subscriber == ["one ", "two"]
+
+@pytest.mark.asyncio
+async def test_sse_endpoint_sends_chunks_and_done():
+    from api import app, sessions, Session
+
+    session = Session("Topic", 2, 1, ModelInfo("gpt-4o"))
+    session.status = "completed"
+    session.report_stream.append("# Report")
+    session.report_stream.close()
+    sessions["user"]["job"] = session
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/research/stream", params={"user_id": "user", "job_id": "job"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert 'event: chunk\ndata: {"text": "# Report"}' in response.text
+    assert response.text.endswith('event: done\ndata: {"status": "completed"}\n\n')
+    del sessions["user"]
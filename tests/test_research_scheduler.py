@@ -0,0 +1,198 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from research_scheduler import (
+    FairShareLimiter, ResearchBudget, ResearchScheduler, active_schedulers, parse_weights, scheduler_stats
+)
+from search_backends import FakeSearchBackend
+from search_policy import SearchPolicy
+
+@pytest.mark.asyncio
+async def test_steps_never_exceed_the_worker_pools():
+    scheduler = ResearchScheduler(search_workers=2, llm_workers=1)
+    active = {"search": 0, "llm": 0}
+    peak = {"search": 0, "llm": 0}
+
+    def step(pool, fan_out):
+        async def run():
+            active[pool] += 1
+            peak[pool] = max(peak[pool], active[pool])
+            await asyncio.sleep(0.001)
+            active[pool] -= 1
+            for _ in range(fan_out):
+                scheduler.submit("llm" if pool == "search" else "search", step("llm" if pool == "search" else "search", fan_out - 1))
+        return run
+
+    scheduler.submit("search", step("search", 4))
+    await scheduler.run()
+    pools = scheduler.stats()["pools"]
+    assert peak == {"search": 2, "llm": 1}
+    assert pools["search"]["completed"] + pools["llm"]["completed"] == 1 + 4 + 12 + 24 + 24
+    assert pools["search"]["peak_queued"] > 2
+    assert pools["llm"]["queued"] == pools["search"]["queued"] == 0
+
+@pytest.mark.asyncio
+async def test_lower_priority_runs_first_and_failures_do_not_stall():
+    scheduler = ResearchScheduler(search_workers=1, llm_workers=1)
+    order = []
+
+    def step(name, fail=False):
+        async def run():
+            order.append(name)
+            if fail:
+                raise RuntimeError("broken step")
+        return run
+
+    scheduler.submit("search", step("shallow", fail=True), priority=2)
+    scheduler.submit("search", step("deep"), priority=1)
+    await scheduler.run()
+    assert order == ["deep", "shallow"]
+    assert scheduler.stats()["pools"]["search"]["failed"] == 1
+
+@pytest.mark.asyncio
+async def test_deep_research_runs_the_tree_on_one_scheduler():
+    from deep_research import deep_research, SerpQueriesSchema, SerpQuery, SerpResultSchema
+
+    in_flight = 0
+    peak = 0
+    seen_stats = []
+
+    async def fake_generate_object(model, system, prompt, schema):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        seen_stats.append(scheduler_stats()["jobs"])
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        if schema is SerpQueriesSchema:
+            if "broken" in prompt:
+                raise RuntimeError("model unavailable")
+            tag = prompt.count("Follow-up")
+            return {"object": SerpQueriesSchema(queries=[
+                SerpQuery(query=f"q{tag}-{i}", researchGoal="goal") for i in range(4)
+            ])}
+        query = prompt.split("<query>")[1].split("</query>")[0] if "<query>" in prompt else "?"
+        return {"object": SerpResultSchema(learnings=[f"learned {query}"], followUpQuestions=["broken" if query == "q0-3" else "more"])}
+
+    scheduler = ResearchScheduler(search_workers=2, llm_workers=2)
+    with patch("deep_research.generate_object", new=fake_generate_object):
+        result = await deep_research("coral reefs", breadth=4, depth=2, learnings=["known"],
+                                     search_policy=SearchPolicy(), search_backend=FakeSearchBackend(),
+                                     scheduler=scheduler)
+
+    assert peak <= 2
+    assert all(jobs >= 1 for jobs in seen_stats)
+    assert scheduler not in active_schedulers
+    # The branch whose follow-up expansion failed still keeps its own learnings
+    assert result["learnings"][0] == "known"
+    assert "learned q0-3" in result["learnings"]
+    assert len(result["learnings"]) == len(set(result["learnings"]))
+    nodes = scheduler.stats()["nodes"]
+    assert nodes["failed"] == 1
+    # Root expansion, 4 searches, 4 follow-up expansions (one failed) and 3 x 2 follow-up searches
+    assert sum(nodes.values()) == 1 + 4 + 4 + 6
+
+@pytest.mark.asyncio
+async def test_fair_share_serves_a_small_user_ahead_of_a_large_backlog():
+    limiter = FairShareLimiter(limit=2)
+    order = []
+
+    async def call(user, i):
+        async with limiter.slot(user):
+            order.append(f"{user}{i}")
+            await asyncio.sleep(0.001)
+
+    big = [asyncio.create_task(call("a", i)) for i in range(8)]
+    await asyncio.sleep(0)
+    small = [asyncio.create_task(call("b", i)) for i in range(2)]
+    await asyncio.gather(*big, *small)
+    # "a" takes both free slots first, then "b" is served as soon as slots free up
+    assert order[:2] == ["a0", "a1"]
+    assert set(order[2:4]) == {"a2", "b0"} or set(order[2:4]) == {"b0", "b1"}
+    assert order.index("b1") < 6
+    assert limiter.stats()["in_use"] == 0
+
+@pytest.mark.asyncio
+async def test_weights_split_slots_between_busy_users():
+    limiter = FairShareLimiter(limit=4, weights=parse_weights("gold=3, free=1"))
+    release = asyncio.Event()
+
+    async def call(user):
+        async with limiter.slot(user):
+            await release.wait()
+
+    for _ in range(4):
+        await limiter.acquire("warmup")
+    tasks = [asyncio.create_task(call(user)) for _ in range(6) for user in ("free", "gold")]
+    await asyncio.sleep(0)
+    # Slots freed while both users wait are split 3:1
+    for _ in range(4):
+        limiter.release("warmup")
+    await asyncio.sleep(0)
+    assert limiter.stats()["in_use_by_user"] == {"gold": 3, "free": 1}
+    release.set()
+    await asyncio.gather(*tasks)
+    assert limiter.stats()["granted_by_user"] == {"warmup": 4, "gold": 6, "free": 6}
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_gives_up_its_place():
+    limiter = FairShareLimiter(limit=1)
+    await limiter.acquire("a")
+    waiter = asyncio.create_task(limiter.acquire("b"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    limiter.release("a")
+    assert limiter.stats()["in_use"] == 0
+    await asyncio.wait_for(limiter.acquire("c"), 1)
+
+@pytest.mark.asyncio
+async def test_jobs_share_one_budget():
+    budget = ResearchBudget(search=1, llm=1)
+    active = 0
+    peak = 0
+
+    async def step():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.001)
+        active -= 1
+
+    schedulers = [ResearchScheduler(search_workers=2, llm_workers=2, user_id=user, budget=budget) for user in ("a", "b")]
+    for scheduler in schedulers:
+        for _ in range(3):
+            scheduler.submit("search", step)
+    await asyncio.gather(*(scheduler.run() for scheduler in schedulers))
+    assert peak == 1
+    assert budget.stats()["search"]["granted_by_user"] == {"a": 3, "b": 3}
+
+@pytest.mark.asyncio
+async def test_final_report_waits_for_an_llm_budget_slot():
+    import api
+    budget = ResearchBudget(search=1, llm=1)
+    written = asyncio.Event()
+
+    async def fake_deep_research(**kwargs):
+        return {"learnings": ["a learning"], "visited_urls": []}
+
+    async def fake_write_final_report(**kwargs):
+        written.set()
+        return "report"
+
+    session = api.Session("coral reefs", 1, 1, user_id="a")
+    with patch("api.research_budget", new=budget), patch("api.deep_research", new=fake_deep_research), \
+            patch("api.write_final_report", new=fake_write_final_report):
+        # Another user's report holds the only LLM slot
+        await budget["llm"].acquire("b")
+        task = asyncio.create_task(session.start_research())
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert not written.is_set()
+        assert budget["llm"].stats()["waiting"] == {"a": 1}
+        budget["llm"].release("b")
+        await asyncio.wait_for(task, 1)
+    assert written.is_set()
+    assert session.status == "completed"
+    assert budget["llm"].stats()["granted_by_user"] == {"b": 1, "a": 1}
@@ -0,0 +1,42 @@
+from research_scheduler import ResearchScheduler
+from research_store import ResearchStore
+
+def test_learnings_are_stored_once_and_keep_first_ids():
+    store = ResearchStore()
+    first = store.add_learnings(["A", "B", "A"], node_id=1)
+    second = store.add_learnings(["C", "B"], node_id=2)
+    assert first == [0, 1]
+    assert second == [2, 1]
+    assert store.learnings == ["A", "B", "C"]
+    assert store.learning_nodes == [1, 1, 2]
+    assert store.get_learnings(second + first) == ["C", "B", "A"]
+    assert store.stats()["duplicate_learnings"] == 2
+
+def test_urls_are_indexed_incrementally():
+    store = ResearchStore()
+    ids = store.add_urls([
+        {"url": "https://a.example"},
+        {"metadata": {"sourceURL": "https://b.example"}},
+        {"title": "no url"},
+    ])
+    again = store.add_urls([{"url": "https://b.example", "title": "later copy"}])
+    assert ids == [0, 1]
+    assert again == [1]
+    assert store.has_url("https://b.example")
+    # The first item seen for a URL is the one kept
+    assert store.get_urls(again) == [{"metadata": {"sourceURL": "https://b.example"}}]
+
+def test_branch_knowledge_is_the_lineage():
+    scheduler = ResearchScheduler()
+    store = ResearchStore()
+    root = scheduler.add_node("expand", "topic", 2, 2)
+    root.learning_ids = store.add_learnings(["known"], root.id)
+    left = scheduler.add_node("search", "left", 2, 2, parent=root.id)
+    left.learning_ids = store.add_learnings(["left fact"], left.id)
+    right = scheduler.add_node("search", "right", 2, 2, parent=root.id)
+    right.learning_ids = store.add_learnings(["right fact"], right.id)
+    follow_up = scheduler.add_node("expand", "deeper", 1, 1, parent=left.id)
+
+    branch = [i for node in scheduler.lineage(follow_up.id) for i in node.learning_ids]
+    assert store.get_learnings(branch) == ["known", "left fact"]
+    assert [node.query for node in scheduler.walk(root.id)] == ["topic", "left", "deeper", "right"]
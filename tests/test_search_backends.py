@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from search_backends import (
+    FakeSearchBackend, FirecrawlBackend, RaceSearchBackend, SearchBackend, SearchResult, build_search_backend
+)
+
+def test_from_firecrawl_normalizes_item():
+    result = SearchResult.from_firecrawl({
+        "markdown": "Content",
+        "metadata": {"sourceURL": "https://example.com", "title": "Example"}
+    })
+    assert result.url == "https://example.com"
+    assert result.title == "Example"
+    assert result.markdown == "Content"
+    assert SearchResult.from_firecrawl({"markdown": "No url"}) is None
+
+@pytest.mark.asyncio
+@patch("search_backends.async_firecrawl_search", new_callable=AsyncMock)
+async def test_firecrawl_backend_returns_normalized_results(mock_search):
+    mock_search.return_value = {"success": True, "data": [
+        {"url": "https://example.com", "title": "Example", "markdown": "Content"},
+        {"title": "No url"},
+    ]}
+    results = await FirecrawlBackend().search("query", limit=2)
+    assert [r.url for r in results] == ["https://example.com"]
+
+@pytest.mark.asyncio
+async def test_fake_backend_is_deterministic():
+    backend = FakeSearchBackend(page_chars=500)
+    first = await backend.search("coral reefs", limit=3)
+    second = await backend.search("coral reefs", limit=3)
+    assert len(first) == 3
+    assert first == second
+    assert all(len(r.markdown) == 500 for r in first)
+    assert all(r.markdown == "" for r in await backend.search("coral reefs", limit=3, scrape=False))
+
+@pytest.mark.asyncio
+async def test_race_returns_first_good_answer():
+    slow = FakeSearchBackend(name="slow", latency=0.5)
+    fast = FakeSearchBackend(name="fast", latency=0.01)
+    race = RaceSearchBackend([slow, fast])
+
+    started = asyncio.get_running_loop().time()
+    results = await race.search("coral reefs", limit=2)
+
+    assert asyncio.get_running_loop().time() - started < 0.4
+    assert results[0].url.startswith("https://fast.local/")
+    assert race.stats()["wins"] == {"fast": 1}
+
+@pytest.mark.asyncio
+async def test_race_skips_failed_and_empty_backends():
+    broken = FakeSearchBackend(name="broken", fail=True)
+    empty = FakeSearchBackend(name="empty")
+    empty.add("coral reefs", [])
+    good = FakeSearchBackend(name="good", latency=0.05)
+    race = RaceSearchBackend([broken, empty, good])
+
+    results = await race.search("coral reefs", limit=2)
+    assert len(results) == 2
+    assert race.stats()["errors"] == {"broken": 1}
+
+def test_build_search_backend():
+    assert isinstance(build_search_backend("fake"), FakeSearchBackend)
+    race = build_search_backend("firecrawl, local")
+    assert isinstance(race, RaceSearchBackend)
+    assert [b.name for b in race.backends] == ["firecrawl", "local"]
+    with pytest.raises(ValueError):
+        build_search_backend("unknown")
+
+@pytest.mark.asyncio
+async def test_scrape_many_yields_in_completion_order():
+    backend = FakeSearchBackend()
+    backend.url_latency = {"https://a.example": 0.1, "https://b.example": 0.0}
+    hits = [SearchResult("https://a.example", "A"), SearchResult("https://b.example", "B")]
+    pages = [page async for page in backend.scrape_many(hits)]
+    assert [p.url for p in pages] == ["https://b.example", "https://a.example"]
+    assert pages[0].title == "B" and pages[0].markdown
+
+@pytest.mark.asyncio
+async def test_scrape_many_drops_stragglers():
+    backend = FakeSearchBackend(latency=0.01)
+    backend.url_latency = {"https://slow.example": 5.0}
+    hits = [SearchResult(f"https://fast{i}.example") for i in range(3)] + [SearchResult("https://slow.example")]
+
+    started = asyncio.get_running_loop().time()
+    pages = [page async for page in backend.scrape_many(hits, straggler_factor=2.0, straggler_grace=0.1)]
+
+    assert asyncio.get_running_loop().time() - started < 1.0
+    assert len(pages) == 3
+    assert backend.stats()["stragglers_dropped"] == 1
+
+def test_incomplete_backend_fails_when_built():
+    class SearchOnly(SearchBackend):
+        async def search(self, query, limit=5, timeout=15000, scrape=True):
+            return []
+
+    with pytest.raises(TypeError):
+        SearchOnly()
+
+def test_self_hosted_backend_keeps_its_own_quota_and_latency():
+    from ai.providers import firecrawl_latency, firecrawl_rate_limiter
+    hosted = FirecrawlBackend()
+    local = FirecrawlBackend(name="local", base_url="http://localhost:3002/v1", api_key="")
+    assert hosted.search_latency is firecrawl_latency
+    assert local.client.rate_limiter is not firecrawl_rate_limiter
+    assert local.client.rate_limiter.max_rate == 0
+    assert local.search_latency is local.client.latency
+    assert local.search_latency is not firecrawl_latency
+    # A race sizes timeouts from the first backend listed
+    assert RaceSearchBackend([hosted, local]).search_latency is firecrawl_latency
+    assert RaceSearchBackend([local, hosted]).search_latency is local.search_latency
+    assert FakeSearchBackend().search_latency is None
@@ -0,0 +1,29 @@
+from ai.latency import LatencyTracker
+from search_policy import SearchPolicy
+
+def test_defaults_to_full_search_at_root():
+    policy = SearchPolicy(root_depth=3)
+    assert policy.choose(3) == (5, 15000)
+
+def test_deep_low_yield_branches_search_less():
+    policy = SearchPolicy(root_depth=3)
+    policy.record(returned=20, new=2)
+    limit, _ = policy.choose(1)
+    assert limit == policy.min_limit
+
+def test_timeout_follows_observed_latency():
+    latency = LatencyTracker()
+    for ms in (2000, 2200, 2400, 2600, 3000):
+        latency.record(ms)
+    policy = SearchPolicy(root_depth=2, latency=latency)
+    _, timeout = policy.choose(2)
+    assert timeout == 5000
+    for _ in range(5):
+        latency.record(20000)
+    _, timeout = policy.choose(2)
+    assert timeout == 15000
+
+def test_overrides_win():
+    policy = SearchPolicy(root_depth=3, limit_override=8, timeout_override=30000)
+    policy.record(returned=20, new=0)
+    assert policy.choose(1) == (8, 30000)
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from ai.singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"data": [calls]}
+
+    results = await asyncio.gather(*(flights.do("query", fetch) for _ in range(5)))
+
+    assert calls == 1
+    assert all(r is results[0] for r in results)
+    assert flights.stats() == {"calls": 5, "coalesced": 4, "in_flight": 0}
+
+@pytest.mark.asyncio
+async def test_sequential_calls_are_not_cached():
+    flights = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await flights.do("query", fetch) == 1
+    assert await flights.do("query", fetch) == 2
+
+@pytest.mark.asyncio
+async def test_errors_propagate_to_every_caller():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(flights.do("query", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    flights = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    first = asyncio.ensure_future(flights.do("query", fetch))
+    second = asyncio.ensure_future(flights.do("query", fetch))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
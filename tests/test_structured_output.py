@@ -0,0 +1,93 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch, AsyncMock, MagicMock
+import openai
+from ai.ai import generate_object
+from ai.providers import ModelInfo, get_model
+from ai.structured import strict_json_schema
+from deep_research import SerpQueriesSchema, SerpResultSchema
+from conftest import chat_completion
+
+def test_strict_schema_requires_every_property():
+    schema = strict_json_schema(SerpQueriesSchema)
+    assert schema["additionalProperties"] is False
+    assert schema["required"] == ["queries"]
+    query = schema["$defs"]["SerpQuery"]
+    assert query["additionalProperties"] is False
+    assert sorted(query["required"]) == ["query", "researchGoal"]
+
+@pytest.mark.asyncio
+@patch("ai.providers.llm_cache", new=None)
+async def test_openai_requests_json_schema_output():
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(return_value=chat_completion(
+        '{\n  "learnings": ["Reefs are\\nbleaching"],\n  "followUpQuestions": []\n}'
+    ))
+    with patch("ai.providers.openai_client", new=client):
+        result = await generate_object(model=get_model(ModelInfo("gpt-4o")), prompt="Summarise", schema=SerpResultSchema)
+
+    response_format = client.chat.completions.create.call_args.kwargs["response_format"]
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["name"] == "SerpResultSchema"
+    assert response_format["json_schema"]["strict"] is True
+    # Pretty-printed JSON is parsed as is instead of being mangled by the newline cleanup
+    assert result["object"].learnings == ["Reefs are\nbleaching"]
+
+@pytest.mark.asyncio
+@patch("ai.providers.llm_cache", new=None)
+@patch("ai.providers._no_structured_output", new=set())
+async def test_openai_falls_back_when_schema_output_is_unsupported():
+    error = openai.BadRequestError(
+        "response_format json_schema is not supported with this model",
+        response=MagicMock(status_code=400), body=None
+    )
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=[error, chat_completion('{"learnings": [], "followUpQuestions": []}')])
+    with patch("ai.providers.openai_client", new=client):
+        await generate_object(model=get_model(ModelInfo("gpt-4o")), prompt="Summarise", schema=SerpResultSchema)
+
+    assert "response_format" not in client.chat.completions.create.call_args.kwargs
+
+@pytest.mark.asyncio
+@patch("ai.providers.llm_cache", new=None)
+async def test_anthropic_uses_forced_tool_call():
+    client = MagicMock()
+    client.messages.create = AsyncMock(return_value=SimpleNamespace(
+        id="msg-1", model="claude-3-5-sonnet-latest", stop_reason="tool_use",
+        usage=SimpleNamespace(input_tokens=10, output_tokens=5),
+        content=[SimpleNamespace(type="tool_use", input={"learnings": ["A"], "followUpQuestions": ["B"]})]
+    ))
+    with patch("ai.providers.anthropic_client", new=client):
+        result = await generate_object(model=get_model(ModelInfo("claude-3-5-sonnet-latest")),
+                                       prompt="Summarise", schema=SerpResultSchema)
+
+    kwargs = client.messages.create.call_args.kwargs
+    assert kwargs["tools"][0]["name"] == "SerpResultSchema"
+    assert kwargs["tool_choice"] == {"type": "tool", "name": "SerpResultSchema"}
+    assert result["object"] == SerpResultSchema(learnings=["A"], followUpQuestions=["B"])
+
+@pytest.mark.asyncio
+async def test_unparseable_answer_is_repaired_once():
+    prompts = []
+    answers = iter(['{"learnings": ["A"]', '{"learnings": ["A"], "followUpQuestions": []}'])
+
+    async def model(prompt, **kwargs):
+        prompts.append(prompt)
+        return {"choices": [{"message": {"content": next(answers)}}]}
+
+    result = await generate_object(model=model, prompt="Summarise", schema=SerpResultSchema)
+    assert result["object"].learnings == ["A"]
+    assert len(prompts) == 2
+    assert '{"learnings": ["A"]' in prompts[1]
+
+@pytest.mark.asyncio
+async def test_repair_is_bounded():
+    calls = []
+
+    async def model(prompt, **kwargs):
+        calls.append(prompt)
+        return {"choices": [{"message": {"content": '{"unexpected": true}'}}]}
+
+    with pytest.raises(ValueError):
+        await generate_object(model=model, prompt="Summarise", schema=SerpResultSchema)
+    assert len(calls) == 2
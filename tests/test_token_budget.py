@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import patch, AsyncMock
+from ai.providers import ModelInfo, model_context_size
+from token_budget import PAGE_WRAPPER_TOKENS, content_budget, output_reserve, split_budget
+
+def test_model_context_size_uses_longest_prefix():
+    assert model_context_size("gpt-4o-mini") == 128000
+    assert model_context_size("gpt-4-0613") == 8192
+    assert model_context_size("some-local-model") == model_context_size("another-local-model")
+
+def test_content_budget_leaves_room_for_output_and_overhead():
+    small = ModelInfo("gpt-4o", context_size=8000)
+    assert output_reserve(small) == 2000
+    assert content_budget(small, cap=0) == 6000
+    assert content_budget(small, "word " * 100, cap=0) < 6000
+    assert content_budget(ModelInfo("gpt-4o"), cap=1000) == 1000
+    assert output_reserve(ModelInfo("gpt-4o", {"max_tokens": 500})) == 500
+
+def test_split_budget_follows_relevance():
+    budgets = split_budget(10000, [3.0, 1.0], [25000, 25000])
+    assert budgets[0] > budgets[1] > 0
+    assert sum(budgets) <= 10000 - 2 * PAGE_WRAPPER_TOKENS
+
+def test_split_budget_gives_short_pages_only_what_they_need():
+    budgets = split_budget(10000, [1.0, 1.0, 1.0], [500, 25000, 25000])
+    assert budgets[0] == 500
+    assert budgets[1] == budgets[2] > 4000
+
+def test_split_budget_drops_least_relevant_page_when_tight():
+    budgets = split_budget(700, [2.0, 0.5, 1.0], [5000, 5000, 5000], min_tokens=300)
+    assert budgets[1] == 0
+    assert all(b >= 300 for b in budgets if b)
+    assert split_budget(100, [0.0], [5000]) == [100 - PAGE_WRAPPER_TOKENS]
+
+@pytest.mark.asyncio
+@patch("deep_research.generate_object", new_callable=AsyncMock)
+async def test_process_serp_result_sizes_pages_to_the_model(mock_generate_object):
+    from deep_research import process_serp_result, SerpResultSchema
+
+    mock_generate_object.return_value = {
+        "object": SerpResultSchema(learnings=[], followUpQuestions=[]),
+        "raw": {}
+    }
+    result = {"data": [
+        {"url": "https://a.example", "title": "Celebrity gossip", "markdown": "gossip " * 20000},
+        {"url": "https://b.example", "title": "Coral bleaching", "markdown": "coral " * 20000},
+    ]}
+    model_info = ModelInfo("gpt-4o", context_size=12000)
+    await process_serp_result("coral bleaching", result, model_info=model_info, research_goal="coral reefs")
+
+    prompt = mock_generate_object.await_args.kwargs["prompt"]
+    assert 0 < prompt.count("gossip") < prompt.count("coral")
+    assert len(prompt) < 12000 * 4
@@ -0,0 +1,45 @@
+from unittest.mock import patch
+from ai.providers import tokenizer, trim_prompt
+
+def _page(paragraphs: int) -> str:
+    return "\n\n".join(f"Paragraph {i} reports that revenue grew {i} percent in the quarter." for i in range(paragraphs))
+
+def test_prompt_within_budget_is_unchanged():
+    text = _page(5)
+    assert trim_prompt(text, 10000) == text
+    assert trim_prompt("", 100) == ""
+
+def test_trim_stays_within_budget():
+    text = _page(2000)
+    for budget in (50, 999, 5000):
+        trimmed = trim_prompt(text, budget, snap=False)
+        assert text.startswith(trimmed)
+        assert len(tokenizer.encode(trimmed)) <= budget
+        assert len(tokenizer.encode(trimmed)) >= budget - 2
+
+def test_trim_snaps_to_paragraph_break():
+    text = _page(2000)
+    trimmed = trim_prompt(text, 3000)
+    assert text.startswith(trimmed)
+    assert trimmed.endswith("quarter.")
+    assert len(tokenizer.encode(trimmed)) <= 3000
+
+def test_long_page_is_tokenized_once_and_only_its_head():
+    text = _page(20000)
+    calls = []
+    real_encode = tokenizer.encode
+
+    def encode(value, **kwargs):
+        calls.append(len(value))
+        return real_encode(value, **kwargs)
+
+    with patch.object(tokenizer, "encode", side_effect=encode):
+        trimmed = trim_prompt(text, 1000, snap=False)
+    assert len(calls) == 1
+    assert calls[0] < len(text)
+    assert trimmed == tokenizer.decode(real_encode(text, disallowed_special=())[:1000])
+
+def test_special_token_text_is_treated_as_plain_text():
+    text = "<|endoftext|> " * 5000
+    trimmed = trim_prompt(text, 100)
+    assert len(tokenizer.encode(trimmed, disallowed_special=())) <= 100